@@ -6,10 +6,14 @@ import sys, argparse, os
 import json
 
 from src import database
+from src import migrations
 from src import telegram
 from src import discord
 from src import util
+from src.rpc import SmartCashRPC, RPCPool
 from src.smartnodes import SmartNodeList
+from src.zmqnotify import BlockNotifier
+from src.metrics import MetricsServer
 
 __version__ = "1.1.1"
 
@@ -66,18 +70,66 @@ def main(argv):
         logging.basicConfig(format='monitor_{} %(name)s - %(levelname)s - %(message)s'.format(config.get('bot', 'app')),
                         level=level*10)
 
-    # Load the user database
-    botdb = database.BotDatabase(directory + '/bot.db')
+    try:
+        # Load the user database
+        botdb = database.BotDatabase(directory + '/bot.db')
 
-    # Load the smartnodes database
-    nodedb = database.NodeDatabase(directory + '/nodes.db')
+        # Load the smartnodes database
+        nodedb = database.NodeDatabase(directory + '/nodes.db')
+    except migrations.MigrationError as e:
+        sys.exit("Database error {}".format(e))
 
     admin = config.get('general','admin')
     password = config.get('general','password')
     githubUser = config.get('general','githubuser')
     githubPassword = config.get('general','githubpassword')
 
-    nodeList = SmartNodeList(nodedb)
+    # Optional JSON-RPC connection to the daemon. Without it every
+    # daemon call runs through the smartcash-cli.
+    rpc = None
+
+    if config.has_section('rpc') and config.get('rpc', 'user', fallback = ''):
+
+        user = config.get('rpc', 'user')
+        rpcPassword = config.get('rpc', 'password', fallback = '')
+        timeout = config.getint('rpc', 'timeout', fallback = 30)
+
+        rpc = SmartCashRPC(config.get('rpc', 'host', fallback = '127.0.0.1'),
+                           config.getint('rpc', 'port', fallback = 9679),
+                           user, rpcPassword, timeout)
+
+        # Additional daemons as [user:password@]host:port list
+        endpoints = list(filter(None, map(str.strip, config.get('rpc', 'endpoints', fallback = '').split(','))))
+
+        if len(endpoints):
+
+            clients = [rpc]
+
+            for endpoint in endpoints:
+
+                credentials, address = endpoint.rsplit('@', 1) if '@' in endpoint else (None, endpoint)
+                host, port = address.rsplit(':', 1)
+                endpointUser, endpointPassword = credentials.split(':', 1) if credentials else (user, rpcPassword)
+
+                clients.append(SmartCashRPC(host, int(port), endpointUser, endpointPassword, timeout))
+
+            rpc = RPCPool(clients, maxLag = config.getint('rpc', 'max_lag', fallback = 2))
+
+    nodeList = SmartNodeList(nodedb, rpc)
+
+    # Optional block notifications of the daemon to trigger the
+    # updates of the nodelist instantly.
+    if config.has_section('zmq') and config.get('zmq', 'hashblock', fallback = ''):
+        notifier = BlockNotifier(config.get('zmq', 'hashblock'), nodeList.trigger)
+        notifier.start()
+
+    # Optional endpoint for prometheus to scrape the metrics
+    # of the update cycles.
+    if config.has_section('metrics') and config.get('metrics', 'port', fallback = ''):
+        metricsServer = MetricsServer(nodeList.metricsText,
+                                      config.get('metrics', 'host', fallback = '127.0.0.1'),
+                                      config.getint('metrics', 'port'))
+        metricsServer.start()
 
     nodeBot = None
 
@@ -88,8 +140,14 @@ def main(argv):
     else:
         sys.exit("You need to set 'telegram' or 'discord' as 'app' in the configfile.")
 
+    # Start the nodelist updates once the callbacks are set
+    nodeList.start()
+
     # Start and run forever!
     nodeBot.start()
 
+    # Write the queued node changes before the exit
+    nodeList.stop()
+
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+
+#####
+#
+# Benchmark of the SmartNodeList update cycle on synthetic networks.
+#
+# For each network size a synthetic archive gets created with
+# misc/daemon_replay/synthetic.py and served by replay.py in step mode,
+# one frame per update cycle. Each size runs in its own process to get
+# a clean peak RSS. The phases of the cycle get timed by wrapping the
+# methods of the SmartNodeList:
+#
+#   load              SmartNodeList.load of the filled database
+#   cycle             updateList, inclusive all phases below
+#   refresh / probe   Full refresh and lastseen/status probe
+#   fetch             Time spent in receiving/parsing the nodelist
+#   resolve           Collateral height lookups
+#   db                Database writes
+#   timeouts          Timeout pass
+#   positions         calculatePositions
+#   upgrade_duration  calculateUpgradeModeDuration
+#   snapshot          createSnapshot
+#   callbacks         Node change and network callbacks
+#   queue_build       PayoutQueue of all enabled nodes from scratch
+#   positions_full    calculatePositions with all rows changed
+#
+# Usage: ./benchmark.py [--sizes 1000 10000 100000] [--cycles 10]
+#                       [--churn 0.001] [--allocations] [--out result.json]
+#
+# Compare two results with ./compare.py base.json new.json
+#
+#####
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import resource
+import platform
+import argparse
+import logging
+import tempfile
+import subprocess
+import tracemalloc
+
+directory = os.path.dirname(os.path.realpath(__file__))
+root = os.path.join(directory, '..', '..')
+replayDirectory = os.path.join(directory, '..', 'daemon_replay')
+
+sys.path.insert(0, root)
+
+####
+# Accumulates the wall time and optionally the allocations per phase.
+###
+class Phases(object):
+
+    def __init__(self, allocations = False):
+        self.allocations = allocations
+        self.phases = {}
+        # [traced memory at the start, peak] of the running measurements
+        self.stack = []
+
+    def add(self, name, seconds, allocated = 0, peak = 0):
+
+        if name not in self.phases:
+            self.phases[name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'allocated': 0, 'peak': 0}
+
+        entry = self.phases[name]
+        entry['calls'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['allocated'] += allocated
+        entry['peak'] = max(entry['peak'], peak)
+
+    def measure(self, name, function, *args, **kwargs):
+
+        if self.allocations:
+
+            current, peak = tracemalloc.get_traced_memory()
+
+            # The reset below would hide the peak from the outer measurements
+            for frame in self.stack:
+                frame[1] = max(frame[1], peak)
+
+            tracemalloc.reset_peak()
+            self.stack.append([current, current])
+
+        start = time.perf_counter()
+
+        try:
+            return function(*args, **kwargs)
+        finally:
+
+            seconds = time.perf_counter() - start
+
+            if self.allocations:
+
+                current, peak = tracemalloc.get_traced_memory()
+                before, framePeak = self.stack.pop()
+                peak = max(peak, framePeak)
+
+                for frame in self.stack:
+                    frame[1] = max(frame[1], peak)
+
+                self.add(name, seconds, max(0, current - before), max(0, peak - before))
+            else:
+                self.add(name, seconds)
+
+    ######
+    # Replace the method :method of :obj with a timed version.
+    ######
+    def wrap(self, obj, method, name):
+
+        original = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            return self.measure(name, original, *args, **kwargs)
+
+        setattr(obj, method, timed)
+
+    ######
+    # Same for a generator method, only the time inside the generator
+    # counts. No allocations, they end up in the consuming phase.
+    ######
+    def wrapGenerator(self, obj, method, name):
+
+        original = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+
+            generator = original(*args, **kwargs)
+            total = 0.0
+            start = time.perf_counter()
+
+            try:
+
+                for item in generator:
+                    total += time.perf_counter() - start
+                    yield item
+                    start = time.perf_counter()
+
+                total += time.perf_counter() - start
+
+            finally:
+                self.add(name, total)
+
+        setattr(obj, method, timed)
+
+    def result(self):
+
+        result = {}
+
+        for name, entry in self.phases.items():
+            result[name] = dict(entry)
+            result[name]['mean'] = entry['total'] / entry['calls'] if entry['calls'] else 0.0
+
+        return result
+
+def freePort():
+
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+
+    return port
+
+def gitCommit():
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def startReplay(archive, port):
+
+    process = subprocess.Popen([sys.executable, os.path.join(replayDirectory, 'replay.py'), archive,
+                                '--port', str(port), '--step'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Wait for the server
+    for i in range(100):
+
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("Replay did not start")
+
+def instrument(nodeList, phases):
+
+    phases.wrap(nodeList, 'updateList', 'cycle')
+    phases.wrap(nodeList, 'refreshList', 'refresh')
+    phases.wrap(nodeList, 'probeList', 'probe')
+    phases.wrapGenerator(nodeList, 'requestStream', 'fetch')
+    phases.wrap(nodeList.collaterals, 'resolve', 'resolve')
+    phases.wrap(nodeList, 'checkTimeouts', 'timeouts')
+    phases.wrap(nodeList, 'calculatePositions', 'positions')
+    phases.wrap(nodeList, 'calculateUpgradeModeDuration', 'upgrade_duration')
+    phases.wrap(nodeList, 'createSnapshot', 'snapshot')
+
+    phases.wrap(nodeList.db, 'writeBatch', 'db')
+
+    counters = {'changed': 0, 'network': 0}
+
+    def nodeChange(update, node):
+        counters['changed'] += 1
+
+    def network(collaterals, added):
+        counters['network'] += len(collaterals)
+
+    nodeList.nodeChangeCB = lambda *args: phases.measure('callbacks', nodeChange, *args)
+    nodeList.networkCB = lambda *args: phases.measure('callbacks', network, *args)
+
+    return counters
+
+######
+# Run the benchmark of one network size, meant to run in its own process.
+######
+def worker(args):
+
+    # Keep the log of the bot out of the measurements
+    logging.basicConfig(level=logging.ERROR)
+
+    from src import database
+    from src.rpc import SmartCashRPC
+    # The scheduler and the writer never get started, the benchmark runs
+    # the cycles and the database writes happen inside of them
+    from src.smartnodes import SmartNodeList, PayoutQueue
+
+    workDirectory = tempfile.mkdtemp(prefix='smartnode_benchmark_')
+    archive = os.path.join(workDirectory, 'network.jsonl.gz')
+
+    start = time.perf_counter()
+
+    subprocess.check_call([sys.executable, os.path.join(replayDirectory, 'synthetic.py'),
+                           '--out', archive,
+                           '--nodes', str(args.nodes),
+                           '--cycles', str(args.cycles + 1),
+                           '--churn', str(args.churn),
+                           '--outage', str(args.outage),
+                           '--seed', str(args.seed),
+                           '--start-time', str(int(time.time()) - (args.cycles + 1) * 30)],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    generateSeconds = time.perf_counter() - start
+
+    port = freePort()
+    replay = startReplay(archive, port)
+
+    if args.allocations:
+        tracemalloc.start()
+
+    phases = Phases(args.allocations)
+
+    try:
+
+        rpc = SmartCashRPC('127.0.0.1', port, 'benchmark', 'benchmark', timeout = 600)
+
+        # Initial cycle fills the database
+        dbPath = os.path.join(workDirectory, 'nodes.db')
+        nodeList = SmartNodeList(database.NodeDatabase(dbPath), rpc)
+
+        initial = Phases()
+        instrument(nodeList, initial)
+        nodeList.updateList()
+
+        # Load of the filled database
+        nodeList = phases.measure('load', SmartNodeList, database.NodeDatabase(dbPath), rpc)
+        counters = instrument(nodeList, phases)
+
+        for cycle in range(args.cycles):
+            nodeList.updateList()
+
+        #####
+        ## Isolated benchmarks of the calculations
+        #####
+
+        enabled = list(filter(lambda x: x.status == 'ENABLED', nodeList.nodeList.values()))
+
+        def buildQueue():
+
+            queue = PayoutQueue()
+
+            for node in enabled:
+                queue.update(node.collateral, node.lastPaidBlock)
+
+            return queue
+
+        def fullPositions():
+
+            # Forget the last results to recalculate all rows
+            nodeList.columns.state[:len(nodeList.columns)] = -2
+            nodeList.payoutQueue.entries = []
+            nodeList.payoutQueue.members = {}
+
+            for node in nodeList.nodeList.values():
+                node.queue = None
+
+            nodeList.calculatePositions(nodeList.protocolRequirement(),
+                                        nodeList.enabledWithMinProtocol(),
+                                        nodeList.minimumUptime())
+
+        for i in range(args.repeat):
+            phases.measure('queue_build', buildQueue)
+            phases.measure('positions_full', fullPositions)
+            phases.measure('upgrade_duration_direct', nodeList.calculateUpgradeModeDuration,
+                           nodeList.protocolRequirement(),
+                           nodeList.enabledWithMinProtocol(),
+                           nodeList.minimumUptime())
+
+        rpc.close()
+
+    finally:
+        replay.kill()
+        replay.wait()
+        shutil.rmtree(workDirectory, ignore_errors = True)
+
+    if args.allocations:
+        tracemalloc.stop()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return {'nodes': args.nodes,
+            'final_nodes': len(nodeList.nodeList),
+            'cycles': args.cycles,
+            'churn': args.churn,
+            'outage': args.outage,
+            'allocations': args.allocations,
+            'generate_seconds': generateSeconds,
+            'initial_cycle': initial.result().get('cycle'),
+            'initial_db': initial.result().get('db'),
+            'changed_callbacks': counters['changed'],
+            'network_callbacks': counters['network'],
+            # kilobytes on linux
+            'peak_rss_kb': usage.ru_maxrss,
+            'phases': phases.result()}
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Benchmark the SmartNodeList update cycle.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--cycles', type=int, default=10, help="Update cycles per size.")
+    parser.add_argument('--churn', type=float, default=0.001, help="Fraction of replaced nodes per cycle.")
+    parser.add_argument('--outage', type=float, default=0.0005, help="Fraction of nodes going offline per cycle.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of the isolated calculations.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--allocations', action='store_true', help="Trace the allocations, slows down the timings.")
+    parser.add_argument('--out', help="Write the json results to this file.")
+    # Internal, runs a single size
+    parser.add_argument('--nodes', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.nodes:
+        json.dump(worker(args), sys.stdout)
+        return 0
+
+    results = []
+
+    for size in args.sizes:
+
+        command = [sys.executable, os.path.realpath(__file__),
+                   '--nodes', str(size),
+                   '--cycles', str(args.cycles),
+                   '--churn', str(args.churn),
+                   '--outage', str(args.outage),
+                   '--repeat', str(args.repeat),
+                   '--seed', str(args.seed)]
+
+        if args.allocations:
+            command.append('--allocations')
+
+        print("Run {} nodes...".format(size), file=sys.stderr)
+
+        output = subprocess.check_output(command)
+        result = json.loads(output.decode('utf-8'))
+        results.append(result)
+
+        print("  peak RSS {:.1f} MB".format(result['peak_rss_kb'] / 1024), file=sys.stderr)
+
+        for name, phase in sorted(result['phases'].items()):
+            print("  {:<24} {:>5} calls {:>10.4f}s mean {:>10.4f}s max".format(name, phase['calls'], phase['mean'], phase['max']), file=sys.stderr)
+
+    report = {'commit': gitCommit(),
+              'created': int(time.time()),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': results}
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
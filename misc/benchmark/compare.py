@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+#####
+#
+# Compares two results of benchmark.py phase by phase.
+#
+# Usage: ./compare.py base.json new.json [--metric mean|max|total|allocated|peak]
+#
+#####
+
+import sys
+import json
+import argparse
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Compare two benchmark results.")
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--metric', default='mean', choices=['mean', 'max', 'total', 'allocated', 'peak'])
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print("{} ({}) => {} ({}), {}".format(args.base, base.get('commit'), args.new, new.get('commit'), args.metric))
+
+    baseResults = {x['nodes']: x for x in base['results']}
+
+    for result in new['results']:
+
+        nodes = result['nodes']
+
+        if nodes not in baseResults:
+            continue
+
+        previous = baseResults[nodes]
+
+        print("\n{} nodes, peak RSS {:.1f} MB => {:.1f} MB".format(nodes, previous['peak_rss_kb'] / 1024, result['peak_rss_kb'] / 1024))
+
+        for name in sorted(set(previous['phases']) | set(result['phases'])):
+
+            before = previous['phases'].get(name, {}).get(args.metric)
+            after = result['phases'].get(name, {}).get(args.metric)
+
+            if before == None or after == None:
+                print("  {:<24} {:>12} => {:>12}".format(name, str(before), str(after)))
+                continue
+
+            change = (after / before - 1) * 100 if before else 0.0
+
+            print("  {:<24} {:>12.5g} => {:>12.5g} {:>+8.1f}%".format(name, before, after, change))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
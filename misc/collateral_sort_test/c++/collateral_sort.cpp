@@ -4,7 +4,9 @@
 // file COPYING or http://www.opensource.org/licenses/mit-license.php.
 
 #include "transaction.h"
+#include <algorithm>
 #include <iostream>
+#include <string>
 #include <vector>
 
 using namespace std;
@@ -18,7 +20,34 @@ struct CompareLastPaidBlock
     }
 };
 
-int main(){
+// Read "lastPaidBlock hash n" lines from stdin and print them in the
+// order of the daemon's last paid vector. Used by the python harness.
+int sortInput(){
+
+    std::vector<std::pair<int, COutPoint*> > vec;
+    int lastPaid;
+    std::string hash;
+    unsigned int n;
+
+    while( cin >> lastPaid >> hash >> n ){
+        vec.push_back(std::make_pair(lastPaid, new COutPoint(uint256S(hash),n)));
+    }
+
+    sort(vec.begin(), vec.end(), CompareLastPaidBlock());
+
+    for( auto entry : vec ){
+        cout << entry.first << " " << entry.second->ToString() << "\n";
+        delete entry.second;
+    }
+
+    return 0;
+}
+
+int main(int argc, char *argv[]){
+
+    if( argc > 1 && std::string(argv[1]) == "-" ){
+        return sortInput();
+    }
 
     cout << "Start memcmp test" << endl;
 
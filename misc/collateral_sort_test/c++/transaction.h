@@ -30,7 +30,6 @@ public:
     friend bool operator<(const COutPoint& a, const COutPoint& b)
     {
         int cmp = a.hash.Compare(b.hash);
-        std::cout << cmp << std::endl;
         return cmp < 0 || (cmp == 0 && a.n < b.n);
     }
 
@@ -13,21 +13,7 @@
 #include <string>
 #include <vector>
 #include "crypto/common.h"
-#include <iostream>
-
-static int mm(uint8_t * str1, uint8_t * str2, size_t count)
-{
-   const unsigned char *s1 = (const unsigned char*)str1;
-   const unsigned char *s2 = (const unsigned char*)str2;
-  std::cout << std::endl << "mm ";
-  while (count-- > 0)
-    {
-      std::cout << std::to_string(*s1) << " " << std::to_string(*s2) << std::endl;
-      if (*s1++ != *s2++)
-      return s1[-1] < s2[-1] ? -1 : 1;
-    }
-  return 0;
-}
+#include <cstring>
 
 /** Template base class for fixed-sized opaque blobs. */
 template<unsigned int BITS>
@@ -57,7 +43,7 @@ public:
         memset(data, 0, sizeof(data));
     }
 
-    inline int Compare(const base_blob& other) const { return mm((uint8_t*)data, (uint8_t*)other.data, sizeof(data)); }
+    inline int Compare(const base_blob& other) const { return memcmp(data, other.data, sizeof(data)); }
 
     friend inline bool operator==(const base_blob& a, const base_blob& b) { return a.Compare(b) == 0; }
     friend inline bool operator!=(const base_blob& a, const base_blob& b) { return a.Compare(b) != 0; }
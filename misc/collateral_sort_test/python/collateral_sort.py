@@ -1,86 +1,59 @@
-import os, stat
-import re
-import subprocess
-import json
+#!/usr/bin/env python3
+
+#####
+#
+# Verifies that the precomputed Transaction.key reproduces the order of
+# the daemon's last paid vector and benchmarks it against the former
+# memcmp based Transaction.__lt__.
+#
+# The reference order comes from ../c++/collateral_sort which gets built
+# with make if it does not exist yet.
+#
+# Usage: ./collateral_sort.py [--count 100000] [--seed 1] [--reference path]
+#
+#####
+
+import os
+import sys
 import time
-import csv
-import logging
-import threading
-import re
+import random
+import argparse
+import subprocess
+
+directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(directory, '..', '..', '..'))
 
-transactionRawCheck = re.compile("COutPoint\([\d\a-f]{64},.[\d]{1,}\)")
-transactionStringCheck = re.compile("[\d\a-f]{64}-[\d]{1,}")
+from src.smartnodes import Transaction
 
 def memcmp ( str1, str2, count):
 
     while count > 0:
         count -= 1
 
-        print( str(str1[count]) + " " + str(str2[count]))
-
         if str1[count] != str2[count]:
             return -1 if str1[count] < str2[count] else 1
 
     return 0
 
-class Transaction(object):
+####
+# The comparison as it was used before the precomputed keys.
+###
+class LegacyTransaction(object):
 
     def __init__(self, txhash, txindex):
         self.hash = txhash
         self.index = txindex
 
-    def __str__(self):
-        return '{0.hash}-{0.index}'.format(self)
-
-    def __eq__(self, other):
-        return self.hash == other.hash and\
-                self.index == other.index
-
     def __lt__(self, other):
-        # friend bool operator<(const CTxIn& a, const CTxIn& b)
-        # {
-        #     return a.prevout<b.prevout;
-        # }
-        # friend bool operator<(const COutPoint& a, const COutPoint& b)
-        # {
-        #     int cmp = a.hash.Compare(b.hash);
-        #     return cmp < 0 || (cmp == 0 && a.n < b.n);
-        # }
-        # https://github.com/SmartCash/smartcash/blob/1.1.1/src/uint256.h#L45
-        # https://github.com/SmartCash/smartcash/blob/1.1.1/src/primitives/transaction.h#L38
-        # https://github.com/SmartCash/smartcash/blob/1.1.1/src/primitives/transaction.h#L126
         compare = memcmp(bytes.fromhex(self.hash), bytes.fromhex(other.hash),len(bytes.fromhex(self.hash)))
-        print(compare)
         return compare < 0 or ( compare == 0 and self.index < other.index )
-        #return self.hash < other.hash or ( self.hash == other.hash and self.index < other.index )
-
-
-    def __hash__(self):
-        return hash((self.hash,self.index))
-
-    @classmethod
-    def fromRaw(cls, s):
-
-        if transactionRawCheck.match(s):
-            parts = s[10:-1].split(', ')
-            return cls(parts[0], int(parts[1]))
-
-    @classmethod
-    def fromString(cls, s):
-
-        if transactionStringCheck.match(s):
-            parts = s.split('-')
-            return cls(parts[0], int(parts[1]))
 
-class LastPaid(object):
+class LegacyLastPaid(object):
 
     def __init__(self, lastPaidBlock, transaction):
         self.transaction = transaction
         self.lastPaidBlock = lastPaidBlock
 
-    def __str__(self):
-        return '[{0.lastPaidBlock}] {0.transaction}'.format(self)
-
     def __lt__(self, other):
 
         if self.lastPaidBlock != other.lastPaidBlock:
@@ -88,25 +61,138 @@ class LastPaid(object):
 
         return self.transaction < other.transaction
 
-tx1 = Transaction.fromString("7c4389865729c03e9228a2bade8ae96d305d1b8b16b65207f227fd17c890d52e-0")
-tx2 = Transaction.fromString("1f44671c77aee69cacbb166bd879eaf921c1c04f04ef91c1580e173d7f829ebe-1")
-tx3 = Transaction.fromString("fbaef56dd2306b15ed8f69dae0e0ddc815551c2d6f3477d4dba7260ecce865c0-1")
-tx4 = Transaction.fromString("7c4389865729c03e9228a2bade8ae96d305d1b8b16b65207f227fd17c890d52e-1")
+######
+# Create :count random (lastPaidBlock, hash, index) entries. Some hashes
+# share long prefixes/suffixes and indexes to hit all branches of the
+# comparison.
+######
+def generate(count, seed):
+
+    rnd = random.Random(seed)
+    entries = []
+    hashes = []
+
+    for i in range(count):
+
+        choice = rnd.random()
+
+        if len(hashes) and choice < 0.1:
+            # Same transaction, other output
+            txhash = rnd.choice(hashes)
+        elif len(hashes) and choice < 0.3:
+            # Only one byte differs
+            raw = bytearray.fromhex(rnd.choice(hashes))
+            raw[rnd.randrange(32)] = rnd.randrange(256)
+            txhash = raw.hex()
+        else:
+            txhash = '{:064x}'.format(rnd.getrandbits(256))
+
+        hashes.append(txhash)
+        entries.append((rnd.randint(0, count // 10), txhash, rnd.randint(0, 9)))
+
+    # Outpoints are unique in the nodelist
+    entries = sorted(set(entries))
+    rnd.shuffle(entries)
+
+    return entries
+
+def referenceBinary(path):
+
+    if path:
+        return path
+
+    cppDirectory = os.path.join(directory, '..', 'c++')
+    binary = os.path.join(cppDirectory, 'collateral_sort')
+
+    if not os.path.exists(binary):
+
+        try:
+            subprocess.check_call(['make', '-s', '-C', cppDirectory])
+        except (OSError, subprocess.CalledProcessError) as e:
+            print("Could not build the c++ reference: {}".format(e))
+            return None
+
+    return binary
+
+def referenceOrder(binary, entries):
+
+    data = "".join(map(lambda x: "{} {} {}\n".format(*x), entries))
+    result = subprocess.check_output([binary, '-'], input=data.encode('utf-8'))
+
+    order = []
+
+    for line in result.decode('utf-8').splitlines():
+        lastPaid, outpoint = line.split()
+        txhash, index = outpoint.split('-')
+        order.append((int(lastPaid), txhash, int(index)))
+
+    return order
+
+def keyOrder(entries):
+
+    transactions = list(map(lambda x: (x[0], Transaction(x[1], x[2], -1)), entries))
+
+    start = time.perf_counter()
+    transactions.sort(key=lambda x: (x[0], x[1].key))
+    seconds = time.perf_counter() - start
+
+    return list(map(lambda x: (x[0], x[1].hash, x[1].index), transactions)), seconds
+
+def legacyOrder(entries):
+
+    vec = list(map(lambda x: LegacyLastPaid(x[0], LegacyTransaction(x[1], x[2])), entries))
+
+    start = time.perf_counter()
+    vec.sort()
+    seconds = time.perf_counter() - start
+
+    return list(map(lambda x: (x.lastPaidBlock, x.transaction.hash, x.transaction.index), vec)), seconds
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Verify and benchmark the collateral sort key.")
+    parser.add_argument('--count', type=int, default=100000, help="Number of random outpoints.")
+    parser.add_argument('--legacy-count', type=int, default=20000, help="Number of outpoints for the legacy comparison.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reference', help="Path to the built c++ reference.")
+    args = parser.parse_args(argv)
+
+    failed = False
+
+    entries = generate(args.count, args.seed)
+
+    keySorted, keySeconds = keyOrder(entries)
+
+    binary = referenceBinary(args.reference)
+
+    if binary:
+
+        reference = referenceOrder(binary, entries)
+
+        if reference == keySorted:
+            print("C++ reference: OK ({} outpoints)".format(len(entries)))
+        else:
+            failed = True
+            mismatch = next((i for i, (a, b) in enumerate(zip(reference, keySorted)) if a != b), min(len(reference), len(keySorted)) - 1)
+            print("C++ reference: FAILED at {} - {} != {}".format(mismatch, reference[mismatch], keySorted[mismatch]))
 
-lastPaidVec = []
-lastPaidVec.append(LastPaid(1, tx1))
-lastPaidVec.append(LastPaid(1, tx2))
-lastPaidVec.append(LastPaid(1, tx3))
-lastPaidVec.append(LastPaid(1, tx4))
+    legacyEntries = entries[:args.legacy_count]
 
-print("\nUnsorted\n")
+    legacySorted, legacySeconds = legacyOrder(legacyEntries)
+    keyLegacySorted, keyLegacySeconds = keyOrder(legacyEntries)
 
-for l in lastPaidVec:
-    print(str(l))
+    if legacySorted == keyLegacySorted:
+        print("Legacy __lt__: OK ({} outpoints)".format(len(legacyEntries)))
+    else:
+        failed = True
+        print("Legacy __lt__: FAILED")
 
-print("\nSorted\n")
+    print("\nSort of {} outpoints".format(len(legacyEntries)))
+    print("  __lt__ {:.4f}s".format(legacySeconds))
+    print("  key    {:.4f}s ({:.1f}x)".format(keyLegacySeconds, legacySeconds / keyLegacySeconds if keyLegacySeconds else 0))
+    print("Sort of {} outpoints with the key {:.4f}s".format(len(entries), keySeconds))
 
-lastPaidVec.sort()
+    return 1 if failed else 0
 
-for l in lastPaidVec:
-    print(str(l))
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
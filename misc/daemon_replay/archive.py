@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+#####
+#
+# Archive format of the recorded/synthetic daemon responses.
+#
+# Gzipped json lines:
+#
+#   {"type": "header", "version": 1, "source": ..., "created": ...}
+#   {"type": "frame", "time": ..., "sync": {...}, "info": {...},
+#    "nodes": {"set": {key: line}, "remove": [key]}}
+#   {"type": "static", "method": ..., "params": [...], "result": ...}
+#
+# One frame per captured update cycle. "nodes" is the delta of the
+# "smartnodelist full" result to the previous frame, the first frame sets
+# all nodes. The lastseen/status views get derived from it in the replay.
+# The static entries (getrawtransaction/getblock) never change and follow
+# the frame which introduced the collateral.
+#
+#####
+
+import gzip
+import json
+import time
+
+VERSION = 1
+
+# Index assignment of the "smartnodelist full"
+STATUS_INDEX = 0
+PROTOCOL_INDEX = 1
+PAYEE_INDEX = 2
+SEEN_INDEX = 3
+ACTIVE_INDEX = 4
+PAIDTIME_INDEX = 5
+PAIDBLOCK_INDEX = 6
+IPINDEX_INDEX = 7
+
+def staticKey(method, params):
+    return json.dumps([method] + list(params))
+
+class ArchiveWriter(object):
+
+    def __init__(self, path, source):
+
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.nodes = {}
+        self.statics = set()
+        self.frames = 0
+
+        self.writeLine({'type': 'header',
+                        'version': VERSION,
+                        'source': source,
+                        'created': int(time.time())})
+
+    def writeLine(self, entry):
+        self.file.write(json.dumps(entry, separators=(',', ':')))
+        self.file.write('\n')
+
+    ######
+    # Write the frame for the full nodelist :nodes, only the delta to the
+    # last frame ends up in the archive.
+    ######
+    def frame(self, captured, sync, info, nodes):
+
+        changed = {}
+
+        for key, line in nodes.items():
+            if self.nodes.get(key) != line:
+                changed[key] = line
+
+        removed = [key for key in self.nodes if key not in nodes]
+
+        self.nodes = dict(nodes)
+        self.frames += 1
+
+        self.writeLine({'type': 'frame',
+                        'time': captured,
+                        'sync': sync,
+                        'info': info,
+                        'nodes': {'set': changed, 'remove': removed}})
+
+    def static(self, method, params, result):
+
+        key = staticKey(method, params)
+
+        if key in self.statics:
+            return
+
+        self.statics.add(key)
+
+        self.writeLine({'type': 'static',
+                        'method': method,
+                        'params': list(params),
+                        'result': result})
+
+    def hasStatic(self, method, params):
+        return staticKey(method, params) in self.statics
+
+    def close(self):
+        self.file.close()
+
+####
+# Reads an archive frame by frame. The current nodelist is rebuilt from
+# the deltas, so only one version of it is in memory at any time.
+###
+class ArchiveReader(object):
+
+    def __init__(self, path):
+
+        self.file = gzip.open(path, 'rt', encoding='utf-8')
+        self.nodes = {}
+        self.statics = {}
+        self.frame = None
+        self.index = -1
+        self.pending = None
+        self.done = False
+
+        header = self.readLine()
+
+        if not header or header.get('type') != 'header':
+            raise ValueError("{} is no daemon archive".format(path))
+
+        if header.get('version') != VERSION:
+            raise ValueError("Unsupported archive version {}".format(header.get('version')))
+
+        self.header = header
+
+        # Load the first frame
+        self.readAhead()
+        self.advance()
+
+    def readLine(self):
+
+        line = self.file.readline()
+
+        if not line:
+            return None
+
+        return json.loads(line)
+
+    ######
+    # Read until the next frame, collect the static entries on the way.
+    ######
+    def readAhead(self):
+
+        while self.pending == None and not self.done:
+
+            entry = self.readLine()
+
+            if entry == None:
+                self.done = True
+            elif entry['type'] == 'frame':
+                self.pending = entry
+            elif entry['type'] == 'static':
+                self.statics[staticKey(entry['method'], entry['params'])] = entry['result']
+
+    ######
+    # Time of the next frame, None if there is none.
+    ######
+    def nextTime(self):
+
+        self.readAhead()
+
+        return self.pending['time'] if self.pending else None
+
+    ######
+    # Apply the next frame, returns False at the end of the archive.
+    ######
+    def advance(self):
+
+        self.readAhead()
+
+        if self.pending == None:
+            return False
+
+        frame = self.pending
+        self.pending = None
+
+        for key in frame['nodes']['remove']:
+            self.nodes.pop(key, None)
+
+        self.nodes.update(frame['nodes']['set'])
+
+        # Keep only the small parts
+        frame['nodes'] = None
+
+        self.frame = frame
+        self.index += 1
+
+        # The statics of the new nodes follow the frame
+        self.readAhead()
+
+        return True
+
+    def static(self, method, params):
+        return self.statics.get(staticKey(method, params))
+
+    def close(self):
+        self.file.close()
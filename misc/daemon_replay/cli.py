@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+#####
+#
+# smartcash-cli stand-in which forwards the call to a running replay.py.
+# Link or copy it as smartcash-cli into a directory in front of the PATH
+# of the bot. The address of the replay comes from REPLAY_RPC
+# (default 127.0.0.1:9679).
+#
+# Usage: ./cli.py <method> [params...]
+#
+#####
+
+import os
+import sys
+import json
+import http.client
+
+# Parameters which the real cli converts to json values
+conversions = {('getrawtransaction', 1),
+               ('getblock', 1)}
+
+def main(argv):
+
+    if not len(argv):
+        print("error: too few parameters", file=sys.stderr)
+        return 1
+
+    method = argv[0]
+    params = []
+
+    for position, param in enumerate(argv[1:]):
+
+        if (method, position) in conversions:
+            param = json.loads(param)
+
+        params.append(param)
+
+    host, port = os.environ.get('REPLAY_RPC', '127.0.0.1:9679').rsplit(':', 1)
+
+    try:
+        connection = http.client.HTTPConnection(host, int(port), timeout=60)
+        connection.request('POST', '/', json.dumps({'id': 1, 'method': method, 'params': params}))
+        response = json.loads(connection.getresponse().read().decode('utf-8'))
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        print("error: couldn't connect to server: {}".format(e), file=sys.stderr)
+        return 1
+
+    if response.get('error'):
+        print("error code: {}\nerror message:\n{}".format(response['error']['code'], response['error']['message']), file=sys.stderr)
+        return 1
+
+    result = response.get('result')
+
+    if isinstance(result, str):
+        print(result)
+    else:
+        print(json.dumps(result, indent=2))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
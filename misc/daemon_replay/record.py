@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+#####
+#
+# Records the daemon responses the bot needs into an archive for
+# replay.py. Each cycle captures "snsync status", "getinfo" and
+# "smartnodelist full", the collaterals of new nodes get resolved with
+# "getrawtransaction" and "getblock" like the bot does it. Only the fields
+# the bot reads of the transactions and blocks end up in the archive.
+#
+# Usage: ./record.py --out mainnet.jsonl.gz [--cycles 120] [--interval 30]
+#                    [--rpc-host 127.0.0.1 --rpc-port 9679 --rpc-user u --rpc-password p]
+#                    [--cli smartcash-cli]
+#
+#####
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(directory, '..', '..'))
+
+from src.rpc import SmartCashRPC, SmartCashCLI, RPCError
+from archive import ArchiveWriter
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    level=logging.INFO)
+
+logger = logging.getLogger("record")
+
+def recordCollaterals(client, writer, keys):
+
+    pending = []
+
+    for key in keys:
+
+        txhash = key[10:-1].split(', ')[0]
+
+        if not writer.hasStatic('getrawtransaction', [txhash, 1]):
+            pending.append(txhash)
+
+    pending = list(set(pending))
+
+    if not len(pending):
+        return
+
+    logger.info("Resolve {} collaterals".format(len(pending)))
+
+    rawTxs = client.batch(list(map(lambda x: ('getrawtransaction', x, 1), pending)))
+
+    blockHashes = set()
+
+    for txhash, rawTx in zip(pending, rawTxs):
+
+        if isinstance(rawTx, dict) and 'blockhash' in rawTx:
+            writer.static('getrawtransaction', [txhash, 1], {'txid': txhash, 'blockhash': rawTx['blockhash']})
+            blockHashes.add(rawTx['blockhash'])
+        else:
+            logger.warning("getrawtransaction {} => {}".format(txhash, rawTx))
+
+    blockHashes = list(filter(lambda x: not writer.hasStatic('getblock', [x]), blockHashes))
+    blocks = client.batch(list(map(lambda x: ('getblock', x), blockHashes)))
+
+    for blockHash, block in zip(blockHashes, blocks):
+
+        if isinstance(block, dict) and 'height' in block:
+            writer.static('getblock', [blockHash], {'hash': blockHash, 'height': block['height']})
+        else:
+            logger.warning("getblock {} => {}".format(blockHash, block))
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Record the daemon responses for the replay.")
+    parser.add_argument('--out', required=True, help="Path of the archive (.jsonl.gz).")
+    parser.add_argument('--cycles', type=int, default=120, help="Number of captured cycles, 0 for endless.")
+    parser.add_argument('--interval', type=float, default=30, help="Seconds between the cycles.")
+    parser.add_argument('--rpc-host', default='127.0.0.1')
+    parser.add_argument('--rpc-port', type=int, default=9679)
+    parser.add_argument('--rpc-user', help="Use the JSON-RPC interface if given.")
+    parser.add_argument('--rpc-password', default='')
+    parser.add_argument('--cli', default='smartcash-cli', help="cli binary if there is no rpc user.")
+    args = parser.parse_args(argv)
+
+    if args.rpc_user:
+        client = SmartCashRPC(args.rpc_host, args.rpc_port, args.rpc_user, args.rpc_password)
+    else:
+        client = SmartCashCLI(args.cli)
+
+    writer = ArchiveWriter(args.out, str(client))
+    cycle = 0
+
+    try:
+
+        while not args.cycles or cycle < args.cycles:
+
+            start = time.time()
+
+            try:
+
+                sync = client.call('snsync', 'status')
+                info = client.call('getinfo')
+                nodes = client.call('smartnodelist', 'full')
+
+            except RPCError as e:
+                logger.error("Cycle failed: {}".format(e))
+
+            else:
+
+                writer.frame(int(start), sync, info, nodes)
+
+                try:
+                    recordCollaterals(client, writer, nodes.keys())
+                except RPCError as e:
+                    logger.error("Collaterals failed: {}".format(e))
+
+                logger.info("Frame {} - block {}, {} nodes".format(writer.frames, info.get('blocks'), len(nodes)))
+
+            cycle += 1
+
+            time.sleep(max(0, args.interval - (time.time() - start)))
+
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+
+    finally:
+        writer.close()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+#####
+#
+# Serves an archive of record.py/synthetic.py as JSON-RPC daemon stand-in
+# for the bot. Use cli.py as smartcash-cli replacement for the cli path.
+#
+# The frames get replayed with a virtual clock which runs :speed times
+# faster than the wall clock, or with --step one frame per update cycle
+# of the bot (each "snsync status" call) for deterministic runs.
+#
+# The timestamps of the nodelist get shifted by the time between the
+# recording and the start of the replay. The offset stays constant to keep
+# unchanged lines unchanged, with a :speed above 1 the lastseen ages look
+# younger than recorded.
+#
+# Usage: ./replay.py archive.jsonl.gz [--port 9679] [--speed 10] [--step]
+#                    [--loop] [--zmq tcp://127.0.0.1:28332]
+#
+#####
+
+import sys
+import json
+import time
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from archive import ArchiveReader, STATUS_INDEX, SEEN_INDEX, PAIDTIME_INDEX
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    level=logging.INFO)
+
+logger = logging.getLogger("replay")
+
+class ReplayError(Exception):
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+####
+# Replays the frames of an archive and answers the daemon calls with the
+# state of the current frame.
+###
+class Replay(object):
+
+    def __init__(self, path, speed = 1.0, step = False, loop = False, shift = True, publisher = None):
+
+        self.path = path
+        self.speed = speed
+        self.step = step
+        self.loop = loop
+        self.shift = shift
+        self.publisher = publisher
+        self.sem = threading.Lock()
+
+        self.open()
+
+    def open(self):
+
+        self.reader = ArchiveReader(self.path)
+        self.startTime = self.reader.frame['time']
+        self.startWall = time.time()
+        # Virtual time of the current frame
+        self.virtual = self.startTime
+        self.lastBlock = self.blocks()
+        # Offset for the timestamps to make them look current
+        self.offset = int(self.startWall - self.startTime) if self.shift else 0
+        # Nodelist results of the current frame per mode
+        self.cache = {}
+        self.started = False
+
+        logger.info("Replay {} from {}".format(self.path, self.startTime))
+
+    def blocks(self):
+        return self.reader.frame['info'].get('blocks', 0)
+
+    def now(self):
+
+        if self.step:
+            return self.virtual
+
+        return self.startTime + (time.time() - self.startWall) * self.speed
+
+    def next(self):
+
+        if not self.reader.advance():
+
+            if not self.loop:
+                return False
+
+            logger.info("End of the archive, restart")
+            self.reader.close()
+            self.open()
+
+        self.virtual = self.reader.frame['time']
+        self.cache = {}
+
+        blocks = self.blocks()
+
+        if blocks != self.lastBlock:
+
+            self.lastBlock = blocks
+
+            if self.publisher:
+                self.publisher.publish(blocks)
+
+        return True
+
+    ######
+    # Apply all frames up to the current virtual time.
+    ######
+    def sync(self):
+
+        now = self.now()
+
+        while True:
+
+            nextTime = self.reader.nextTime()
+
+            if nextTime == None or nextTime > now:
+                break
+
+            if not self.next():
+                break
+
+    def nodelist(self, mode):
+
+        if mode in self.cache:
+            return self.cache[mode]
+
+        offset = self.offset
+        result = {}
+
+        for key, line in self.reader.nodes.items():
+
+            if mode == 'full' and not offset:
+                result[key] = line
+                continue
+
+            fields = line.split()
+
+            if offset:
+
+                fields[SEEN_INDEX] = str(int(fields[SEEN_INDEX]) + offset)
+
+                if int(fields[PAIDTIME_INDEX]) > 0:
+                    fields[PAIDTIME_INDEX] = str(int(fields[PAIDTIME_INDEX]) + offset)
+
+            if mode == 'full':
+                result[key] = " ".join(fields)
+            elif mode == 'lastseen':
+                result[key] = int(fields[SEEN_INDEX])
+            elif mode == 'status':
+                result[key] = fields[STATUS_INDEX]
+
+        self.cache[mode] = result
+
+        return result
+
+    def call(self, method, params):
+
+        self.sem.acquire()
+
+        try:
+
+            if method == 'snsync' and self.step:
+
+                # The first cycle gets the first frame
+                if self.started and (self.reader.nextTime() != None or self.loop):
+                    self.next()
+
+                self.started = True
+
+            elif not self.step:
+                self.sync()
+
+            frame = self.reader.frame
+
+            if method == 'snsync':
+                return frame['sync']
+            elif method == 'getinfo':
+                return frame['info']
+            elif method == 'getblockcount':
+                return self.blocks()
+            elif method == 'smartnodelist':
+
+                mode = params[0] if len(params) else 'full'
+
+                if mode not in ['full', 'lastseen', 'status']:
+                    raise ReplayError(-8, "Unsupported mode {}".format(mode))
+
+                return self.nodelist(mode)
+
+            elif method in ['getrawtransaction', 'getblock']:
+
+                result = self.reader.static(method, params)
+
+                if result == None:
+                    raise ReplayError(-5, "No information available")
+
+                return result
+
+            raise ReplayError(-32601, "Method not found")
+
+        finally:
+            self.sem.release()
+
+####
+# Publishes hashblock notifications like -zmqpubhashblock
+###
+class BlockPublisher(object):
+
+    def __init__(self, address):
+
+        if zmq == None:
+            raise RuntimeError("pyzmq is required for --zmq")
+
+        self.socket = zmq.Context.instance().socket(zmq.PUB)
+        self.socket.bind(address)
+        self.sequence = 0
+
+    def publish(self, height):
+
+        blockHash = hashlib.sha256(str(height).encode('utf-8')).digest()
+
+        self.socket.send_multipart([b'hashblock', blockHash, struct.pack('<I', self.sequence)])
+        self.sequence += 1
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    replay = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def single(self, request):
+
+        response = {'result': None, 'error': None, 'id': request.get('id')}
+
+        try:
+            response['result'] = self.replay.call(request.get('method'), request.get('params', []))
+        except ReplayError as e:
+            response['error'] = {'code': e.code, 'message': str(e)}
+
+        return response
+
+    def do_POST(self):
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        except ValueError:
+            self.send_error(400)
+            return
+
+        if isinstance(request, list):
+            response = list(map(self.single, request))
+            status = 200
+        else:
+            response = self.single(request)
+            status = 500 if response['error'] else 200
+
+        data = json.dumps(response).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def serve(replay, host = '127.0.0.1', port = 9679):
+
+    handler = type('ReplayHandler', (RequestHandler,), {'replay': replay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    return server
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Replay a daemon archive as JSON-RPC server.")
+    parser.add_argument('archive')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9679)
+    parser.add_argument('--speed', type=float, default=1.0, help="Factor of the virtual clock.")
+    parser.add_argument('--step', action='store_true', help="One frame per snsync call.")
+    parser.add_argument('--loop', action='store_true', help="Restart at the end of the archive.")
+    parser.add_argument('--no-shift', action='store_true', help="Keep the recorded timestamps.")
+    parser.add_argument('--zmq', help="Publish hashblock notifications at this address.")
+    args = parser.parse_args(argv)
+
+    publisher = BlockPublisher(args.zmq) if args.zmq else None
+
+    replay = Replay(args.archive, args.speed, args.step, args.loop, not args.no_shift, publisher)
+    server = serve(replay, args.host, args.port)
+
+    logger.info("Listening on {}:{}".format(args.host, server.server_address[1]))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+#####
+#
+# Generates a synthetic archive for replay.py with a network of :nodes
+# nodes, either from scratch or scaled up from the first frame of a
+# recorded archive (--base).
+#
+# Each cycle simulates the network for :interval seconds:
+#
+#   - New blocks every :block-time seconds, each pays the enabled node
+#     which waits the longest.
+#   - Pings of the online nodes about every 10 minutes which update the
+#     lastseen time and the active seconds like the daemon does it.
+#   - Outages, nodes stop pinging, expire after 65 minutes and need a new
+#     start after 3 hours. They come back after some cycles.
+#   - Churn, nodes get removed and new ones get started.
+#
+# Usage: ./synthetic.py --out net.jsonl.gz [--nodes 50000] [--cycles 120]
+#                       [--churn 0.001] [--outage 0.0005] [--base recorded.jsonl.gz]
+#
+#####
+
+import sys
+import time
+import heapq
+import random
+import logging
+import argparse
+
+from archive import ArchiveWriter, ArchiveReader, STATUS_INDEX, PROTOCOL_INDEX,\
+                    PAYEE_INDEX, SEEN_INDEX, ACTIVE_INDEX, PAIDTIME_INDEX,\
+                    PAIDBLOCK_INDEX, IPINDEX_INDEX
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                    level=logging.INFO)
+
+logger = logging.getLogger("synthetic")
+
+base58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+# Ping interval of the nodes
+PING_SECONDS = 600
+# https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnode.h
+EXPIRATION_SECONDS = 65 * 60
+NEW_START_REQUIRED_SECONDS = 180 * 60
+
+class SyntheticNode(object):
+
+    def __init__(self, **kwargs):
+
+        self.txhash = kwargs['txhash']
+        self.txindex = kwargs['txindex']
+        self.collateralBlock = kwargs['collateral_block']
+        self.status = kwargs['status']
+        self.protocol = kwargs['protocol']
+        self.payee = kwargs['payee']
+        self.ip = kwargs['ip']
+        self.sigTime = kwargs['sig_time']
+        self.lastPing = kwargs['last_ping']
+        self.paidTime = kwargs['paid_time']
+        self.paidBlock = kwargs['paid_block']
+        # Cycle of the recovery while the node is offline, None if online
+        self.recovery = None
+
+    def key(self):
+        return "COutPoint({}, {})".format(self.txhash, self.txindex)
+
+    def line(self):
+        return "{} {} {} {} {} {} {} {}".format(self.status, self.protocol, self.payee,
+                                                self.lastPing, self.lastPing - self.sigTime,
+                                                self.paidTime, self.paidBlock, self.ip)
+
+####
+# Simulated network which creates the frames and the statics.
+###
+class Network(object):
+
+    def __init__(self, args, rnd):
+
+        self.args = args
+        self.rnd = rnd
+        self.nodes = {}
+        # (paidBlock, key) of the enabled nodes, lazily invalidated
+        self.queue = []
+        self.offline = set()
+        self.created = []
+        self.cycle = 0
+
+        self.time = args.start_time
+        self.block = args.start_block
+        self.nextBlock = self.time + args.block_time
+
+    def randomHash(self):
+        return '{:064x}'.format(self.rnd.getrandbits(256))
+
+    def randomPayee(self):
+        return 'S' + ''.join(self.rnd.choice(base58) for i in range(33))
+
+    def randomIp(self):
+        return '{}.{}.{}.{}:9678'.format(self.rnd.randint(1, 223), self.rnd.randint(0, 255),
+                                         self.rnd.randint(0, 255), self.rnd.randint(1, 254))
+
+    def add(self, node):
+
+        # Avoid collisions, e.g. with the nodes of a base archive created
+        # with the same seed
+        while node.key() in self.nodes:
+            node.txhash = self.randomHash()
+
+        self.nodes[node.key()] = node
+        self.created.append(node)
+
+        if node.status == 'ENABLED':
+            heapq.heappush(self.queue, (node.paidBlock, node.key()))
+
+    ######
+    # Create a node which was started at some point in the past.
+    ######
+    def established(self):
+
+        rnd = self.rnd
+        status = rnd.choices(['ENABLED', 'NEW_START_REQUIRED', 'PRE_ENABLED'], [85, 10, 5])[0]
+        # Each enabled node gets paid about once per network size blocks
+        paidBlock = self.block - rnd.randint(0, self.args.nodes) if rnd.random() < 0.95 else 0
+        lastPing = self.time - rnd.randint(0, PING_SECONDS)
+
+        if status == 'NEW_START_REQUIRED':
+            lastPing -= rnd.randint(NEW_START_REQUIRED_SECONDS, 10 * NEW_START_REQUIRED_SECONDS)
+
+        node = SyntheticNode(txhash = self.randomHash(),
+                             txindex = rnd.randint(0, 3),
+                             collateral_block = max(1, self.block - rnd.randint(0, self.block)),
+                             status = status,
+                             protocol = 90025 if rnd.random() < 0.9 else 90024,
+                             payee = self.randomPayee(),
+                             ip = self.randomIp(),
+                             sig_time = lastPing - rnd.randint(0, 180 * 86400),
+                             last_ping = lastPing,
+                             paid_time = self.time - (self.block - paidBlock) * self.args.block_time if paidBlock else 0,
+                             paid_block = paidBlock)
+
+        if status == 'NEW_START_REQUIRED':
+            node.recovery = self.cycle + rnd.randint(1, self.args.recovery)
+            self.offline.add(node.key())
+
+        return node
+
+    ######
+    # Create a freshly started node with a new collateral.
+    ######
+    def started(self):
+
+        rnd = self.rnd
+
+        return SyntheticNode(txhash = self.randomHash(),
+                             txindex = rnd.randint(0, 3),
+                             collateral_block = self.block - rnd.randint(0, 100),
+                             status = 'PRE_ENABLED',
+                             protocol = 90025,
+                             payee = self.randomPayee(),
+                             ip = self.randomIp(),
+                             sig_time = self.time,
+                             last_ping = self.time,
+                             paid_time = 0,
+                             paid_block = 0)
+
+    ######
+    # Take over the nodes of the first frame of :path and clone them with
+    # new collaterals until there are :nodes nodes.
+    ######
+    def loadBase(self, path):
+
+        reader = ArchiveReader(path)
+        frame = reader.frame
+
+        self.time = frame['time']
+        self.block = frame['info'].get('blocks', self.block)
+        self.nextBlock = self.time + self.args.block_time
+
+        templates = []
+
+        for key, line in reader.nodes.items():
+
+            fields = line.split()
+            txhash, txindex = key[10:-1].split(', ')
+
+            collateralBlock = -1
+            rawTx = reader.static('getrawtransaction', [txhash, 1])
+
+            if rawTx:
+                block = reader.static('getblock', [rawTx['blockhash']])
+                collateralBlock = block['height'] if block else -1
+
+            if collateralBlock <= 0:
+                collateralBlock = max(1, self.block - self.rnd.randint(0, self.block))
+
+            lastPing = int(fields[SEEN_INDEX])
+
+            templates.append(SyntheticNode(txhash = txhash,
+                                           txindex = int(txindex),
+                                           collateral_block = collateralBlock,
+                                           status = fields[STATUS_INDEX],
+                                           protocol = int(fields[PROTOCOL_INDEX]),
+                                           payee = fields[PAYEE_INDEX],
+                                           ip = fields[IPINDEX_INDEX],
+                                           sig_time = lastPing - int(fields[ACTIVE_INDEX]),
+                                           last_ping = lastPing,
+                                           paid_time = int(fields[PAIDTIME_INDEX]),
+                                           paid_block = int(fields[PAIDBLOCK_INDEX])))
+
+        reader.close()
+
+        self.rnd.shuffle(templates)
+
+        for node in templates[:self.args.nodes]:
+            self.add(node)
+
+        while len(self.nodes) < self.args.nodes:
+
+            template = self.rnd.choice(templates)
+            jitter = self.rnd.randint(-PING_SECONDS, PING_SECONDS)
+
+            self.add(SyntheticNode(txhash = self.randomHash(),
+                                   txindex = self.rnd.randint(0, 3),
+                                   collateral_block = template.collateralBlock,
+                                   status = template.status,
+                                   protocol = template.protocol,
+                                   payee = self.randomPayee(),
+                                   ip = self.randomIp(),
+                                   sig_time = template.sigTime + jitter,
+                                   last_ping = min(self.time, template.lastPing + jitter),
+                                   paid_time = template.paidTime,
+                                   paid_block = template.paidBlock))
+
+        for key, node in self.nodes.items():
+            if node.status != 'ENABLED' and node.status != 'PRE_ENABLED':
+                node.recovery = self.cycle + self.rnd.randint(1, self.args.recovery)
+                self.offline.add(key)
+
+    def generate(self):
+
+        while len(self.nodes) < self.args.nodes:
+            self.add(self.established())
+
+    ######
+    # Pay the enabled node with the oldest payment.
+    ######
+    def pay(self, blockTime):
+
+        while len(self.queue):
+
+            paidBlock, key = heapq.heappop(self.queue)
+            node = self.nodes.get(key)
+
+            if node == None or node.status != 'ENABLED' or node.paidBlock != paidBlock:
+                continue
+
+            node.paidBlock = self.block
+            node.paidTime = blockTime
+
+            heapq.heappush(self.queue, (node.paidBlock, key))
+
+            return
+
+    def step(self):
+
+        rnd = self.rnd
+        args = self.args
+
+        self.cycle += 1
+        self.time += args.interval
+
+        while self.nextBlock <= self.time:
+            self.block += 1
+            self.pay(self.nextBlock)
+            self.nextBlock += args.block_time
+
+        keys = list(self.nodes.keys())
+
+        # Churn
+        for key in rnd.sample(keys, int(len(keys) * args.churn)):
+            self.nodes.pop(key)
+            self.offline.discard(key)
+            self.add(self.started())
+
+        # New outages
+        for key in rnd.sample(keys, int(len(keys) * args.outage)):
+
+            if key in self.nodes and key not in self.offline:
+                self.nodes[key].recovery = self.cycle + rnd.randint(1, args.recovery)
+                self.offline.add(key)
+
+        # Offline nodes expire or come back with a new start
+        for key in list(self.offline):
+
+            node = self.nodes[key]
+            age = self.time - node.lastPing
+
+            if node.recovery <= self.cycle:
+                node.recovery = None
+                node.status = 'PRE_ENABLED'
+                node.sigTime = self.time
+                node.lastPing = self.time
+                self.offline.discard(key)
+            elif age > NEW_START_REQUIRED_SECONDS:
+                node.status = 'NEW_START_REQUIRED'
+            elif age > EXPIRATION_SECONDS:
+                node.status = 'EXPIRED'
+
+        # Pings of the online nodes
+        online = [key for key in self.nodes if key not in self.offline]
+
+        for key in rnd.sample(online, min(len(online), int(len(online) * args.interval / PING_SECONDS))):
+
+            node = self.nodes[key]
+            node.lastPing = self.time - rnd.randint(0, int(args.interval))
+
+            if node.status == 'PRE_ENABLED':
+                node.status = 'ENABLED'
+                heapq.heappush(self.queue, (node.paidBlock, key))
+
+    def frame(self, writer):
+
+        writer.frame(self.time,
+                     {'AssetID': 999,
+                      'AssetName': 'SMARTNODE_SYNC_FINISHED',
+                      'Attempt': 0,
+                      'IsBlockchainSynced': True,
+                      'IsMasternodeListSynced': True,
+                      'IsWinnersListSynced': True,
+                      'IsSynced': True,
+                      'IsFailed': False},
+                     {'version': 1020100,
+                      'protocolversion': 90025,
+                      'blocks': self.block,
+                      'connections': 8},
+                     {key: node.line() for key, node in self.nodes.items()})
+
+        for node in self.created:
+
+            blockHash = '{:064x}'.format(node.collateralBlock)
+
+            writer.static('getrawtransaction', [node.txhash, 1], {'txid': node.txhash, 'blockhash': blockHash})
+            writer.static('getblock', [blockHash], {'hash': blockHash, 'height': node.collateralBlock})
+
+        self.created = []
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic daemon archive.")
+    parser.add_argument('--out', required=True, help="Path of the archive (.jsonl.gz).")
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--cycles', type=int, default=120)
+    parser.add_argument('--interval', type=int, default=30, help="Seconds between the frames.")
+    parser.add_argument('--block-time', type=int, default=55)
+    parser.add_argument('--churn', type=float, default=0.001, help="Fraction of replaced nodes per cycle.")
+    parser.add_argument('--outage', type=float, default=0.0005, help="Fraction of nodes going offline per cycle.")
+    parser.add_argument('--recovery', type=int, default=500, help="Max cycles until an offline node comes back.")
+    parser.add_argument('--start-block', type=int, default=500000)
+    parser.add_argument('--start-time', type=int, default=int(time.time()))
+    parser.add_argument('--base', help="Recorded archive to scale up.")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    network = Network(args, random.Random(args.seed))
+
+    if args.base:
+        network.loadBase(args.base)
+    else:
+        network.generate()
+
+    writer = ArchiveWriter(args.out, 'synthetic {}'.format(' '.join(argv)))
+
+    start = time.time()
+
+    network.frame(writer)
+
+    for cycle in range(args.cycles):
+        network.step()
+        network.frame(writer)
+
+    writer.close()
+
+    logger.info("{} frames with {} nodes in {:.1f}s".format(writer.frames, len(network.nodes), time.time() - start))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
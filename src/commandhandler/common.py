@@ -24,26 +24,25 @@ def info(bot, update):
 
     response = messages.markdown("<u><b>SmartNode Network<b><u>\n\n",bot.messenger)
 
-    if bot.nodeList.synced() and bot.nodeList.lastBlock:
-
-        bot.nodeList.acquire()
-
-        lastBlock = bot.nodeList.lastBlock
-        created = bot.nodeList.count()
-        enabled = bot.nodeList.enabled()
-        qualifiedNormal = bot.nodeList.qualifiedNormal
-        qualifiedUpgrade = bot.nodeList.qualifiedUpgrade
-        upgradeModeDuration = bot.nodeList.remainingUpgradeModeDuration
-        protocolRequirement = bot.nodeList.protocolRequirement()
-        protocol90024 = bot.nodeList.count(90024)
-        protocol90025 = bot.nodeList.count(90025)
-        initialWait = bot.nodeList.minimumUptime()
+    # Published state of the last update cycle, no lock needed
+    snapshot = bot.nodeList.snapshot
+
+    if bot.nodeList.synced() and snapshot.lastBlock:
+
+        lastBlock = snapshot.lastBlock
+        created = snapshot.count()
+        enabled = snapshot.enabled()
+        qualifiedNormal = snapshot.qualifiedNormal
+        qualifiedUpgrade = snapshot.qualifiedUpgrade
+        upgradeModeDuration = snapshot.remainingUpgradeModeDuration
+        protocolRequirement = snapshot.protocolRequirement
+        protocol90024 = snapshot.count(90024)
+        protocol90025 = snapshot.count(90025)
+        initialWait = snapshot.minimumUptime
 
         if upgradeModeDuration:
             upgradeModeDuration = util.secondsToText(upgradeModeDuration)
 
-        bot.nodeList.release()
-
         response += messages.networkState(bot.messenger,
                                           lastBlock,
                                           created,
@@ -100,6 +99,42 @@ def stats(bot):
 
     return response
 
+######
+# Command handler for printing the timings and counters of the
+# nodelist update cycles
+#
+# Command: metrics
+#
+# Admin only
+######
+def metrics(bot):
+
+    logger.info("metrics")
+
+    summary = bot.nodeList.metrics.summary()
+
+    response = messages.markdown("<u><b>Metrics<b><u>\n\n",bot.messenger)
+
+    response += "Uptime: {}\n\n".format(util.secondsToText(int(summary['uptime'])))
+
+    # No underscores, they would break the markdown
+    for (name, labels), value in sorted(summary['counters'].items()):
+        response += "{}: {}\n".format(name.replace('_total', '').replace('_', ' '), value)
+
+    response += messages.markdown("\n<b>Timings<b> (count, last, p50, p90, max)\n\n",bot.messenger)
+
+    for (name, labels), entry in sorted(summary['histograms'].items()):
+
+        name = " ".join([name.replace('_seconds', '')] + list(map(lambda x: str(x[1]), labels))).replace('_', ' ')
+
+        response += "{}: {}, {:.3f}s, {:.3f}s, {:.3f}s, {:.3f}s\n".format(name,
+                                                                           entry['count'],
+                                                                           entry['last'],
+                                                                           entry['p50'],
+                                                                           entry['p90'],
+                                                                           entry['max'])
+
+    return response
 
 ######
 # Telegram command handler for printing unknown command text
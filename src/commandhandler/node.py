@@ -74,7 +74,7 @@ def nodeAdd(bot, update, args):
                     response += messages.nodeNotInListError(bot.messenger,ip)
                 else:
 
-                    if bot.database.addNode( node['collateral'], name, userId,userName):
+                    if bot.database.addNode( str(node.collateral), name, userId,userName):
 
                         response += "Added node {}!\n".format(ip)
 
@@ -155,13 +155,13 @@ def nodeUpdate(bot, update, args):
                     response += messages.nodeNotInListError(bot.messenger, ip)
                 else:
 
-                    userNode = bot.database.getNodes(node['collateral'],userId)
+                    userNode = bot.database.getNodes(str(node.collateral),userId)
 
                     if userNode == None:
                         response += messages.nodeNotExistsError(bot.messenger, ip)
                     else:
 
-                        bot.database.updateNode(node['collateral'],user['id'], name)
+                        bot.database.updateNode(str(node.collateral),user['id'], name)
 
                         response += "Node successfully updated. {}\n".format(ip)
 
@@ -230,12 +230,12 @@ def nodeRemove(bot, update, args):
                         response += messages.nodeNotInListError(bot.messenger, ip)
                     else:
 
-                        userNode = bot.database.getNodes(node['collateral'],userId)
+                        userNode = bot.database.getNodes(str(node.collateral),userId)
 
                         if userNode == None:
                             response += messages.nodeNotExistsError(bot.messenger, ip)
                         else:
-                            bot.database.deleteNode(node['collateral'],user['id'])
+                            bot.database.deleteNode(str(node.collateral),user['id'])
                             response += messages.markdown("Node successfully removed. <b>{}<b>\n".format(ip),bot.messenger)
 
     return response
@@ -318,15 +318,13 @@ def nodes(bot, update):
 
     else:
 
-        collaterals = list(map(lambda x: x['collateral'],userNodes))
-        nodes = bot.nodeList.getNodes(collaterals)
+        names = {x['collateral']: x['name'] for x in userNodes}
+        nodes = bot.nodeList.getNodes(list(names.keys()))
 
         for smartnode in sorted(nodes, key=lambda x: x.position):
 
-            userNode = bot.database.getNodes(smartnode.collateral, user['id'])
-
             payoutText = util.secondsToText(smartnode.lastPaidTime)
-            response += messages.markdown("<b>" + userNode['name'] + "<b> - `" + smartnode.status + "`",bot.messenger)
+            response += messages.markdown("<b>" + names[str(smartnode.collateral)] + "<b> - `" + smartnode.status + "`",bot.messenger)
             response += "\nPosition " + smartnode.positionString()
             response += "\nLast seen " + util.secondsToText( int(time.time()) - smartnode.lastSeen)
             response += "\nLast payout " + smartnode.payoutTimeString()
@@ -396,7 +394,10 @@ def lookup(bot, userId, args):
 
     response = messages.markdown("<u><b>Node lookup<b><u>\n\n",bot.messenger)
 
-    if bot.nodeList.synced() and bot.nodeList.lastBlock:
+    # All lookups from the same cycle
+    snapshot = bot.nodeList.snapshot
+
+    if bot.nodeList.synced() and snapshot.lastBlock:
 
         if not len(args):
             response += messages.lookupArgumentRequiredError(bot.messenger)
@@ -413,11 +414,11 @@ def lookup(bot, userId, args):
                     errors.append(messages.invalidIpError(bot.messenger,arg))
                 else:
 
-                    dbNode = bot.nodeList.getNodeByIp(ip)
+                    node = snapshot.getNodeByIp(ip)
 
-                    if dbNode:
+                    if node:
 
-                        result = bot.nodeList.lookup(dbNode['collateral'])
+                        result = snapshot.lookup(node.collateral)
 
                         if result:
                             lookups.append(messages.lookupResult(bot.messenger,result))
@@ -462,7 +463,7 @@ def nodeUpdated(bot, update, user, userNode, node):
     if update['lastPaid'] and user['reward_n']:
 
         # Prevent zero division if for any reason lastPaid is 0
-        calcBlock = node.lastPaidBlock if node.lastPaidBlock != 0 else bot.nodeList.lastBlock
+        calcBlock = node.lastPaidBlock if node.lastPaidBlock != 0 else bot.nodeList.snapshot.lastBlock
         reward = 5000 * ( 143500 / calcBlock ) * 0.1
 
         response = messages.rewardNotification(bot.messenger, nodeName, calcBlock, reward)
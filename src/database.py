@@ -2,7 +2,9 @@
 
 import logging
 from src import util
+from src import migrations
 import threading
+import time
 import sqlite3 as sql
 
 logger = logging.getLogger("database")
@@ -20,20 +22,136 @@ class BotDatabase(object):
 
         self.connection = util.ThreadedSQLite(dburi)
 
-        if self.isEmpty():
-            self.reset()
+        migrations.migrate(self.connection, migrations.botMigrations, migrations.botLayout, 'bot')
+        self.connection.enableWal()
 
-    def isEmpty(self):
+        #####
+        # Write-through cache of the tables, the reads of the commands
+        # never query the database. All mutators refresh the cached rows
+        # of the users they touch within their transaction.
+        #####
+        self.sem = threading.Lock()
+        # user id => row
+        self.users = {}
+        # user id => tuple of node rows, ordered by name
+        self.userNodes = {}
+        # collateral => {user id => node row}
+        self.collaterals = {}
 
-        tables = []
+        self.load()
 
-        with self.connection as db:
+    ######
+    # Fill the cache with the whole database.
+    ######
+    def load(self):
 
-            db.cursor.execute("SELECT name FROM sqlite_master")
+        with self.connection.read() as db:
 
-            tables = db.cursor.fetchall()
+            db.cursor.execute("SELECT * FROM users")
+            users = db.cursor.fetchall()
+
+            db.cursor.execute("SELECT * FROM nodes ORDER BY name")
+            nodes = db.cursor.fetchall()
+
+        grouped = {}
+
+        for node in nodes:
+            grouped.setdefault(node['user_id'], []).append(node)
+
+        self.sem.acquire()
+
+        self.users = {}
+        self.userNodes = {}
+        self.collaterals = {}
+
+        for user in users:
+            self.users[user['id']] = user
+
+        for userId, rows in grouped.items():
+            self.cacheNodes(userId, tuple(rows))
+
+        self.sem.release()
+
+        logger.info("Cached {} users, {} nodes".format(len(users), len(nodes)))
+
+    ######
+    # The user ids have integer affinity in the database, numeric strings
+    # like the ids of discord get stored as integers.
+    ######
+    def userKey(self, userId):
+
+        if isinstance(userId, str) and util.isInt(userId):
+            return int(userId)
+
+        return userId
+
+    ######
+    # Replace the cached node rows of :userId, requires the sem.
+    ######
+    def cacheNodes(self, userId, nodes):
+
+        for node in self.userNodes.pop(userId, ()):
+
+            entries = self.collaterals[node['collateral']]
+            entries.pop(userId, None)
+
+            if not len(entries):
+                del self.collaterals[node['collateral']]
+
+        if len(nodes):
+
+            self.userNodes[userId] = nodes
+
+            for node in nodes:
+                self.collaterals.setdefault(node['collateral'], {})[userId] = node
+
+    ######
+    # Run the write :query with :parameters and refresh the cached rows of
+    # the users :userIds and of the users with a node of :collateral once
+    # it is committed. Returns the number of changed rows.
+    ######
+    def execute(self, query, parameters, userIds = (), collateral = None):
+
+        userIds = set(map(self.userKey, userIds))
+
+        with self.connection.write() as db:
+
+            if collateral != None:
+                db.cursor.execute("SELECT user_id FROM nodes WHERE collateral=?", [str(collateral)])
+                userIds.update(row['user_id'] for row in db.cursor.fetchall())
 
-        return len(tables) == 0
+            db.cursor.execute(query, parameters)
+            changed = db.cursor.rowcount
+
+            reloaded = []
+
+            for userId in userIds:
+
+                db.cursor.execute("SELECT * FROM users WHERE id=?", [userId])
+                user = db.cursor.fetchone()
+
+                db.cursor.execute("SELECT * FROM nodes WHERE user_id=? ORDER BY name", [userId])
+                nodes = tuple(db.cursor.fetchall())
+
+                reloaded.append((userId, user, nodes))
+
+            db.connection.commit()
+
+            # Still behind the writer lock, the cache follows the commit order
+            self.sem.acquire()
+
+            for userId, user, nodes in reloaded:
+
+                if user == None:
+                    self.users.pop(userId, None)
+                else:
+                    self.users[userId] = user
+
+                self.cacheNodes(userId, nodes)
+
+            self.sem.release()
+
+        return changed
 
     def addUser(self, userId, userName):
 
@@ -44,13 +162,11 @@ class BotDatabase(object):
             if userName == None or userName == '':
                 userName = 'Unknown'
 
-            with self.connection as db:
-
-                logger.debug("addUser: New user {} {}".format(userId,userName))
+            logger.debug("addUser: New user {} {}".format(userId,userName))
 
-                db.cursor.execute("INSERT INTO users( id, name, status_n, timeout_n, reward_n, network_n  ) values( ?, ?, 1, 1, 1, 0 )", ( userId, userName ))
+            self.execute("INSERT OR IGNORE INTO users( id, name, status_n, timeout_n, reward_n, network_n  ) values( ?, ?, 1, 1, 1, 0 )", ( userId, userName ), [userId])
 
-                user = db.cursor.lastrowid
+            user = userId
 
         else:
 
@@ -61,23 +177,23 @@ class BotDatabase(object):
     def addNode(self, collateral,name,userId,userName):
 
         user = self.addUser(userId, userName)
-        node = self.getNodes(collateral, user)
 
-        if node == None or node['user_id'] != user:
+        # The unique index on (collateral, user_id) skips known nodes
+        return self.execute("INSERT OR IGNORE INTO nodes( collateral, name, user_id  )  values( ?, ?, ? )", ( str(collateral), name, user ), [user]) == 1
 
-            with self.connection as db:
-
-                db.cursor.execute("INSERT INTO nodes( collateral, name, user_id  )  values( ?, ?, ? )", ( collateral, name, user ) )
+    def getUsers(self, condition = None ):
 
-                return True
+        if condition == None:
 
-        return False
+            self.sem.acquire()
+            users = sorted(self.users.values(), key=lambda x: x['id'])
+            self.sem.release()
 
-    def getUsers(self, condition = None ):
+            return users
 
         users = []
 
-        with self.connection as db:
+        with self.connection.read() as db:
             query = "SELECT * FROM users"
 
             if condition:
@@ -90,130 +206,411 @@ class BotDatabase(object):
 
     def getUser(self, userId):
 
-        user = None
-
-        with self.connection as db:
-
-            db.cursor.execute("SELECT * FROM users WHERE id=?",[userId])
-
-            user = db.cursor.fetchone()
+        self.sem.acquire()
+        user = self.users.get(self.userKey(userId))
+        self.sem.release()
 
         return user
 
     def getAllNodes(self, userId = None):
 
-        nodes = []
-
-        with self.connection as db:
+        self.sem.acquire()
 
-            if userId:
-                db.cursor.execute("SELECT * FROM nodes WHERE user_id=? ORDER BY name",[userId])
-            else:
-                db.cursor.execute("SELECT * FROM nodes")
+        if userId:
+            nodes = list(self.userNodes.get(self.userKey(userId), ()))
+        else:
+            nodes = sorted((node for rows in self.userNodes.values() for node in rows), key=lambda x: x['id'])
 
-            nodes = db.cursor.fetchall()
+        self.sem.release()
 
         return nodes
 
     def getNodes(self, collateral, userId = None):
 
-        nodes = None
+        self.sem.acquire()
 
-        with self.connection as db:
+        entries = self.collaterals.get(str(collateral), {})
 
-            if userId:
-                db.cursor.execute("SELECT * FROM nodes WHERE collateral=? and user_id=?",(str(collateral),userId))
-                nodes = db.cursor.fetchone()
-            else:
-                db.cursor.execute("SELECT * FROM nodes WHERE collateral=?",[str(collateral)])
-                nodes = db.cursor.fetchall()
+        if userId:
+            nodes = entries.get(self.userKey(userId))
+        else:
+            nodes = sorted(entries.values(), key=lambda x: x['id'])
+
+        self.sem.release()
 
         return nodes
 
     def updateUsername(self, name, userId):
+        self.execute("UPDATE users SET name=? WHERE id=?", (name,userId), [userId])
 
-        with self.connection as db:
+    def updateNode(self, collateral, userId, name):
+        self.execute("UPDATE nodes SET name=? WHERE collateral=? and user_id=?", (name, str(collateral), userId), [userId])
 
-            db.cursor.execute("UPDATE users SET name=? WHERE id=?",(name,userId))
+    def updateStatusNotification(self, userId, state):
+        self.execute("UPDATE users SET status_n = ? WHERE id=?", (state,userId), [userId])
 
-    def updateNode(self, collateral, userId, name):
+    def updateTimeoutNotification(self, userId, state):
+        self.execute("UPDATE users SET timeout_n = ? WHERE id=?", (state,userId), [userId])
 
-        with self.connection as db:
+    def updateRewardNotification(self, userId, state):
+        self.execute("UPDATE users SET reward_n = ? WHERE id=?", (state,userId), [userId])
 
-            db.cursor.execute("UPDATE nodes SET name=? WHERE collateral=? and user_id=?",(name, str(collateral), userId))
+    def updateNetworkNotification(self, userId, state):
+        self.execute("UPDATE users SET network_n = ? WHERE id=?", (state,userId), [userId])
 
-    def updateStatusNotification(self, userId, state):
+    def deleteUser(self, userId):
+        self.execute("DELETE FROM users WHERE id=?", [userId], [userId])
 
-        with self.connection as db:
+    def deleteNode(self, collateral, userId):
+        self.execute("DELETE FROM nodes WHERE collateral=? and user_id=?", (str(collateral),userId), [userId])
 
-            db.cursor.execute("UPDATE users SET status_n = ? WHERE id=?",(state,userId))
+    def deleteNodesForUser(self, userId):
+        self.execute("DELETE FROM nodes WHERE user_id=?", [userId], [userId])
 
-    def updateTimeoutNotification(self, userId, state):
+    def deleteNodesWithId(self, collateral):
+        self.execute("DELETE FROM nodes WHERE collateral=?", [str(collateral)], collateral = collateral)
 
-        with self.connection as db:
+#####
+#
+# Collects the node writes of an update cycle for NodeDatabase.writeBatch.
+# The values of a node get copied when it is added, later changes of the
+# node need another upsert. The last write per collateral wins.
+#
+#####
 
-            db.cursor.execute("UPDATE users SET timeout_n = ? WHERE id=?",(state,userId))
+class NodeBatch(object):
 
-    def updateRewardNotification(self, userId, state):
+    def __init__(self):
+        self.upserts = {}
+        self.deletes = {}
 
-        with self.connection as db:
+    def __len__(self):
+        return len(self.upserts) + len(self.deletes)
 
-            db.cursor.execute("UPDATE users SET reward_n = ? WHERE id=?",(state,userId))
+    def upsert(self, collateral, node):
 
-    def updateNetworkNotification(self, userId, state):
+        key = str(collateral)
 
-        with self.connection as db:
+        self.deletes.pop(key, None)
+        self.upserts[key] = (key,
+                             collateral.block,
+                             node.payee,
+                             node.status,
+                             node.activeSeconds,
+                             node.lastPaidBlock,
+                             node.lastPaidTime,
+                             node.lastSeen,
+                             node.protocol,
+                             node.ip,
+                             node.timeout)
 
-            db.cursor.execute("UPDATE users SET network_n = ? WHERE id=?",(state,userId))
+    def delete(self, collateral):
 
-    def deleteUser(self, userId):
+        key = str(collateral)
 
-        with self.connection as db:
+        self.upserts.pop(key, None)
+        self.deletes[key] = (key,)
 
-            db.cursor.execute("DELETE FROM users WHERE id=?",[userId])
+    ######
+    # Apply the newer writes of :other on top of this batch.
+    ######
+    def update(self, other):
 
-    def deleteNode(self, collateral, userId):
+        for key, values in other.upserts.items():
+            self.deletes.pop(key, None)
+            self.upserts[key] = values
 
-        with self.connection as db:
+        for key, values in other.deletes.items():
+            self.upserts.pop(key, None)
+            self.deletes[key] = values
 
-            db.cursor.execute("DELETE FROM nodes WHERE collateral=? and user_id=?",(str(collateral),userId))
+    ######
+    # Add the older writes of :other which are not overwritten here.
+    ######
+    def merge(self, other):
 
-    def deleteNodesForUser(self, userId):
+        for key, values in other.upserts.items():
+            if key not in self.upserts and key not in self.deletes:
+                self.upserts[key] = values
 
-        with self.connection as db:
-            db.cursor.execute("DELETE FROM nodes WHERE user_id=?",[userId])
+        for key, values in other.deletes.items():
+            if key not in self.upserts and key not in self.deletes:
+                self.deletes[key] = values
 
-    def deleteNodesWithId(self, collateral):
+#####
+#
+# Write-behind worker for the NodeDatabase. The update cycles submit their
+# NodeBatch and continue, the worker coalesces the queued writes per
+# collateral and writes them in one transaction once :flushSize writes
+# are queued or the oldest one waited :flushInterval seconds.
+#
+# The queue is bounded by :maxPending writes, a submit waits up to
+# :maxWait seconds for the worker if it is full. Failed writes get queued
+# again, behind the newer writes of the same collateral. stop() flushes
+# everything which got submitted before.
+#
+# Without a started worker the submits get written right away.
+#
+#####
 
-        with self.connection as db:
-            db.cursor.execute("DELETE FROM nodes WHERE collateral=?",[str(collateral)])
+class NodeWriter(object):
+
+    def __init__(self, db, flushSize = 1000, flushInterval = 2.0, maxPending = 50000,
+                 maxWait = 10.0, retryInterval = 5.0, metrics = None, errorCB = None):
+
+        self.db = db
+        self.flushSize = flushSize
+        self.flushInterval = flushInterval
+        self.maxPending = maxPending
+        self.maxWait = maxWait
+        self.retryInterval = retryInterval
+        self.metrics = metrics
+        self.errorCB = errorCB
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.stopping = False
+        self.flushRequested = False
+
+        self.pending = NodeBatch()
+        # Monotonic time of the oldest pending write
+        self.since = None
+        # Size of the batch which gets written right now
+        self.inFlight = 0
+        self.retryAt = None
+        self.failures = 0
+
+    def __len__(self):
+        return self.depth()
+
+    def depth(self):
+        return len(self.pending) + self.inFlight
+
+    def start(self):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="NodeWriter", daemon=True)
+        self.thread.start()
+
+    ######
+    # Flush all submitted writes and stop the worker.
+    ######
+    def stop(self):
+
+        if not self.running:
+            return
+
+        self.condition.acquire()
+        self.stopping = True
+        self.condition.notify_all()
+        self.condition.release()
+
+        self.thread.join()
+        self.running = False
+
+    def gauge(self):
+
+        if self.metrics:
+            self.metrics.gauge('db_queue_depth', self.depth())
+
+    def submit(self, batch):
+
+        if not len(batch):
+            return
+
+        self.condition.acquire()
+
+        try:
+
+            deadline = time.monotonic() + self.maxWait
+
+            while self.running and not self.stopping and len(self.pending) >= self.maxPending:
+
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    logger.warning("Write queue full with {} writes, queue anyway".format(len(self.pending)))
+                    break
+
+                self.condition.wait(remaining)
+
+            before = len(self.pending)
+
+            self.pending.update(batch)
+
+            if self.since == None:
+                self.since = time.monotonic()
+
+            if self.metrics:
+                self.metrics.increment('db_coalesced_total', before + len(batch) - len(self.pending))
+
+            self.gauge()
+
+            self.condition.notify_all()
+
+        finally:
+            self.condition.release()
+
+        if not self.running:
+            self.flush()
+
+    ######
+    # Write all queued writes, waits for the worker if it runs. Returns
+    # False if they couldn't be written.
+    ######
+    def flush(self):
+
+        if not self.running:
+
+            self.condition.acquire()
+            batch, since = self.take()
+            self.condition.release()
+
+            self.write(batch, since)
+            self.gauge()
+
+            return not len(self.pending)
+
+        self.condition.acquire()
+
+        try:
+
+            self.flushRequested = True
+            self.retryAt = None
+            self.condition.notify_all()
+
+            while self.depth() and self.retryAt == None:
+                self.condition.wait()
+
+            return not self.depth()
+
+        finally:
+            self.condition.release()
+
+    ######
+    # Take the pending writes out of the queue, requires the condition.
+    ######
+    def take(self):
+
+        batch = self.pending
+        since = self.since
+
+        self.pending = NodeBatch()
+        self.since = None
+        self.flushRequested = False
+
+        return batch, since
+
+    def due(self, now):
+
+        if self.retryAt != None:
+            return now >= self.retryAt
+
+        if self.stopping or self.flushRequested:
+            return True
+
+        if len(self.pending) >= min(self.flushSize, self.maxPending):
+            return True
+
+        return self.since != None and now - self.since >= self.flushInterval
+
+    def write(self, batch, since):
+
+        if not len(batch):
+            return True
+
+        start = time.monotonic()
+
+        try:
+            result = self.db.writeBatch(batch)
+        except Exception as e:
+
+            logger.error("Could not write {} nodes, retry in {}s".format(len(batch), self.retryInterval), exc_info=e)
+
+            self.condition.acquire()
+
+            # The newer writes of the queue stay in front
+            self.pending.merge(batch)
+            self.since = min(since, self.since) if self.since != None else since
+            self.retryAt = time.monotonic() + self.retryInterval
+            self.failures += 1
+            failures = self.failures
+
+            self.condition.release()
+
+            if self.metrics:
+                self.metrics.increment('db_write_errors_total')
+
+            # Only the first one of a row of failures
+            if failures == 1 and self.errorCB:
+                self.errorCB("Could not write {} nodes to the database".format(len(batch)))
+
+            return False
+
+        self.failures = 0
+
+        now = time.monotonic()
 
-    def reset(self):
-
-        sql = 'BEGIN TRANSACTION;\
-        CREATE TABLE "users" (\
-        	`id`	INTEGER NOT NULL PRIMARY KEY,\
-        	`name`	INTEGER,\
-        	`status_n`	INTEGER,\
-        	`reward_n`	INTEGER,\
-        	`timeout_n`	INTEGER,\
-        	`network_n` INTEGER,\
-            `detail_n` INTEGER,\
-            `last_activity`	INTEGER\
-        );\
-        CREATE TABLE "nodes" (\
-        	`id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,\
-        	`user_id` INTEGER,\
-        	`collateral` STRING NOT NULL,\
-        	`name` TEXT NOT NULL\
-        );\
-        CREATE INDEX `node_id` ON `nodes` (`collateral` );\
-        CREATE INDEX `node_user` ON `nodes` (`user_id` );\
-        COMMIT;'
-
-        with self.connection as db:
-            db.cursor.executescript(sql)
+        if self.metrics:
+            self.metrics.increment('db_flushed_rows_total', result['rows'])
+            self.metrics.observe('db_flush_seconds', now - start)
+            self.metrics.observe('db_commit_seconds', result['commit'])
+            # Time from the oldest submit until it was written
+            self.metrics.observe('db_write_delay_seconds', now - since)
 
+        logger.debug("Nodes written: {} rows in {:.3f}s, commit {:.3f}s".format(result['rows'], result['execute'], result['commit']))
+
+        return True
+
+    def run(self):
+
+        # Flush attempts after the stop
+        attempts = 0
+
+        while True:
+
+            self.condition.acquire()
+
+            while not self.due(time.monotonic()):
+
+                if self.retryAt != None:
+                    timeout = self.retryAt - time.monotonic()
+                elif self.since != None:
+                    timeout = self.flushInterval - (time.monotonic() - self.since)
+                else:
+                    timeout = None
+
+                self.condition.wait(timeout)
+
+            self.retryAt = None
+            stopping = self.stopping
+            attempts += int(stopping)
+
+            batch, since = self.take()
+            self.inFlight = len(batch)
+
+            # Space for the blocked submits
+            self.condition.notify_all()
+            self.condition.release()
+
+            self.write(batch, since)
+
+            self.condition.acquire()
+
+            self.inFlight = 0
+            self.gauge()
+            self.condition.notify_all()
+
+            if stopping and (not len(self.pending) or attempts >= 3):
+
+                if len(self.pending):
+                    logger.error("Dropped {} node writes at the shutdown".format(len(self.pending)))
+
+                self.condition.release()
+                return
+
+            self.condition.release()
 
 #####
 #
@@ -224,28 +621,41 @@ class BotDatabase(object):
 
 class NodeDatabase(object):
 
+    upsertQuery = "INSERT INTO nodes(\
+                        collateral,\
+                        collateral_block,\
+                        payee, \
+                        status,\
+                        activeseconds,\
+                        last_paid_block,\
+                        last_paid_time,\
+                        last_seen,\
+                        protocol,\
+                        ip,\
+                        timeout ) \
+                        values( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )\
+                        ON CONFLICT(collateral) DO UPDATE SET\
+                        collateral_block=excluded.collateral_block,\
+                        payee=excluded.payee,\
+                        status=excluded.status,\
+                        activeseconds=excluded.activeseconds,\
+                        last_paid_block=excluded.last_paid_block,\
+                        last_paid_time=excluded.last_paid_time,\
+                        last_seen=excluded.last_seen,\
+                        protocol=excluded.protocol,\
+                        ip=excluded.ip,\
+                        timeout=excluded.timeout"
+
     def __init__(self, dburi):
 
         self.connection = util.ThreadedSQLite(dburi)
 
-        if self.isEmpty():
-            self.reset()
-
-    def isEmpty(self):
-
-        tables = []
-
-        with self.connection as db:
-
-            db.cursor.execute("SELECT name FROM sqlite_master")
-
-            tables = db.cursor.fetchall()
-
-        return len(tables) == 0
+        migrations.migrate(self.connection, migrations.nodeMigrations, migrations.nodeLayout, 'nodes')
+        self.connection.enableWal()
 
     def raw(self, query):
 
-        with self.connection as db:
+        with self.connection.read() as db:
             db.cursor.execute(query)
             return db.cursor.fetchall()
 
@@ -256,7 +666,7 @@ class NodeDatabase(object):
 
         try:
 
-            with self.connection as db:
+            with self.connection.write() as db:
                 query = "INSERT INTO nodes(\
                         collateral,\
                         collateral_block,\
@@ -296,7 +706,7 @@ class NodeDatabase(object):
         nodes = []
         rows = '*' if filter == None else ",".join(filter)
 
-        with self.connection as db:
+        with self.connection.read() as db:
 
             db.cursor.execute("SELECT {} FROM nodes".format(rows))
 
@@ -308,7 +718,7 @@ class NodeDatabase(object):
 
         count = 0
 
-        with self.connection as db:
+        with self.connection.read() as db:
 
             if where:
                 db.cursor.execute("SELECT COUNT(collateral) FROM nodes WHERE {}".format(where))
@@ -325,7 +735,7 @@ class NodeDatabase(object):
 
         search = "{}:9678".format(ip)
 
-        with self.connection as db:
+        with self.connection.read() as db:
 
             db.cursor.execute("SELECT * FROM nodes WHERE ip=?",[search])
 
@@ -335,60 +745,42 @@ class NodeDatabase(object):
 
     def updateNode(self, collateral, node):
 
-        if not self.addNode(collateral, node):
-
-            with self.connection as db:
-
-                query = "UPDATE nodes SET\
-                                collateral_block=?,\
-                                payee=?,\
-                                status=?,\
-                                activeseconds=?,\
-                                last_paid_block=?,\
-                                last_paid_time=?,\
-                                last_seen=?,\
-                                protocol=?,\
-                                ip=?,\
-                                timeout=?\
-                                WHERE collateral=?"
-
-                db.cursor.execute(query, (\
-                                  collateral.block,\
-                                  node.payee,\
-                                  node.status,\
-                                  node.activeSeconds,\
-                                  node.lastPaidBlock,\
-                                  node.lastPaidTime,\
-                                  node.lastSeen,\
-                                  node.protocol,\
-                                  node.ip,
-                                  node.timeout,
-                                  str(collateral)))
+        batch = NodeBatch()
+        batch.upsert(collateral, node)
+
+        self.writeBatch(batch)
+
+    ######
+    # Apply all writes of the NodeBatch :batch in one transaction. Returns
+    # the written rows and the seconds of the statements and the commit.
+    ######
+    def writeBatch(self, batch):
+
+        result = {'rows': 0, 'execute': 0.0, 'commit': 0.0}
+
+        if not len(batch):
+            return result
+
+        with self.connection.write() as db:
+
+            start = time.monotonic()
+
+            # The writer rolls back if one of them fails
+            db.cursor.executemany(self.upsertQuery, batch.upserts.values())
+            db.cursor.executemany("DELETE FROM nodes WHERE collateral=?", batch.deletes.values())
+
+            executed = time.monotonic()
+
+            db.connection.commit()
+
+        result['rows'] = len(batch)
+        result['execute'] = executed - start
+        result['commit'] = time.monotonic() - executed
+
+        return result
 
     def deleteNode(self, collateral):
 
-        with self.connection as db:
+        with self.connection.write() as db:
 
             db.cursor.execute("DELETE FROM nodes WHERE collateral=?",[str(collateral)])
-
-    def reset(self):
-
-        sql = '\
-        BEGIN TRANSACTION;\
-        CREATE TABLE "nodes" (\
-        	`collateral` TEXT NOT NULL PRIMARY KEY,\
-            `collateral_block` INTEGER,\
-        	`payee`	TEXT,\
-        	`status` TEXT,\
-        	`activeseconds`	INTEGER,\
-        	`last_paid_block` INTEGER,\
-        	`last_paid_time` INTEGER,\
-        	`last_seen`	INTEGER,\
-        	`protocol`	INTEGER,\
-            `timeout` INTEGER,\
-        	`ip` TEXT\
-        );\
-        COMMIT;'
-
-        with self.connection as db:
-            db.cursor.executescript(sql)
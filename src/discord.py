@@ -151,7 +151,7 @@ class SmartNodeBotDiscord(object):
                     # Node commands
                     'add':1,'update':1,'remove':1,'nodes':1, 'detail':1, 'balance':1, 'lookup':0,
                     # Admin commands
-                    'stats':2, 'broadcast':2
+                    'stats':2, 'broadcast':2, 'metrics':2
         }
 
         choices = fuzzy.extract(command,commands.keys(),limit=2)
@@ -277,6 +277,9 @@ class SmartNodeBotDiscord(object):
         elif command == 'stats':
             response = common.stats(self)
             await self.sendMessage(receiver, response)
+        elif command == 'metrics':
+            response = common.metrics(self)
+            await self.sendMessage(receiver, response)
         elif command == 'broadcast':
 
             response = " ".join(args[1:])
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import bisect
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+# Upper bounds of the histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+#####
+#
+# Accumulates the monotonic time of all blocks it wraps. Used for phases
+# which are interleaved with others, like the parsing and the database
+# writes inside the same loop.
+#
+#####
+
+class Stopwatch(object):
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds += time.monotonic() - self.started
+        self.started = None
+        return False
+
+#####
+#
+# Cumulative buckets, count and sum in the prometheus sense plus the
+# last :window observations for the rolling quantiles.
+#
+#####
+
+class Histogram(object):
+
+    def __init__(self, buckets = BUCKETS, window = 100):
+        self.buckets = buckets
+        # One more for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.last = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+        self.recent.append(value)
+
+    def quantile(self, q):
+
+        if not len(self.recent):
+            return 0.0
+
+        values = sorted(self.recent)
+
+        # Nearest rank
+        return values[max(0, math.ceil(q * len(values)) - 1)]
+
+    def summary(self):
+
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'last': self.last,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'max': max(self.recent) if len(self.recent) else 0.0
+        }
+
+#####
+#
+# Registry for the counters, gauges and histograms of the bot. Each metric
+# is identified by its name and its labels.
+#
+#####
+
+class Metrics(object):
+
+    def __init__(self, prefix = 'smartnode', buckets = BUCKETS, window = 100):
+        self.sem = threading.Lock()
+        self.prefix = prefix
+        self.buckets = buckets
+        self.window = window
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def increment(self, name, value = 1, **labels):
+
+        key = self.key(name, labels)
+
+        self.sem.acquire()
+        self.counters[key] = self.counters.get(key, 0) + value
+        self.sem.release()
+
+    def gauge(self, name, value, **labels):
+
+        self.sem.acquire()
+        self.gauges[self.key(name, labels)] = value
+        self.sem.release()
+
+    def observe(self, name, value, **labels):
+
+        key = self.key(name, labels)
+
+        self.sem.acquire()
+
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self.buckets, self.window)
+
+        self.histograms[key].observe(value)
+
+        self.sem.release()
+
+    ######
+    # Observe the monotonic time of the wrapped block in the histogram
+    # :name, also if it raised.
+    ######
+    @contextmanager
+    def timer(self, name, **labels):
+
+        watch = Stopwatch()
+
+        try:
+            with watch:
+                yield watch
+        finally:
+            self.observe(name, watch.seconds, **labels)
+
+    def counter(self, name, **labels):
+
+        self.sem.acquire()
+        value = self.counters.get(self.key(name, labels), 0)
+        self.sem.release()
+
+        return value
+
+    ######
+    # Copy of the current state for the admin command. Histograms are
+    # reduced to count, sum, last, p50, p90 and max of the rolling window.
+    ######
+    def summary(self):
+
+        self.sem.acquire()
+
+        result = {
+            'uptime': time.time() - self.started,
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'histograms': {key: histogram.summary() for key, histogram in self.histograms.items()}
+        }
+
+        self.sem.release()
+
+        return result
+
+    def labelString(self, labels, extra = ()):
+
+        labels = list(labels) + list(extra)
+
+        if not len(labels):
+            return ''
+
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in labels) + '}'
+
+    ######
+    # Text exposition format of prometheus.
+    ######
+    def render(self):
+
+        lines = []
+        written = set()
+
+        def header(name, kind):
+
+            if name not in written:
+                written.add(name)
+                lines.append("# TYPE {} {}".format(name, kind))
+
+        self.sem.acquire()
+
+        for (name, labels), value in sorted(self.counters.items()):
+            name = "{}_{}".format(self.prefix, name)
+            header(name, 'counter')
+            lines.append("{}{} {}".format(name, self.labelString(labels), value))
+
+        for (name, labels), value in sorted(self.gauges.items()):
+            name = "{}_{}".format(self.prefix, name)
+            header(name, 'gauge')
+            lines.append("{}{} {}".format(name, self.labelString(labels), value))
+
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda x: x[0]):
+
+            name = "{}_{}".format(self.prefix, name)
+            header(name, 'histogram')
+
+            cumulative = 0
+
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(name, self.labelString(labels, [('le', bound)]), cumulative))
+
+            lines.append("{}_sum{} {}".format(name, self.labelString(labels), histogram.sum))
+            lines.append("{}_count{} {}".format(name, self.labelString(labels), histogram.count))
+
+        self.sem.release()
+
+        return "\n".join(lines) + "\n"
+
+#####
+#
+# Optional HTTP endpoint which serves the output of :render at /metrics
+# for prometheus to scrape.
+#
+#####
+
+class MetricsServer(object):
+
+    def __init__(self, render, host = '127.0.0.1', port = 9101):
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                try:
+                    data = render().encode('utf-8')
+                except Exception as e:
+                    logger.error("Could not render the metrics", exc_info=e)
+                    self.send_error(500)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+
+        logger.info("Serve the metrics at {}:{}".format(*self.server.server_address[:2]))
+
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+
+        if self.thread:
+            self.thread.join()
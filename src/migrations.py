@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import logging
+
+logger = logging.getLogger("migrations")
+
+#####
+#
+# Versioned schema migrations for the databases. The schema version is
+# stored in PRAGMA user_version, each step brings the schema to its
+# version. The pending steps run in one transaction at startup, a
+# failing step leaves the database untouched.
+#
+# The first step creates the schema of v1.1. Unversioned databases only
+# get migrated if their tables match the layout of v1.1, databases of
+# v1.0 need misc/db_migration_1.1/migrate.py first.
+#
+#####
+
+class MigrationError(RuntimeError):
+    pass
+
+######
+# Raise a MigrationError if one of the tables of :layout, a dict of table
+# name => columns, exists with other columns.
+######
+def checkLayout(cursor, layout, name):
+
+    for table, columns in layout.items():
+
+        cursor.execute("PRAGMA table_info(`{}`)".format(table))
+        existing = [row[1] for row in cursor.fetchall()]
+
+        if len(existing) and sorted(existing) != sorted(columns):
+            raise MigrationError("Unknown layout of the table {} in the {} database: {}. "
+                                 "Databases of v1.0 need misc/db_migration_1.1/migrate.py first.".format(table, name, ", ".join(existing)))
+
+######
+# Apply the steps of :migrations which are newer than the version of the
+# database behind the ThreadedSQLite :storage. :layout are the tables of
+# the first step to check unversioned databases. Returns the new version.
+######
+def migrate(storage, migrations, layout, name):
+
+    latest = migrations[-1][0]
+
+    with storage.write() as db:
+
+        db.cursor.execute("PRAGMA user_version")
+        version = db.cursor.fetchone()[0]
+
+        if version == 0:
+            checkLayout(db.cursor, layout, name)
+
+        if version > latest:
+            logger.warning("{} database has version {}, newer than the known {}".format(name, version, latest))
+            return version
+
+        if version == latest:
+            return version
+
+        # DDL doesn't open a transaction by itself
+        db.cursor.execute("BEGIN")
+
+        for target, description, step in migrations:
+
+            if target <= version:
+                continue
+
+            logger.info("Migrate the {} database to version {}: {}".format(name, target, description))
+
+            step(db.cursor)
+
+        db.cursor.execute("PRAGMA user_version = {}".format(latest))
+
+    return latest
+
+#####
+## Bot database
+#####
+
+def botSchema(cursor):
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS `users` (\
+        `id` INTEGER NOT NULL PRIMARY KEY,\
+        `name` INTEGER,\
+        `status_n` INTEGER,\
+        `reward_n` INTEGER,\
+        `timeout_n` INTEGER,\
+        `network_n` INTEGER,\
+        `detail_n` INTEGER,\
+        `last_activity` INTEGER\
+    )")
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS `nodes` (\
+        `id` INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,\
+        `user_id` INTEGER,\
+        `collateral` STRING NOT NULL,\
+        `name` TEXT NOT NULL\
+    )")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS `node_id` ON `nodes` (`collateral`)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS `node_user` ON `nodes` (`user_id`)")
+
+def botUniqueNodes(cursor):
+
+    # Keep the first entry of each user/collateral pair
+    cursor.execute("DELETE FROM nodes WHERE id NOT IN\
+                    (SELECT MIN(id) FROM nodes GROUP BY collateral, user_id)")
+
+    if cursor.rowcount > 0:
+        logger.warning("Removed {} duplicated user nodes".format(cursor.rowcount))
+
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS `node_collateral_user` ON `nodes` (`collateral`, `user_id`)")
+    # Covered by the unique index
+    cursor.execute("DROP INDEX IF EXISTS `node_id`")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS `user_network` ON `users` (`network_n`)")
+
+botLayout = {
+    'users': ['id', 'name', 'status_n', 'reward_n', 'timeout_n', 'network_n', 'detail_n', 'last_activity'],
+    'nodes': ['id', 'user_id', 'collateral', 'name']
+}
+
+botMigrations = [
+    (1, "schema of v1.1", botSchema),
+    (2, "unique user nodes, network notification index", botUniqueNodes),
+]
+
+#####
+## Node database
+#####
+
+def nodeSchema(cursor):
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS `nodes` (\
+        `collateral` TEXT NOT NULL PRIMARY KEY,\
+        `collateral_block` INTEGER,\
+        `payee` TEXT,\
+        `status` TEXT,\
+        `activeseconds` INTEGER,\
+        `last_paid_block` INTEGER,\
+        `last_paid_time` INTEGER,\
+        `last_seen` INTEGER,\
+        `protocol` INTEGER,\
+        `timeout` INTEGER,\
+        `ip` TEXT\
+    )")
+
+def nodeIpIndex(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS `node_ip` ON `nodes` (`ip`)")
+
+nodeLayout = {
+    'nodes': ['collateral', 'collateral_block', 'payee', 'status', 'activeseconds', 'last_paid_block',
+              'last_paid_time', 'last_seen', 'protocol', 'timeout', 'ip']
+}
+
+nodeMigrations = [
+    (1, "schema of v1.1", nodeSchema),
+    (2, "ip index", nodeIpIndex),
+]
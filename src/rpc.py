@@ -0,0 +1,1017 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import subprocess
+import json
+import time
+import re
+import types
+import base64
+import socket
+import codecs
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("rpc")
+
+#####
+#
+# Raised if the daemon answered with an error object or if the
+# transport to the daemon failed. The transport errors are flagged
+# to allow the callers to fall back to another path.
+#
+#####
+
+class RPCError(RuntimeError):
+
+    def __init__(self, message, code = None, transport = False):
+        super().__init__(message)
+        self.code = code
+        self.transport = transport
+
+#####
+#
+# Incremental parser for a json object like the result of
+# "smartnodelist full". Reads the data in chunks with :read and yields
+# the members one by one, so the whole response never needs to be in
+# memory at once. Only the member values get decoded by the json module.
+#
+#####
+
+class ObjectStream(object):
+
+    whitespace = re.compile(r'[ \t\n\r]*')
+    numberChars = '0123456789.eE+-'
+
+    def __init__(self, read, chunkSize = 65536):
+
+        self.read = read
+        self.chunkSize = chunkSize
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+
+        if self.eof:
+            raise ValueError("Unexpected end of the json data")
+
+        chunk = self.read(self.chunkSize)
+
+        if not chunk:
+            self.eof = True
+            data = self.decoder.decode(b'', final=True)
+        else:
+            data = self.decoder.decode(chunk)
+
+        # Drop the consumed part
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+    ######
+    # Return the next non whitespace character without consuming it,
+    # None at the end of the data.
+    ######
+    def peek(self):
+
+        while True:
+
+            self.pos = self.whitespace.match(self.buffer, self.pos).end()
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if self.eof:
+                return None
+
+            self.fill()
+
+    def expect(self, char):
+
+        if self.peek() != char:
+            raise ValueError("Expected '{}' at {}".format(char, self.pos))
+
+        self.pos += 1
+
+    ######
+    # Decode the next value. A value which ends at the end of the buffer
+    # or in front of a number character might be a truncated number, so it
+    # only gets accepted if the stream is done in this case.
+    ######
+    def value(self):
+
+        self.peek()
+
+        while True:
+
+            try:
+                result, end = self.json.raw_decode(self.buffer, self.pos)
+            except ValueError:
+
+                if self.eof:
+                    raise
+
+                self.fill()
+                continue
+
+            if self.eof or (end < len(self.buffer) and self.buffer[end] not in self.numberChars):
+                self.pos = end
+                return result
+
+            self.fill()
+
+    ######
+    # Yield the (key, value) members of the object at the current position.
+    # Members with a key in :nested which are objects themselves are
+    # yielded as members() generator which must be consumed before the
+    # iteration continues.
+    ######
+    def members(self, nested = ()):
+
+        self.expect('{')
+
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+
+            key = self.value()
+
+            if not isinstance(key, str):
+                raise ValueError("Invalid object key {}".format(key))
+
+            self.expect(':')
+
+            if key in nested and self.peek() == '{':
+                yield key, self.members()
+            else:
+                yield key, self.value()
+
+            char = self.peek()
+            self.pos += 1
+
+            if char == '}':
+                return
+            elif char != ',':
+                raise ValueError("Expected ',' or '}}' at {}".format(self.pos))
+
+    def finish(self):
+
+        if self.peek() != None:
+            raise ValueError("Unexpected data after the json object")
+
+######
+# Yield the members of the "result" object of a JSON-RPC response which
+# gets read with :read. Raises RPCError if the response has an error.
+######
+def streamResult(read):
+
+    stream = ObjectStream(read)
+    envelope = {}
+
+    try:
+
+        for key, value in stream.members(nested = ('result',)):
+
+            if isinstance(value, types.GeneratorType):
+
+                for member in value:
+                    yield member
+
+                value = {}
+
+            envelope[key] = value
+
+        stream.finish()
+
+    except ValueError as e:
+        raise RPCError("Invalid response: {}".format(e), transport = True)
+
+    if envelope.get('error'):
+        raise RPCError(envelope['error'].get('message'), code = envelope['error'].get('code'))
+
+    if not isinstance(envelope.get('result'), dict):
+        raise RPCError("Invalid response, no result object", transport = True)
+
+#####
+#
+# Latency and error counter per daemon call.
+#
+#####
+
+class CallStats(object):
+
+    def __init__(self):
+        self.sem = threading.Lock()
+        self.methods = {}
+
+    def add(self, method, seconds, error = False):
+
+        self.sem.acquire()
+
+        if method not in self.methods:
+            self.methods[method] = {'calls': 0, 'errors': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
+
+        entry = self.methods[method]
+        entry['calls'] += 1
+        entry['total'] += seconds
+        entry['last'] = seconds
+
+        if seconds > entry['max']:
+            entry['max'] = seconds
+
+        if error:
+            entry['errors'] += 1
+
+        self.sem.release()
+
+    def summary(self):
+
+        self.sem.acquire()
+
+        result = {}
+
+        for method, entry in self.methods.items():
+            result[method] = dict(entry)
+            result[method]['avg'] = entry['total'] / entry['calls'] if entry['calls'] else 0.0
+
+        self.sem.release()
+
+        return result
+
+#####
+#
+# JSON-RPC client for the smartcashd with a pool of keep-alive
+# connections. Avoids the process spawn of the smartcash-cli for
+# every single call.
+#
+#####
+
+class SmartCashRPC(object):
+
+    def __init__(self, host, port, user, password, timeout = 30, poolSize = 4):
+
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.poolSize = poolSize
+
+        credentials = "{}:{}".format(user, password).encode('utf-8')
+        self.auth = "Basic " + base64.b64encode(credentials).decode('ascii')
+
+        # Idle connections ready for the next call
+        self.idle = []
+        self.idleSem = threading.Lock()
+        # Limits the number of parallel open connections
+        self.slots = threading.BoundedSemaphore(poolSize)
+
+        self.requestId = 0
+        self.stats = CallStats()
+
+    def __str__(self):
+        return "SmartCashRPC {}:{}".format(self.host, self.port)
+
+    def nextId(self):
+
+        self.idleSem.acquire()
+        self.requestId += 1
+        requestId = self.requestId
+        self.idleSem.release()
+
+        return requestId
+
+    def connect(self):
+
+        self.idleSem.acquire()
+
+        connection = self.idle.pop() if len(self.idle) else None
+
+        self.idleSem.release()
+
+        if connection:
+            return connection, True
+
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def recycle(self, connection):
+
+        self.idleSem.acquire()
+        self.idle.append(connection)
+        self.idleSem.release()
+
+    def close(self):
+
+        self.idleSem.acquire()
+
+        for connection in self.idle:
+            connection.close()
+
+        self.idle = []
+
+        self.idleSem.release()
+
+    ######
+    # Send the payload and return the connection and the response with
+    # the unread body. Retries once with a fresh connection if a reused
+    # keep-alive connection was closed by the daemon in the meantime.
+    # Requires a slot.
+    ######
+    def send(self, payload, timeout = None):
+
+        timeout = timeout if timeout else self.timeout
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Authorization': self.auth,
+                   'Content-Type': 'application/json',
+                   'Connection': 'keep-alive'}
+
+        for attempt in range(2):
+
+            connection, reused = self.connect()
+            connection.timeout = timeout
+
+            if connection.sock:
+                connection.sock.settimeout(timeout)
+
+            try:
+
+                connection.request('POST', '/', body, headers)
+                response = connection.getresponse()
+
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+
+                connection.close()
+
+                if reused and attempt == 0:
+                    logger.debug("{} stale connection, retry".format(self))
+                    continue
+
+                raise RPCError("Connection lost: {}".format(e), transport = True)
+
+            except (socket.timeout, OSError, http.client.HTTPException) as e:
+                connection.close()
+                raise RPCError("Request failed: {}".format(e), transport = True)
+
+            if response.status == 401:
+                connection.close()
+                raise RPCError("Authorization failed", code = 401, transport = True)
+
+            return connection, response
+
+    ######
+    # Return the connection to the pool if the response was read completely.
+    ######
+    def finish(self, connection, response):
+
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self.recycle(connection)
+
+    ######
+    # Send the payload and return the decoded json response.
+    ######
+    def post(self, payload, timeout = None):
+
+        self.slots.acquire()
+
+        try:
+
+            connection, response = self.send(payload, timeout)
+
+            try:
+                data = response.read()
+            except (socket.timeout, OSError, http.client.HTTPException) as e:
+                connection.close()
+                raise RPCError("Request failed: {}".format(e), transport = True)
+
+            self.finish(connection, response)
+
+            try:
+                return json.loads(data.decode('utf-8'))
+            except ValueError as e:
+                raise RPCError("Invalid response ({}): {}".format(response.status, e), transport = True)
+
+        finally:
+            self.slots.release()
+
+    ######
+    # Call the method :method and yield the (key, value) members of its
+    # result object while the response gets received. Meant for large
+    # results like "smartnodelist full".
+    ######
+    def stream(self, method, *params, timeout = None):
+
+        start = time.monotonic()
+        error = True
+
+        self.slots.acquire()
+
+        try:
+
+            connection, response = self.send({'jsonrpc': '1.0',
+                                              'id': self.nextId(),
+                                              'method': method,
+                                              'params': list(params)}, timeout)
+
+            try:
+
+                for member in streamResult(response.read):
+                    yield member
+
+            except (socket.timeout, OSError, http.client.HTTPException) as e:
+                raise RPCError("Request failed: {}".format(e), transport = True)
+
+            finally:
+                self.finish(connection, response)
+
+            error = False
+
+        finally:
+            self.slots.release()
+            self.stats.add(method, time.monotonic() - start, error)
+
+    ######
+    # Call the method :method with the parameters :params and return
+    # the result or raise an RPCError.
+    ######
+    def call(self, method, *params, timeout = None):
+
+        start = time.monotonic()
+        error = True
+
+        try:
+
+            response = self.post({'jsonrpc': '1.0',
+                                  'id': self.nextId(),
+                                  'method': method,
+                                  'params': list(params)}, timeout)
+
+            if response.get('error'):
+                raise RPCError(response['error'].get('message'), code = response['error'].get('code'))
+
+            error = False
+
+            return response.get('result')
+
+        finally:
+            self.stats.add(method, time.monotonic() - start, error)
+
+    ######
+    # Send all calls :calls, a list of (method, param0, ..., paramN) tuples,
+    # as JSON-RPC batches of :chunkSize. Returns a list with the result or an
+    # RPCError for each call in the order of :calls.
+    ######
+    def batch(self, calls, chunkSize = 500, timeout = None):
+
+        results = []
+
+        for offset in range(0, len(calls), chunkSize):
+
+            chunk = calls[offset:offset + chunkSize]
+            ids = {}
+            payload = []
+
+            for position, call in enumerate(chunk):
+                requestId = self.nextId()
+                ids[requestId] = position
+                payload.append({'jsonrpc': '1.0',
+                                'id': requestId,
+                                'method': call[0],
+                                'params': list(call[1:])})
+
+            start = time.monotonic()
+
+            try:
+                response = self.post(payload, timeout)
+            except RPCError:
+                self.stats.add('batch', time.monotonic() - start, True)
+                raise
+
+            self.stats.add('batch', time.monotonic() - start)
+
+            if not isinstance(response, list):
+                error = response.get('error') if isinstance(response, dict) else None
+                raise RPCError("Invalid batch response {}".format(error), transport = True)
+
+            chunkResults = [RPCError("No response")] * len(chunk)
+
+            for entry in response:
+
+                position = ids.get(entry.get('id'))
+
+                if position == None:
+                    continue
+
+                if entry.get('error'):
+                    chunkResults[position] = RPCError(entry['error'].get('message'), code = entry['error'].get('code'))
+                else:
+                    chunkResults[position] = entry.get('result')
+
+            results += chunkResults
+
+        return results
+
+    def latency(self):
+        return self.stats.summary()
+
+#####
+#
+# Fallback which executes the smartcash-cli for every call.
+#
+#####
+
+class SmartCashCLI(object):
+
+    def __init__(self, binary = 'smartcash-cli', timeout = 120, workers = 8):
+        self.binary = binary
+        self.timeout = timeout
+        self.workers = workers
+        self.stats = CallStats()
+
+    def __str__(self):
+        return "SmartCashCLI {}".format(self.binary)
+
+    def call(self, method, *params, timeout = None):
+
+        start = time.monotonic()
+        error = True
+
+        # The cli expects strings as they are and everything else json encoded.
+        args = [self.binary, method] + list(map(lambda x: x if isinstance(x, str) else json.dumps(x), params))
+
+        try:
+
+            try:
+                result = subprocess.check_output(args, timeout = timeout if timeout else self.timeout)
+            except subprocess.CalledProcessError as e:
+                raise RPCError("{} failed with {}".format(method, e.returncode), code = e.returncode)
+            except (subprocess.TimeoutExpired, OSError) as e:
+                raise RPCError("{} failed: {}".format(method, e), transport = True)
+
+            error = False
+
+        finally:
+            self.stats.add(method, time.monotonic() - start, error)
+
+        try:
+            return json.loads(result.decode('utf-8'))
+        except ValueError:
+            # Some calls return plain values
+            return result.decode('utf-8').strip()
+
+    def latency(self):
+        return self.stats.summary()
+
+    ######
+    # Run the cli and yield the (key, value) members of the result object
+    # while the output gets read from the pipe.
+    ######
+    def stream(self, method, *params, timeout = None):
+
+        start = time.monotonic()
+        error = True
+
+        args = [self.binary, method] + list(map(lambda x: x if isinstance(x, str) else json.dumps(x), params))
+
+        try:
+            process = subprocess.Popen(args, stdout = subprocess.PIPE)
+        except OSError as e:
+            self.stats.add(method, time.monotonic() - start, error)
+            raise RPCError("{} failed: {}".format(method, e), transport = True)
+
+        # Enforce the timeout for the whole stream
+        killer = threading.Timer(timeout if timeout else self.timeout, process.kill)
+        killer.start()
+
+        try:
+
+            stream = ObjectStream(process.stdout.read)
+            invalid = None
+            killed = False
+
+            try:
+
+                for member in stream.members():
+                    yield member
+
+                stream.finish()
+
+            except ValueError as e:
+
+                invalid = e
+
+                if process.poll() == None:
+                    process.kill()
+                    killed = True
+
+            returncode = process.wait()
+
+            if returncode > 0:
+                raise RPCError("{} failed with {}".format(method, returncode), code = returncode)
+            elif returncode < 0 and not killed:
+                raise RPCError("{} killed after timeout".format(method), transport = True)
+            elif invalid:
+                raise RPCError("{} invalid output: {}".format(method, invalid))
+
+            error = False
+
+        finally:
+
+            killer.cancel()
+
+            if process.poll() == None:
+                process.kill()
+                process.wait()
+
+            process.stdout.close()
+
+            self.stats.add(method, time.monotonic() - start, error)
+
+    ######
+    # Run the calls :calls with a bounded number of parallel cli processes.
+    # Same result layout as SmartCashRPC.batch.
+    ######
+    def batch(self, calls, timeout = None):
+
+        def single(call):
+
+            try:
+                return self.call(*call, timeout = timeout)
+            except RPCError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(single, calls))
+
+#####
+#
+# Health state of one daemon of the RPCPool.
+#
+#####
+
+class Endpoint(object):
+
+    def __init__(self, client):
+
+        self.client = client
+        self.name = "{}:{}".format(client.host, client.port)
+        # Moving average of the call latency in seconds
+        self.latency = None
+        self.failures = 0
+        self.retryAt = 0
+        self.synced = False
+        self.blocks = -1
+        self.lagging = False
+
+    def __str__(self):
+        return self.name
+
+    def available(self, now):
+        return self.retryAt <= now
+
+    def healthy(self, now):
+        return self.available(now) and self.synced and not self.lagging
+
+    def succeeded(self, seconds = None):
+
+        self.failures = 0
+        self.retryAt = 0
+
+        if seconds == None:
+            return
+
+        if self.latency == None:
+            self.latency = seconds
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * seconds
+
+    def failed(self, now, minRetry, maxRetry):
+
+        self.failures += 1
+        self.retryAt = now + min(maxRetry, minRetry * 2 ** (self.failures - 1))
+
+    def status(self):
+        return {'endpoint': self.name,
+                'synced': self.synced,
+                'blocks': self.blocks,
+                'lagging': self.lagging,
+                'latency': self.latency,
+                'failures': self.failures,
+                'retry_at': self.retryAt}
+
+######
+# True if the "snsync status" result :status reports a fully synced daemon.
+######
+def isSynced(status):
+
+    return isinstance(status, dict) and\
+           bool(status.get('IsBlockchainSynced') and\
+                status.get('IsMasternodeListSynced') and\
+                status.get('IsWinnersListSynced'))
+
+#####
+#
+# Set of SmartCashRPC clients for multiple daemons with the same interface
+# as a single one. The endpoints get health checked every :checkInterval
+# seconds (sync state, block height, latency) in parallel, each probe has
+# :checkTimeout seconds. The calls go to the best synced one and fail over
+# to the next one if the transport fails, if the daemon is warming up or
+# if a "snsync status" call reports it unsynced. Daemons more than :maxLag
+# blocks behind the highest one are lagging and only used as last resort.
+#
+# The endpoint states and the selection are guarded by the sem, the calls
+# themselves run without it.
+#
+#####
+
+class RPCPool(object):
+
+    # RPC_IN_WARMUP of the daemon, e.g. while it loads the block index
+    WARMUP_ERROR = -28
+
+    def __init__(self, clients, checkInterval = 30, checkTimeout = 5, maxLag = 2, minRetry = 10, maxRetry = 300):
+
+        self.endpoints = list(map(Endpoint, clients))
+        self.checkInterval = checkInterval
+        self.checkTimeout = checkTimeout
+        self.maxLag = maxLag
+        self.minRetry = minRetry
+        self.maxRetry = maxRetry
+
+        self.sem = threading.Lock()
+        # Held while a health check runs, the other threads don't wait for it
+        self.checkSem = threading.Lock()
+        self.current = self.endpoints[0] if len(self.endpoints) else None
+        self.lastCheck = 0
+
+    def __str__(self):
+        return "RPCPool [{}]".format(", ".join(map(str, self.endpoints)))
+
+    def failover(self, error):
+        return error.transport or error.code == self.WARMUP_ERROR
+
+    ######
+    # Request the sync state and the block height of :endpoint. Returns
+    # (error, status, blocks, seconds).
+    ######
+    def probe(self, endpoint):
+
+        start = time.monotonic()
+
+        try:
+            status, blocks = endpoint.client.batch([('snsync', 'status'), ('getblockcount',)], timeout = self.checkTimeout)
+        except RPCError as e:
+            return e, None, None, None
+
+        if isinstance(status, RPCError) or isinstance(blocks, RPCError):
+            return status if isinstance(status, RPCError) else blocks, None, None, None
+
+        return None, status, blocks, time.monotonic() - start
+
+    ######
+    # Probe all reachable endpoints in parallel and select the best one.
+    ######
+    def check(self):
+
+        now = time.time()
+
+        self.sem.acquire()
+        endpoints = [x for x in self.endpoints if x.available(now)]
+        self.sem.release()
+
+        results = []
+
+        if len(endpoints):
+            with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+                results = list(executor.map(self.probe, endpoints))
+
+        self.sem.acquire()
+
+        try:
+
+            for endpoint, (error, status, blocks, seconds) in zip(endpoints, results):
+
+                if error:
+
+                    logger.warning("{} health check failed: {}".format(endpoint, error))
+
+                    if self.failover(error):
+                        endpoint.failed(now, self.minRetry, self.maxRetry)
+                    else:
+                        endpoint.synced = False
+
+                    continue
+
+                endpoint.succeeded(seconds)
+                endpoint.synced = isSynced(status)
+                endpoint.blocks = blocks
+
+            # Cross check the heights of the responsive endpoints
+            heights = [x.blocks for x in self.endpoints if x.available(now) and x.blocks >= 0]
+            highest = max(heights) if len(heights) else -1
+
+            for endpoint in self.endpoints:
+
+                lagging = endpoint.blocks < highest - self.maxLag
+
+                if lagging and not endpoint.lagging:
+                    logger.warning("{} is lagging, {} blocks behind".format(endpoint, highest - endpoint.blocks))
+                elif not lagging and endpoint.lagging:
+                    logger.info("{} caught up".format(endpoint))
+
+                endpoint.lagging = lagging
+
+            self.lastCheck = now
+
+            best = self.ranked(now)
+
+            if len(best) and best[0] != self.current:
+                logger.info("Switch from {} to {}".format(self.current, best[0]))
+                self.current = best[0]
+
+        finally:
+            self.sem.release()
+
+    ######
+    # All endpoints in the order of the preference, the healthy ones by
+    # latency first. The current endpoint stays first as long as it is
+    # healthy to keep the calls of a cycle on one daemon.
+    ######
+    def ranked(self, now):
+
+        def score(endpoint):
+
+            if endpoint.healthy(now):
+                group = 0
+            elif endpoint.available(now):
+                group = 1
+            else:
+                group = 2
+
+            current = 0 if endpoint == self.current and group == 0 else 1
+
+            return (group, current, endpoint.latency if endpoint.latency != None else float('inf'))
+
+        return sorted(self.endpoints, key = score)
+
+    def select(self):
+
+        # Only one thread checks, the others go on with the last state
+        if time.time() - self.lastCheck >= self.checkInterval and self.checkSem.acquire(False):
+
+            try:
+
+                if time.time() - self.lastCheck >= self.checkInterval:
+                    self.check()
+
+            finally:
+                self.checkSem.release()
+
+        self.sem.acquire()
+        ranked = self.ranked(time.time())
+        self.sem.release()
+
+        return ranked
+
+    def succeeded(self, endpoint, seconds = None):
+
+        self.sem.acquire()
+
+        endpoint.succeeded(seconds)
+
+        if endpoint != self.current:
+            logger.warning("Failover from {} to {}".format(self.current, endpoint))
+            self.current = endpoint
+
+        self.sem.release()
+
+    def failed(self, endpoint, error):
+
+        logger.warning("{} failed: {}".format(endpoint, error))
+
+        self.sem.acquire()
+        endpoint.failed(time.time(), self.minRetry, self.maxRetry)
+        self.sem.release()
+
+    def unsynced(self, endpoint):
+
+        logger.warning("{} is not synced".format(endpoint))
+
+        self.sem.acquire()
+        endpoint.synced = False
+        self.sem.release()
+
+    ######
+    # Run :function with the client of the best endpoint, try the next
+    # one if it failed with a transport error. If :valid rejects a result
+    # the next one gets asked too, the first rejected result is returned
+    # if no endpoint has a valid one. The latency only gets tracked for
+    # single calls if :measure is set.
+    ######
+    def run(self, function, measure = False, valid = None):
+
+        error = None
+        rejected = None
+
+        for endpoint in self.select():
+
+            start = time.monotonic()
+
+            try:
+                result = function(endpoint.client)
+            except RPCError as e:
+
+                if not self.failover(e):
+                    self.succeeded(endpoint)
+                    raise
+
+                self.failed(endpoint, e)
+                error = e
+                continue
+
+            if valid and not valid(result):
+
+                self.unsynced(endpoint)
+
+                if rejected == None:
+                    rejected = (result,)
+
+                continue
+
+            self.succeeded(endpoint, time.monotonic() - start if measure else None)
+
+            return result
+
+        if rejected != None:
+            return rejected[0]
+
+        raise error if error else RPCError("No endpoint configured", transport = True)
+
+    def call(self, method, *params, timeout = None):
+
+        # An unsynced daemon is a reason to fail over
+        valid = isSynced if method == 'snsync' and params == ('status',) else None
+
+        return self.run(lambda client: client.call(method, *params, timeout = timeout), True, valid)
+
+    def batch(self, calls, chunkSize = 500, timeout = None):
+        return self.run(lambda client: client.batch(calls, chunkSize, timeout))
+
+    ######
+    # Fails over only before the first member was received.
+    ######
+    def stream(self, method, *params, timeout = None):
+
+        error = None
+
+        for endpoint in self.select():
+
+            started = False
+
+            try:
+
+                for member in endpoint.client.stream(method, *params, timeout = timeout):
+                    started = True
+                    yield member
+
+            except RPCError as e:
+
+                if started or not self.failover(e):
+                    raise
+
+                self.failed(endpoint, e)
+                error = e
+                continue
+
+            self.succeeded(endpoint)
+
+            return
+
+        raise error if error else RPCError("No endpoint configured", transport = True)
+
+    def latency(self):
+
+        result = {}
+
+        for endpoint in self.endpoints:
+            for method, entry in endpoint.client.latency().items():
+                result["{} {}".format(endpoint, method)] = entry
+
+        return result
+
+    def status(self):
+
+        self.sem.acquire()
+        result = list(map(lambda x: x.status(), self.endpoints))
+        self.sem.release()
+
+        return result
+
+    def close(self):
+
+        for endpoint in self.endpoints:
+            endpoint.client.close()
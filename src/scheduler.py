@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+import math
+
+logger = logging.getLogger("scheduler")
+
+#####
+#
+# Runs :function in one worker thread, so two cycles can never overlap.
+#
+# The healthy cycles follow a fixed grid of :interval seconds from the
+# cycle starts, a slow cycle doesn't push the later ones back. If a cycle
+# runs over one or more slots the next one starts right away and the
+# missed slots get skipped. If :function returns False or raises, the
+# next attempt waits :interval * 2^failures seconds, up to :maxBackoff.
+#
+# A trigger (e.g. a new block) runs the next cycle as soon as the
+# current one is done without changing the grid.
+#
+#####
+
+class CycleScheduler(object):
+
+    def __init__(self, function, interval, maxBackoff = 600, metrics = None, name = "CycleScheduler"):
+
+        self.function = function
+        self.interval = interval
+        self.maxBackoff = maxBackoff
+        self.metrics = metrics
+        self.name = name
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.triggered = False
+
+        # Monotonic time of the next scheduled cycle
+        self.nextRun = None
+        self.failures = 0
+        # Seconds the last cycle started behind its schedule
+        self.lag = 0.0
+        self.skipped = 0
+
+    def start(self, delay = 0):
+
+        self.condition.acquire()
+        self.running = True
+        self.nextRun = time.monotonic() + delay
+        self.condition.release()
+
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+
+        self.condition.acquire()
+        self.running = False
+        self.condition.notify()
+        self.condition.release()
+
+        if self.thread and self.thread != threading.current_thread():
+            self.thread.join()
+
+    ######
+    # Run a cycle as soon as possible, right after the current one if
+    # there is one running.
+    ######
+    def trigger(self):
+
+        self.condition.acquire()
+        self.triggered = True
+        self.condition.notify()
+        self.condition.release()
+
+    def backoff(self):
+        return min(self.maxBackoff, self.interval * 2 ** self.failures)
+
+    ######
+    # Block until the next cycle is due. Returns None if the scheduler
+    # got stopped, otherwise if the cycle was triggered.
+    ######
+    def wait(self):
+
+        self.condition.acquire()
+
+        try:
+
+            while self.running and not self.triggered:
+
+                remaining = self.nextRun - time.monotonic()
+
+                if remaining <= 0:
+                    break
+
+                self.condition.wait(remaining)
+
+            if not self.running:
+                return None
+
+            triggered = self.triggered
+            self.triggered = False
+
+            return triggered
+
+        finally:
+            self.condition.release()
+
+    ######
+    # Calculate the start of the next cycle after a cycle which started
+    # at :started (monotonic).
+    ######
+    def schedule(self, started, triggered, healthy):
+
+        now = time.monotonic()
+        missed = 0
+        delay = 0
+
+        if healthy:
+
+            self.failures = 0
+
+            # A triggered cycle ahead of its slot didn't use it up
+            if triggered and self.nextRun > started:
+                nextRun = self.nextRun
+            else:
+                nextRun = self.nextRun + self.interval
+
+            if nextRun <= now:
+                # Start right away for the last missed slot
+                missed = math.floor((now - nextRun) / self.interval)
+                nextRun += missed * self.interval
+
+        else:
+
+            self.failures += 1
+
+            delay = self.backoff()
+            nextRun = started + delay
+
+            logger.warning("Cycle failed {} time(s), retry in {}s".format(self.failures, delay))
+
+        self.condition.acquire()
+        self.nextRun = nextRun
+        self.condition.release()
+
+        self.skipped += missed
+
+        if self.metrics:
+            self.metrics.increment('cycles_skipped_total', missed)
+            self.metrics.gauge('cycle_failures', self.failures)
+            self.metrics.gauge('cycle_backoff_seconds', delay)
+
+        if missed:
+            logger.warning("Cycle took {:.1f}s, skipped {} slot(s)".format(now - started, missed))
+
+    def run(self):
+
+        while True:
+
+            triggered = self.wait()
+
+            if triggered == None:
+                return
+
+            started = time.monotonic()
+
+            # Triggered cycles run ahead of the schedule
+            self.lag = 0.0 if triggered else max(0.0, started - self.nextRun)
+
+            if self.metrics:
+                self.metrics.observe('cycle_lag_seconds', self.lag)
+                self.metrics.gauge('cycle_lag_last_seconds', self.lag)
+
+            healthy = False
+
+            try:
+                healthy = self.function()
+            except Exception as e:
+                logger.error("Cycle exception", exc_info=e)
+
+            self.schedule(started, triggered, healthy)
@@ -1,13 +1,22 @@
 import os, stat, sys
+import gc
+import hashlib
 import re
-import subprocess
-import json
 import time
 import csv
 from src import util
+from src.rpc import SmartCashCLI, RPCError
+from src.database import NodeBatch, NodeWriter
+from src.metrics import Metrics, Stopwatch
+from src.scheduler import CycleScheduler
 import logging
 import threading
+import bisect
+import heapq
+import copy
+import math
 import re
+import numpy
 
 # Index assignment of the "smartnodelist full"
 STATUS_INDEX = 0
@@ -26,18 +35,39 @@ POS_UPDATE_REQUIRED = -3
 POS_TOO_NEW = -4
 POS_COLLATERAL_AGE = -5
 
+# Calculated state of the nodes in the payout queue
+STATE_QUEUED = 0
+
 
 logger = logging.getLogger("smartnodes")
 
 transactionRawCheck = re.compile("COutPoint\([\d\a-f]{64},.[\d]{1,}\)")
 transactionStringCheck = re.compile("[\d\a-f]{64}-[\d]{1,}")
 
+# Shared instances of the few distinct protocol versions
+protocols = {}
+
+def internProtocol(protocol):
+    protocol = int(protocol)
+    return protocols.setdefault(protocol, protocol)
+
+######
+# Digest of a nodelist line to detect the changes without keeping the line.
+######
+def lineDigest(raw):
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).digest()
+
 class Transaction(object):
 
+    __slots__ = ('hash', 'index', 'block', 'key')
+
     def __init__(self, txhash, txindex, block):
         self.hash = txhash
         self.index = txindex
         self.block = block
+        # The daemon compares the raw bytes of the uint256 which are stored
+        # in reversed order of the hex string.
+        self.key = (bytes.fromhex(txhash)[::-1], txindex)
 
     def updateBlock(self, block):
         self.block = block
@@ -46,7 +76,8 @@ class Transaction(object):
         return '{0.hash}-{0.index}'.format(self)
 
     def __eq__(self, other):
-        return self.hash == other.hash and\
+        return isinstance(other, Transaction) and\
+                self.hash == other.hash and\
                 self.index == other.index
 
     def __lt__(self, other):
@@ -62,8 +93,9 @@ class Transaction(object):
         # https://github.com/SmartCash/smartcash/blob/1.1.1/src/uint256.h#L45
         # https://github.com/SmartCash/smartcash/blob/1.1.1/src/primitives/transaction.h#L38
         # https://github.com/SmartCash/smartcash/blob/1.1.1/src/primitives/transaction.h#L126
-        compare = util.memcmp(bytes.fromhex(self.hash), bytes.fromhex(other.hash),len(bytes.fromhex(self.hash)))
-        return compare < 0 or ( compare == 0 and self.index < other.index )
+        #
+        # See misc/collateral_sort_test for the verification of the key.
+        return self.key < other.key
 
 
     def __hash__(self):
@@ -84,47 +116,477 @@ class Transaction(object):
             return cls(parts[0], int(parts[1]), -1)
 
 ####
-# Used for the sort of the last paid vector
+# Ordered index of the nodes which are qualified for a payout, sorted like
+# the last paid vector of the daemon. The entries are (lastPaidBlock,
+# collateral key) tuples. They only get moved if the last paid block
+# changed, positions are looked up with a binary search.
 ###
-class LastPaid(object):
+class PayoutQueue(object):
 
-    def __init__(self, lastPaidBlock, transaction):
-        self.transaction = transaction
-        self.lastPaidBlock = lastPaidBlock
+    def __init__(self):
+        self.entries = []
+        self.members = {}
 
-    def __str__(self):
-        return '[{0.lastPaidBlock}] {0.transaction}'.format(self)
+    def __len__(self):
+        return len(self.entries)
 
-    def __lt__(self, other):
+    def __contains__(self, collateral):
+        return collateral in self.members
+
+    ######
+    # Add the node with :collateral or move it if :lastPaidBlock changed.
+    # Returns True if the index got changed.
+    ######
+    def update(self, collateral, lastPaidBlock):
+
+        current = self.members.get(collateral)
+
+        if current != None:
+
+            if current[0] == lastPaidBlock:
+                return False
+
+            self.remove(collateral)
+
+        entry = (lastPaidBlock, collateral.key)
+
+        bisect.insort(self.entries, entry)
+        self.members[collateral] = entry
+
+        return True
+
+    def remove(self, collateral):
+
+        entry = self.members.pop(collateral, None)
+
+        if entry == None:
+            return False
+
+        del self.entries[bisect.bisect_left(self.entries, entry)]
+
+        return True
+
+    def position(self, collateral):
+
+        entry = self.members.get(collateral)
+
+        if entry == None:
+            return None
+
+        return bisect.bisect_left(self.entries, entry) + 1
+
+####
+# Resolves the block heights of collaterals in batches. Resolved heights
+# are cached for the lifetime of the bot, failed lookups will be retried
+# with an exponential backoff.
+###
+class CollateralResolver(object):
+
+    def __init__(self, batchRequest, minRetry = 30, maxRetry = 3600):
+        self.batchRequest = batchRequest
+        self.minRetry = minRetry
+        self.maxRetry = maxRetry
+        self.heights = {}
+        self.retries = {}
+
+    def height(self, collateral):
+        return self.heights.get(collateral, -1)
+
+    def due(self, collateral, now = None):
+
+        if collateral in self.heights:
+            return False
+
+        if collateral not in self.retries:
+            return True
+
+        now = now if now else time.time()
+
+        return self.retries[collateral][1] <= now
+
+    def failed(self, collateral, now):
+
+        attempts = self.retries[collateral][0] + 1 if collateral in self.retries else 1
+        delay = min(self.maxRetry, self.minRetry * 2 ** (attempts - 1))
+
+        self.retries[collateral] = (attempts, now + delay)
+
+        logger.warning("Could not fetch collateral block {}, retry in {}s".format(str(collateral), delay))
+
+    def resolved(self, collateral, height):
+
+        self.heights[collateral] = height
+        self.retries.pop(collateral, None)
+
+    ######
+    # Try to resolve all collaterals of :collaterals which are due. Returns
+    # the number of resolved heights.
+    ######
+    def resolve(self, collaterals):
+
+        now = time.time()
+        pending = list(filter(lambda x: self.due(x, now), set(collaterals)))
+
+        if not len(pending):
+            return 0
+
+        logger.info("Resolve {} collateral heights".format(len(pending)))
+
+        try:
+            rawTxs = self.batchRequest(list(map(lambda x: ('getrawtransaction', x.hash, 1), pending)))
+        except RPCError as e:
+            logger.error("Could not fetch raw transactions {}".format(e))
+            for collateral in pending:
+                self.failed(collateral, now)
+            return 0
+
+        blockHashes = {}
+
+        for collateral, rawTx in zip(pending, rawTxs):
+
+            if isinstance(rawTx, dict) and 'blockhash' in rawTx:
+                blockHashes.setdefault(rawTx['blockhash'], []).append(collateral)
+            else:
+                logger.debug("getrawtransaction {} => {}".format(str(collateral), rawTx))
+                self.failed(collateral, now)
+
+        hashes = list(blockHashes.keys())
+
+        if not len(hashes):
+            return 0
+
+        try:
+            blocks = self.batchRequest(list(map(lambda x: ('getblock', x), hashes)))
+        except RPCError as e:
+            logger.error("Could not fetch blocks {}".format(e))
+            blocks = [e] * len(hashes)
+
+        count = 0
+
+        for blockHash, block in zip(hashes, blocks):
+
+            for collateral in blockHashes[blockHash]:
+
+                if isinstance(block, dict) and 'height' in block:
+                    self.resolved(collateral, block['height'])
+                    count += 1
+                else:
+                    self.failed(collateral, now)
+
+        return count
+
+####
+# Columnar mirror of the node fields for the vectorized calculations of
+# the update cycle. Rows get removed by moving the last row into the gap.
+#
+# state/queuedPaidBlock hold the result of the last position calculation
+# to find the nodes which need a position update.
+###
+class NodeColumns(object):
+
+    columns = ['protocol', 'status', 'activeSeconds', 'lastPaidBlock',
+               'collateralBlock', 'lastSeen', 'state', 'queuedPaidBlock']
+
+    def __init__(self, capacity = 1024):
+
+        self.size = 0
+        self.rows = {}
+        self.collaterals = []
+        self.statusCodes = {}
+        self.enabledCode = self.statusCode('ENABLED')
+
+        self.protocol = numpy.zeros(capacity, dtype=numpy.int32)
+        self.status = numpy.zeros(capacity, dtype=numpy.int16)
+        self.activeSeconds = numpy.zeros(capacity, dtype=numpy.int64)
+        self.lastPaidBlock = numpy.zeros(capacity, dtype=numpy.int64)
+        self.collateralBlock = numpy.zeros(capacity, dtype=numpy.int64)
+        self.lastSeen = numpy.zeros(capacity, dtype=numpy.int64)
+        self.state = numpy.zeros(capacity, dtype=numpy.int32)
+        self.queuedPaidBlock = numpy.zeros(capacity, dtype=numpy.int64)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, collateral):
+        return collateral in self.rows
+
+    def statusCode(self, status):
+
+        if status not in self.statusCodes:
+            self.statusCodes[status] = len(self.statusCodes)
+
+        return self.statusCodes[status]
+
+    ######
+    # Return the valid part of the column :name
+    ######
+    def view(self, name):
+        return getattr(self, name)[:self.size]
+
+    def grow(self):
+
+        for name in self.columns:
+            column = getattr(self, name)
+            setattr(self, name, numpy.concatenate((column, numpy.zeros_like(column))))
+
+    def add(self, node):
+
+        if node.collateral in self.rows:
+            return self.set(node)
 
-        if self.lastPaidBlock != other.lastPaidBlock:
-            return self.lastPaidBlock < other.lastPaidBlock
+        if self.size == len(self.protocol):
+            self.grow()
 
-        return self.transaction < other.transaction
+        row = self.size
+        self.size += 1
+
+        self.rows[node.collateral] = row
+        self.collaterals.append(node.collateral)
+
+        # Never matches a calculated state, forces the initial calculation
+        self.state[row] = POS_CALCULATING
+        self.queuedPaidBlock[row] = -1
+
+        self.set(node)
+
+    def set(self, node):
+
+        row = self.rows[node.collateral]
+
+        self.protocol[row] = node.protocol
+        self.status[row] = self.statusCode(node.status)
+        self.activeSeconds[row] = node.activeSeconds
+        self.lastPaidBlock[row] = node.lastPaidBlock
+        self.collateralBlock[row] = node.collateral.block
+        self.lastSeen[row] = node.lastSeen
+
+    def remove(self, collateral):
+
+        row = self.rows.pop(collateral, None)
+
+        if row == None:
+            return
+
+        last = self.size - 1
+
+        if row != last:
+
+            moved = self.collaterals[last]
+
+            for name in self.columns:
+                column = getattr(self, name)
+                column[row] = column[last]
+
+            self.collaterals[row] = moved
+            self.rows[moved] = row
+
+        self.collaterals.pop()
+        self.size -= 1
+
+####
+# Deadlines of the next timeout evaluation per node in a heap of
+# (deadline, collateral key, collateral) entries. Entries get invalidated
+# lazily, an entry is only valid if its deadline matches the one in
+# :deadlines. A later deadline doesn't replace an earlier one, the early
+# evaluation just schedules the node again. So a new lastseen every few
+# minutes doesn't add an entry each time.
+###
+class TimeoutQueue(object):
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, collateral):
+        return collateral in self.deadlines
+
+    ######
+    # Evaluate the node with :collateral at :deadline, never if None.
+    ######
+    def schedule(self, collateral, deadline):
+
+        current = self.deadlines.get(collateral)
+
+        if deadline == None:
+            self.deadlines.pop(collateral, None)
+            return
+
+        if current != None and current <= deadline:
+            return
+
+        self.deadlines[collateral] = deadline
+        heapq.heappush(self.heap, (deadline, collateral.key, collateral))
+
+        # Drop the invalid entries if they pile up
+        if len(self.heap) > 2 * len(self.deadlines) + 1024:
+            self.heap = [(d, c.key, c) for c, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, collateral):
+        self.deadlines.pop(collateral, None)
+
+    ######
+    # Remove and return the collaterals with a deadline <= :now
+    ######
+    def expired(self, now):
+
+        result = []
+
+        while len(self.heap) and self.heap[0][0] <= now:
+
+            deadline, key, collateral = heapq.heappop(self.heap)
+
+            if self.deadlines.get(collateral) == deadline:
+                del self.deadlines[collateral]
+                result.append(collateral)
+
+        return result
+
+####
+# Hash indexes from the ip, the payee and the collateral string to the
+# collateral of the nodes. Only written by the update cycle with the
+# nodelist lock held. The readers resolve the collateral in the snapshot,
+# a node which isn't published yet is just not found.
+#
+# A payee can belong to multiple nodes, its entries are frozensets which
+# get replaced instead of modified to keep the reads safe.
+###
+class NodeIndex(object):
+
+    def __init__(self):
+        self.ips = {}
+        self.payees = {}
+        self.collaterals = {}
+        # Indexed (ip, payee) of each collateral to detect the changes
+        self.keys = {}
+        # Increased with each change, tells if a copy is outdated
+        self.version = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    ######
+    # Return a detached copy of the maps for the network snapshots.
+    ######
+    def copy(self):
+
+        index = NodeIndex()
+        index.ips = dict(self.ips)
+        index.payees = dict(self.payees)
+        index.collaterals = dict(self.collaterals)
+        index.keys = dict(self.keys)
+        index.version = self.version
+
+        return index
+
+    def add(self, node):
+
+        collateral = node.collateral
+        previous = self.keys.get(collateral)
+
+        if previous == (node.ip, node.payee):
+            return
+
+        if previous != None:
+            self.unlink(collateral, *previous)
+
+        self.version += 1
+        self.keys[collateral] = (node.ip, node.payee)
+        self.collaterals[str(collateral)] = collateral
+
+        if node.ip:
+            self.ips[node.ip] = collateral
+
+        if node.payee:
+            self.payees[node.payee] = self.payees.get(node.payee, frozenset()) | {collateral}
+
+    def remove(self, collateral):
+
+        previous = self.keys.pop(collateral, None)
+
+        if previous == None:
+            return
+
+        self.version += 1
+        self.unlink(collateral, *previous)
+        self.collaterals.pop(str(collateral), None)
+
+    def unlink(self, collateral, ip, payee):
+
+        # Another node could have taken the ip already
+        if self.ips.get(ip) == collateral:
+            self.ips.pop(ip, None)
+
+        payees = self.payees.get(payee, frozenset()) - {collateral}
+
+        if len(payees):
+            self.payees[payee] = payees
+        else:
+            self.payees.pop(payee, None)
+
+    def byIp(self, ip):
+        return self.ips.get(ip)
+
+    def byPayee(self, payee):
+        return self.payees.get(payee, frozenset())
+
+    def byString(self, collateral):
+        return self.collaterals.get(collateral)
+
+####
+# Differences between the nodelist of the last cycle :previous and the
+# fetched one :current, both dicts with the collaterals as keys. The added,
+# removed and kept collaterals get determined with hash lookups,
+# changed gets filled with (node, update) tuples during the update.
+###
+class NodeListDiff(object):
+
+    def __init__(self, previous, current):
+        self.added = [c for c in current if c not in previous]
+        self.removed = [c for c in previous if c not in current]
+        self.kept = [c for c in current if c in previous]
+        self.changed = []
+
+    def __str__(self):
+        return "Added {}, removed {}, changed {}".format(len(self.added), len(self.removed), len(self.changed))
 
 class SmartNode(object):
 
+    __slots__ = ('collateral', 'payee', 'status', 'activeSeconds', 'lastPaidBlock',
+                 'lastPaidTime', 'lastSeen', 'protocol', 'rank', 'ip', 'timeout',
+                 'state', 'queue', 'digest')
+
     def __init__(self, **kwargs):
 
+        # The strings repeat over the list (status) or over the cycles
+        # (payee, ip), interned they share one instance.
         self.collateral = kwargs['collateral']
-        self.payee = str(kwargs['payee'])
-        self.status = str(kwargs['status'])
+        self.payee = sys.intern(str(kwargs['payee']))
+        self.status = sys.intern(str(kwargs['status']))
         self.activeSeconds = int(kwargs['active_seconds'])
         self.lastPaidBlock = int(kwargs['last_paid_block'])
         self.lastPaidTime = int(kwargs['last_paid_time'])
         self.lastSeen = int(kwargs['last_seen'])
-        self.protocol = int(kwargs['protocol'])
+        self.protocol = internProtocol(kwargs['protocol'])
         self.rank = int(kwargs['rank'])
-        self.ip = str(kwargs['ip'])
+        self.ip = sys.intern(str(kwargs['ip']))
         self.timeout = int(kwargs['timeout'])
-        self.position = POS_CALCULATING
+        # Position state if the node is not in the payout queue
+        self.state = POS_CALCULATING
+        # Set while the node is in the payout queue
+        self.queue = None
+        # Digest of the line of the last full update, None if unknown or outdated
+        self.digest = None
 
     @classmethod
     def fromRaw(cls,collateral, raw):
 
         data = raw.split()
 
-        return cls(collateral = collateral,
+        node = cls(collateral = collateral,
                    payee = data[PAYEE_INDEX],
                    status = data[STATUS_INDEX].replace('_','-'), # Avoid markdown problems
                    active_seconds = data[ACTIVE_INDEX],
@@ -136,6 +598,10 @@ class SmartNode(object):
                    rank = -1,
                    timeout = -1)
 
+        node.digest = lineDigest(raw)
+
+        return node
+
     @classmethod
     def fromDb(cls, row):
 
@@ -154,49 +620,109 @@ class SmartNode(object):
                    rank = -1,
                    timeout = row['timeout'] )
 
-    def update(self, raw):
+    @staticmethod
+    def emptyUpdate():
+        return {'status' : False,
+                'payee':False,
+                'timeout' : False,
+                'lastPaid' : False,
+                'protocol' : False,
+                'ip' : False
+               }
 
-        update = {'status' : False,
-                  'payee':False,
-                  'timeout' : False,
-                  'lastPaid' : False,
-                  'protocol' : False,
-                  'ip' : False
-                 }
+    ######
+    # Update the status and the last seen time. Used for the full updates
+    # and the lastseen/status probes, the timeouts get evaluated separately
+    # with checkTimeout.
+    ######
+    def updateStatus(self, status, lastSeen, update = None):
 
-        data = raw.split()
+        if update == None:
+            update = self.emptyUpdate()
 
-        status = data[STATUS_INDEX].replace('_','-') # replace _ with - to avoid md problems
+        status = status.replace('_','-') # replace _ with - to avoid md problems
 
         if self.status != status:
             logger.info("[{}] Status updated {} => {}".format(self.collateral, self.status, status))
             update['status'] = True
-            self.status = status
+            self.status = sys.intern(status)
 
-        if int(self.protocol) != int(data[PROTOCOL_INDEX]):
-            logger.info("[{}] Protocol updated {} => {}".format(self.collateral, self.protocol, int(data[PROTOCOL_INDEX])))
-            update['protocol'] = True
-            self.protocol = int(data[PROTOCOL_INDEX])
+        self.lastSeen = int(lastSeen)
 
-        if self.payee != data[PAYEE_INDEX]:
-            logger.info("[{}] Payee updated {} => {}".format(self.collateral, self.payee, data[PAYEE_INDEX]))
-            update['payee'] = True
-            self.payee = data[PAYEE_INDEX]
+        return update
+
+    ######
+    # Evaluate the timeout at :now, returns True if it changed.
+    ######
+    def checkTimeout(self, now):
+
+        changed = False
+        lastSeenDiff = ( now - self.lastSeen )
 
-        self.lastSeen = int(data[SEEN_INDEX])
-        lastSeenDiff = ( int(time.time()) - self.lastSeen )
         if lastSeenDiff > 1800 and\
             lastSeenDiff < 3900: # > 30min < 65min
 
             if ( self.timeout == -1 or \
-              ( int(time.time()) - self.timeout ) > 300 ) and\
+              ( now - self.timeout ) > 300 ) and\
               self.status == 'ENABLED':
-                self.timeout = int(time.time())
-                update['timeout'] = True
+                self.timeout = now
+                changed = True
 
         elif self.timeout != -1 and self.status == 'ENABLED':
             self.timeout = -1
-            update['timeout'] = True
+            changed = True
+
+        if changed:
+            logger.debug("[{}] Timeout updated {}".format(self.collateral, self.timeout))
+
+        return changed
+
+    ######
+    # Earliest time after the checkTimeout at :now where the timeout could
+    # change without a new lastseen or status. None if there is none.
+    ######
+    def timeoutDeadline(self, now):
+
+        if self.status != 'ENABLED':
+            return None
+
+        lastSeenDiff = now - self.lastSeen
+
+        if lastSeenDiff <= 1800:
+            # Enters the window
+            return self.lastSeen + 1801
+
+        if lastSeenDiff < 3900:
+
+            # Leaves the window or gets notified again
+            deadline = self.lastSeen + 3900
+
+            if self.timeout != -1:
+                deadline = min(deadline, self.timeout + 301)
+
+            return max(deadline, now + 1)
+
+        return None
+
+    def update(self, raw):
+
+        update = self.emptyUpdate()
+
+        self.digest = lineDigest(raw)
+
+        data = raw.split()
+
+        self.updateStatus(data[STATUS_INDEX], data[SEEN_INDEX], update)
+
+        if int(self.protocol) != int(data[PROTOCOL_INDEX]):
+            logger.info("[{}] Protocol updated {} => {}".format(self.collateral, self.protocol, int(data[PROTOCOL_INDEX])))
+            update['protocol'] = True
+            self.protocol = internProtocol(data[PROTOCOL_INDEX])
+
+        if self.payee != data[PAYEE_INDEX]:
+            logger.info("[{}] Payee updated {} => {}".format(self.collateral, self.payee, data[PAYEE_INDEX]))
+            update['payee'] = True
+            self.payee = sys.intern(data[PAYEE_INDEX])
 
         self.activeSeconds = int(data[ACTIVE_INDEX])
 
@@ -213,10 +739,7 @@ class SmartNode(object):
         if self.ip != data[IPINDEX_INDEX]:
             logger.info("[{}] IP updated {} => {}".format(self.collateral, self.ip, data[IPINDEX_INDEX]))
             update['ip'] = True
-            self.ip = data[IPINDEX_INDEX]
-
-        if update['timeout'] :
-            logger.debug("[{}] Timeout updated {}".format(self.collateral, self.timeout))
+            self.ip = sys.intern(data[IPINDEX_INDEX])
 
         return update
 
@@ -255,18 +778,156 @@ class SmartNode(object):
     def updateRank(self, rank):
         self.rank = int(rank)
 
+    @property
+    def position(self):
+
+        if self.queue != None:
+            return self.queue.position(self.collateral)
+
+        return self.state
+
     def updatePosition(self, position):
 
         if self.position != position:
-            self.position = position
+            self.queue = None
+            self.state = position
             #logger.debug("[{}] Position updated {}".format(self.payee, self.position))
             return True
 
         return False
 
+    def enqueue(self, queue):
+
+        queue.update(self.collateral, self.lastPaidBlock)
+        self.queue = queue
+
+    ######
+    # Return a copy with the current position which is detached from the
+    # payout queue and the collateral of the list. Used for the network
+    # snapshots.
+    ######
+    def freeze(self):
+
+        frozen = copy.copy(self)
+        # The resolver updates the block of the live collateral
+        frozen.collateral = copy.copy(self.collateral)
+        frozen.state = self.position
+        frozen.queue = None
+
+        return frozen
+
+####
+# State of the network after an update cycle. Gets published with a single
+# reference swap at the end of the cycle and never changes afterwards, so
+# the readers don't need the nodelist lock.
+###
+class NetworkSnapshot(object):
+
+    def __init__(self, **kwargs):
+
+        self.nodes = kwargs['nodes']
+        self.index = kwargs['index']
+        self.lastBlock = kwargs['last_block']
+        self.protocol_90024 = kwargs['protocol_90024']
+        self.protocol_90025 = kwargs['protocol_90025']
+        self.enabled_90024 = kwargs['enabled_90024']
+        self.enabled_90025 = kwargs['enabled_90025']
+        self.qualifiedNormal = kwargs['qualified_normal']
+        self.qualifiedUpgrade = kwargs['qualified_upgrade']
+        self.remainingUpgradeModeDuration = kwargs['remaining_upgrade_mode_duration']
+        self.protocolRequirement = kwargs['protocol_requirement']
+        self.enabledWithMinProtocol = kwargs['enabled_with_min_protocol']
+        self.minimumUptime = kwargs['minimum_uptime']
+        self.created = time.time()
+
+    def count(self, protocol = -1):
+
+        if protocol == 90024:
+            return self.protocol_90024
+        elif protocol == 90025:
+            return self.protocol_90025
+        else:
+            return len(self.nodes)
+
+    def enabled(self, protocol = -1):
+
+        if protocol == 90024:
+            return self.enabled_90024
+        elif protocol == 90025:
+            return self.enabled_90025
+        else:
+            return self.enabled_90024 + self.enabled_90025
+
+    def upgradeMode(self):
+        return self.qualifiedUpgrade != -1
+
+    def getNodes(self, collaterals):
+
+        nodes = []
+
+        for c in collaterals:
+
+            collateral = None
+
+            if isinstance(c,Transaction):
+                collateral = c
+            else:
+                collateral = self.index.byString(c)
+
+            if collateral in self.nodes:
+                nodes.append(self.nodes[collateral])
+
+        return nodes
+
+    ######
+    # Return the node with the ip :ip (without port) or None.
+    ######
+    def getNodeByIp(self, ip):
+        return self.nodes.get(self.index.byIp("{}:9678".format(ip)))
+
+    def getNodesByPayee(self, payee):
+        return self.getNodes(self.index.byPayee(payee))
+
+    def lookup(self, collateral):
+
+        result = None
+        node = self.getNodes([collateral])
+
+        if len(node) == 1:
+            result = {}
+            node = node[0]
+
+            uptimeString = None
+
+            if node.activeSeconds > 0:
+                uptimeString = util.secondsToText(node.activeSeconds)
+            else:
+                uptimeString = "No uptime!"
+
+            result['ip'] = node.cleanIp()
+            result['position'] = node.position < self.enabledWithMinProtocol * 0.1 and node.position > 0
+            result['position_string'] = node.positionString()
+
+            result['status'] = node.status == 'ENABLED'
+            result['status_string'] = "{}".format(node.status)
+
+            result['uptime'] = node.activeSeconds >= self.minimumUptime
+            result['uptime_string'] = uptimeString
+
+            result['protocol'] = node.protocol == self.protocolRequirement
+            result['protocol_string'] = "{}".format(node.protocol)
+
+            result['collateral'] = (self.lastBlock - node.collateral.block) >= self.enabledWithMinProtocol
+
+            result['collateral_string'] = "{}".format((self.lastBlock - node.collateral.block))
+
+            result['upgrade_mode'] = self.upgradeMode()
+
+        return result
+
 class SmartNodeList(object):
 
-    def __init__(self, db):
+    def __init__(self, db, rpc = None):
 
         self.nodeListSem = threading.Lock()
         self.lastBlock = 0
@@ -277,8 +938,13 @@ class SmartNodeList(object):
         self.protocol_90025 = 0
         self.enabled_90024 = 0
         self.enabled_90025 = 0
-        self.lastPaidVec = []
+        self.payoutQueue = PayoutQueue()
         self.nodeList = {}
+        self.columns = NodeColumns()
+        self.index = NodeIndex()
+        self.timeouts = TimeoutQueue()
+        # Parsed collaterals of the known nodelist keys
+        self.collateralKeys = {}
 
         self.syncedTime = -1
         self.chainSynced = False
@@ -287,30 +953,150 @@ class SmartNodeList(object):
 
         self.db = db
 
+        # Phase timers and counters of the update cycles
+        self.metrics = Metrics()
+
+        # Write-behind of the node changes, the cycles don't wait for the disk
+        self.writer = NodeWriter(db, metrics = self.metrics, errorCB = self.pushAdmin)
+
+        # JSON-RPC client for the daemon, the cli is used if there is none
+        # or if the rpc connection fails.
+        self.rpc = rpc
+        self.cli = SmartCashCLI()
+
+        self.collaterals = CollateralResolver(self.requestBatch)
+
         self.nodeChangeCB = None
         self.networkCB = None
         self.adminCB = None
 
-        self.load()
+        # Held while an update cycle runs
+        self.cycleSem = threading.Lock()
+
+        # Seconds between the cycles. Each cycle runs the cheap lastseen/status
+        # probe, the full refresh runs for new blocks or after refreshInterval.
+        self.probeInterval = 20
+        self.refreshInterval = 300
+        self.lastRefresh = -1
+
+        self.scheduler = CycleScheduler(self.updateList, self.probeInterval, metrics = self.metrics)
+
+        # Published state for the readers
+        self.snapshot = None
+
+        self.load()
+
+        self.snapshot = self.createSnapshot()
+
+    def acquire(self):
+        logger.info("SmartNodeList acquire")
+        self.nodeListSem.acquire()
+
+    def release(self):
+        logger.info("SmartNodeList release")
+        self.nodeListSem.release()
+
+    def pushAdmin(self, message):
+
+        if self.adminCB:
+            self.adminCB(message)
+
+    ######
+    # Start the update cycles, the first one after :delay seconds.
+    ######
+    def start(self, delay = 5):
+        self.writer.start()
+        self.scheduler.start(delay)
+
+    ######
+    # Stop the update cycles and write all queued node changes.
+    ######
+    def stop(self):
+        self.scheduler.stop()
+        self.writer.stop()
+
+    ######
+    # Run an update as soon as possible, e.g. when a new block arrived.
+    # The regular cadence stays as fallback.
+    ######
+    def trigger(self, *args):
+        self.scheduler.trigger()
+
+    ######
+    # Send the call :method with the parameters :params to the daemon and
+    # return the result. Raises RPCError if the call failed.
+    ######
+    def request(self, method, *params):
+
+        if self.rpc:
+
+            try:
+                return self.rpc.call(method, *params)
+            except RPCError as e:
+
+                if not e.transport:
+                    raise
+
+                logger.warning("{} failed, use the cli: {}".format(self.rpc, e))
+
+        return self.cli.call(method, *params)
+
+    ######
+    # Send all calls of :calls as one batch. Returns a list with the result
+    # or an RPCError for each call.
+    ######
+    def requestBatch(self, calls):
+
+        if self.rpc:
+
+            try:
+                return self.rpc.batch(calls)
+            except RPCError as e:
+
+                if not e.transport:
+                    raise
+
+                logger.warning("{} batch failed, use the cli: {}".format(self.rpc, e))
+
+        return self.cli.batch(calls)
+
+    ######
+    # Yield the (key, value) members of the result object of :method while
+    # the response gets received. Falls back to the cli only if the rpc
+    # connection failed before the first member.
+    ######
+    def requestStream(self, method, *params):
+
+        if self.rpc:
+
+            started = False
+
+            try:
+
+                for member in self.rpc.stream(method, *params):
+                    started = True
+                    yield member
+
+                return
+
+            except RPCError as e:
 
-        self.startTimer(5)
+                if not e.transport or started:
+                    raise
 
-    def acquire(self):
-        logger.info("SmartNodeList acquire")
-        self.nodeListSem.acquire()
+                logger.warning("{} stream failed, use the cli: {}".format(self.rpc, e))
 
-    def release(self):
-        logger.info("SmartNodeList release")
-        self.nodeListSem.release()
+        for member in self.cli.stream(method, *params):
+            yield member
 
-    def pushAdmin(self, message):
+    def latency(self):
 
-        if self.adminCB:
-            self.adminCB(message)
+        result = self.cli.latency()
+
+        if self.rpc:
+            result.update(self.rpc.latency())
 
-    def startTimer(self, timeout = 30):
-        self.timer = threading.Timer(timeout, self.updateList)
-        self.timer.start()
+        return result
 
     def load(self):
 
@@ -319,6 +1105,11 @@ class SmartNodeList(object):
         for entry in dbList:
                 node = SmartNode.fromDb(entry)
                 self.nodeList[node.collateral] = node
+                self.collateralKeys[self.collateralKey(node.collateral)] = node.collateral
+                self.columns.add(node)
+                self.index.add(node)
+                # Evaluate all in the first cycle
+                self.timeouts.schedule(node.collateral, 0)
 
     def validateAddress(self, address):
 
@@ -328,8 +1119,7 @@ class SmartNodeList(object):
 
         try:
 
-            result = subprocess.check_output(['smartcash-cli', 'validateaddress',cleanAddress])
-            validate = json.loads(result.decode('utf-8'))
+            validate = self.request('validateaddress',cleanAddress)
 
         except Exception as e:
 
@@ -342,46 +1132,10 @@ class SmartNodeList(object):
 
         return False
 
-    def getCollateralAge(self, txhash):
-
-        try:
-
-            result = subprocess.check_output(['smartcash-cli', 'getrawtransaction',txhash, '1'])
-            rawTx = json.loads(result.decode('utf-8'))
-
-        except Exception as e:
-
-            logging.error('Could not fetch raw transaction', exc_info=e)
-            return -1
-        else:
-
-            if 'error' in rawTx or not "blockhash" in rawTx:
-                logger.error("getCollateralAge {}".rawTx)
-                return -1
-
-            blockHash = rawTx['blockhash']
-
-            try:
-
-                result = subprocess.check_output(['smartcash-cli', 'getblock',blockHash])
-                block = json.loads(result.decode('utf-8'))
-
-            except Exception as e:
-                logging.error('Could not fetch block', exc_info=e)
-                return -1
-            else:
-
-                if 'error' in block or not 'height' in block:
-                    return -1
-
-                return block['height']
-
-
     def isValidDeamonResponse(self,json):
 
         if 'error' in json:
             logger.warning("could not update list {}".format(json))
-            self.startTimer()
             return False
 
         return True
@@ -395,8 +1149,7 @@ class SmartNodeList(object):
 
         try:
 
-            statusResult = subprocess.check_output(['smartcash-cli', 'snsync','status'])
-            status = json.loads(statusResult.decode('utf-8'))
+            status = self.request('snsync','status')
 
         except Exception as e:
 
@@ -410,7 +1163,7 @@ class SmartNodeList(object):
 
             if 'error' in status:
                 self.pushAdmin("No valid sync state")
-                raise RuntimeError("Error in sync list {}".format(statusResult))
+                raise RuntimeError("Error in sync list {}".format(status))
 
             # {
             #   "AssetID": 999,
@@ -438,14 +1191,42 @@ class SmartNodeList(object):
             else:
                 raise RuntimeError("IsWinnersListSynced missing.")
 
+    ######
+    # Run one update cycle. Returns False if the daemon is not synced or
+    # the cycle failed, to let the scheduler back off.
+    ######
     def updateList(self):
 
+        # Never run two cycles at once, also not if called directly
+        if not self.cycleSem.acquire(False):
+            logger.warning("updateList already running")
+            return False
+
+        kind = 'failed'
+        watch = Stopwatch()
+
+        try:
+            with watch:
+                kind = self.runCycle()
+        finally:
+            self.metrics.observe('cycle_seconds', watch.seconds, type=kind)
+            self.cycleSem.release()
+
+        return kind not in ['failed', 'unsynced']
+
+    ######
+    # Run the full refresh if there is a new block or if the last one is
+    # older than refreshInterval, the lastseen/status probe otherwise.
+    # Returns the type of the cycle for the metrics.
+    ######
+    def runCycle(self):
+
         try:
-            self.updateSyncState()
+            with self.metrics.timer('phase_seconds', cycle='common', phase='sync'):
+                self.updateSyncState()
         except RuntimeError as e:
             logger.error("updateList sync exception: {}".format(e))
-            self.startTimer()
-            return
+            return 'failed'
 
         else:
 
@@ -458,35 +1239,180 @@ class SmartNodeList(object):
                 if not self.nodeListSynced or not self.winnersListSynced:
                     self.syncedTime = -2
 
-                self.startTimer()
-
-                return
+                return 'unsynced'
 
         if self.syncedTime == -2:
             self.syncedTime = time.time()
             logger.info("Synced now! Wait 5 minutes and then start through...")
-            self.startTimer()
-            return
+            return 'waiting'
 
         # Wait 5 minutes here to prevent timeout notifications. Past showed that
         # the lastseen times are not good instantly after sync.
         elif self.syncedTime > -1 and (time.time() - self.syncedTime) < 300:
             logger.info("After sync wait {}".format(util.secondsToText(time.time() - self.syncedTime)))
-            self.startTimer()
-            return
+            return 'waiting'
+
+        blockCount = None
+
+        try:
+            with self.metrics.timer('phase_seconds', cycle='common', phase='blockcount'):
+                blockCount = self.request('getblockcount')
+        except Exception as e:
+            logger.error('Error at %s', 'getblockcount', exc_info=e)
+
+        # Without a block count there is no new block to refresh for
+        newBlock = blockCount != None and blockCount != self.lastBlock
+
+        if self.lastRefresh == -1 or newBlock or\
+           (time.time() - self.lastRefresh) >= self.refreshInterval:
+            return 'refresh' if self.refreshList() else 'failed'
+
+        return 'probe' if self.probeList() else 'failed'
+
+    ######
+    # Fetch only the lastseen and status view of the nodelist and apply
+    # the status and timeout transitions. The positions stay untouched
+    # until the next full refresh. Returns False if the fetch failed.
+    ######
+    def probeList(self):
+
+        lastSeen = None
+        status = None
+
+        try:
+
+            with self.metrics.timer('phase_seconds', cycle='probe', phase='fetch'):
+                lastSeen = self.request('smartnodelist','lastseen')
+                status = self.request('smartnodelist','status')
+
+        except Exception as e:
+
+                logging.error('Error at %s', 'probe list', exc_info=e)
+
+                self.pushAdmin("Error at probeList")
+
+                return False
+
+        if not self.isValidDeamonResponse(lastSeen) or\
+           not self.isValidDeamonResponse(status):
+            self.pushAdmin("No valid nodeList probe")
+            return False
+
+        self.acquire()
 
-        newNodes = []
+        try:
+
+            updates = {}
+            touched = []
+            parsed = 0
+            parseTime = Stopwatch()
+
+            for key, seen in lastSeen.items():
+
+                collateral = self.collateralKeys.get(key)
+
+                # New and removed nodes are handled by the full refresh
+                if collateral == None or key not in status:
+                    continue
+
+                node = self.nodeList[collateral]
+
+                if node.lastSeen == seen and node.status == status[key].replace('_','-'):
+                    continue
+
+                with parseTime:
+                    update = node.updateStatus(status[key], seen)
+
+                parsed += 1
+                touched.append(collateral)
+
+                # The line of the next full refresh needs to be applied
+                node.digest = None
+
+                if update['status']:
+                    updates[collateral] = (node, update)
+
+                self.columns.set(node)
+
+            self.metrics.observe('phase_seconds', parseTime.seconds, cycle='probe', phase='parse')
+
+            with self.metrics.timer('phase_seconds', cycle='probe', phase='timeouts'):
+                self.checkTimeouts(updates, touched)
+
+            changed = list(updates.values())
+
+            batch = NodeBatch()
+
+            for node, update in changed:
+                batch.upsert(node.collateral, node)
+
+            self.updateCounters()
+
+            with self.metrics.timer('phase_seconds', cycle='probe', phase='snapshot'):
+                # Also the nodes with only a new lastseen
+                frozen = set(touched)
+                frozen.update(updates.keys())
+
+                self.snapshot = self.createSnapshot([self.nodeList[c] for c in frozen])
+
+        finally:
+            self.release()
+
+        logger.info("Nodelist probe: {} changed".format(len(changed)))
+
+        writes = self.queueWrites(batch, 'probe')
+
+        with self.metrics.timer('phase_seconds', cycle='probe', phase='callbacks'):
+
+            callbacks = 0
+
+            if self.nodeChangeCB != None:
+
+                for node, update in changed:
+                    self.nodeChangeCB(update, self.snapshot.nodes.get(node.collateral, node))
+                    callbacks += 1
+
+        self.countCycle(parsed = parsed, changed = len(changed), writes = writes, callbacks = callbacks)
+
+        return True
+
+    ######
+    # Fetch the full nodelist, apply all changes and recalculate the
+    # positions. Returns False if the nodelist couldn't be applied.
+    ######
+    def refreshList(self):
 
-        nodes = None
         info = None
+        current = {}
 
         try:
 
-            infoResult = subprocess.check_output(['smartcash-cli', 'getinfo'])
-            info = json.loads(infoResult.decode('utf-8'))
+            with self.metrics.timer('phase_seconds', cycle='refresh', phase='fetch'):
 
-            nodeResult = subprocess.check_output(['smartcash-cli', 'smartnodelist','full'])
-            nodes = json.loads(nodeResult.decode('utf-8'))
+                info = self.request('getinfo')
+
+                # Parse the nodelist while it gets received
+                for key, data in self.requestStream('smartnodelist','full'):
+
+                    collateral = self.collateralKeys.get(key)
+
+                    if collateral == None:
+
+                        collateral = Transaction.fromRaw(key)
+
+                        if collateral == None:
+                            logger.warning("Invalid nodelist key {}".format(key))
+                            continue
+
+                        self.collateralKeys[key] = collateral
+
+                    node = self.nodeList.get(collateral)
+
+                    # Only the changed lines are kept until the list is applied
+                    if node != None and node.digest != None and node.digest == lineDigest(data):
+                        current[collateral] = None
+                    else:
+                        current[collateral] = data
 
         except Exception as e:
 
@@ -494,218 +1420,382 @@ class SmartNodeList(object):
 
                 self.pushAdmin("Error at updateList")
 
-        else:
+                return False
 
-            if not self.isValidDeamonResponse(nodes):
-                self.pushAdmin("No valid nodeList")
-                return
+        else:
 
             if not self.isValidDeamonResponse(info):
                 self.pushAdmin("No valid network info")
-                return
+                return False
 
             if "blocks" in info:
                 self.lastBlock = info["blocks"]
 
-            node = None
-            currentList = []
-            self.lastPaidVec = []
-            currentTime = int(time.time())
             protocolRequirement = self.protocolRequirement()
 
-            dbCount = self.db.getNodeCount()
+            diff = NodeListDiff(self.nodeList, current)
 
             # Prevent mass deletion of nodes if something is wrong
             # with the fetched nodelist.
-            if dbCount and len(nodes) and ( dbCount / len(nodes) ) > 1.25:
+            if len(self.nodeList) and len(current) and ( len(self.nodeList) / len(current) ) > 1.25:
                 self.pushAdmin("Node count differs too much!")
-                logger.warning("Node count differs too much! - DB {}, CLI {}".format(dbCount,len(nodes)))
-                self.startTimer()
-                return
+                logger.warning("Node count differs too much! - Known {}, CLI {}".format(len(self.nodeList),len(current)))
+                return False
+
+            #####
+            ## Resolve the missing collateral heights of new and unresolved
+            ## nodes before the list gets locked.
+            #####
+
+            unresolved = list(diff.added)
+
+            for collateral in diff.kept:
+
+                if self.nodeList[collateral].collateral.block <= 0:
+                    unresolved.append(collateral)
+
+            with self.metrics.timer('phase_seconds', cycle='refresh', phase='collaterals'):
+                self.collaterals.resolve(unresolved)
 
             # Prevent reading during the calculations
             self.acquire()
 
-            # Reset the calculation vars
-            self.qualifiedNormal = 0
-
-            for key, data in nodes.items():
+            try:
 
-                collateral = Transaction.fromRaw(key)
+                newNodes = []
+                touched = []
+                dirty = set()
+                batch = NodeBatch()
+                parsed = 0
+                parseTime = Stopwatch()
 
-                currentList.append(collateral)
+                for collateral in diff.added:
 
-                if collateral not in self.nodeList:
+                    collateral.updateBlock(self.collaterals.height(collateral))
 
-                    collateral.updateBlock(self.getCollateralAge(collateral.hash))
+                    logger.info("Add node {}".format(collateral))
 
-                    logger.info("Add node {}".format(key))
-                    insert = SmartNode.fromRaw(collateral, data)
+                    with parseTime:
+                        insert = SmartNode.fromRaw(collateral, current[collateral])
 
-                    id = self.db.addNode(collateral,insert)
+                    parsed += 1
 
-                    if id:
-                        self.nodeList[collateral] = insert
-                        newNodes.append(collateral)
+                    self.nodeList[collateral] = insert
+                    self.columns.add(insert)
+                    self.index.add(insert)
+                    touched.append(collateral)
+                    newNodes.append(collateral)
+                    dirty.add(collateral)
 
-                        logger.debug(" => added with collateral {}".format(insert.collateral))
-                    else:
-                        logger.error("Could not add the node {}".format(key))
+                updates = {}
 
-                else:
+                for collateral in diff.kept:
 
                     node = self.nodeList[collateral]
                     collateral = node.collateral
-                    update = node.update(data)
+                    raw = current[collateral]
+
+                    #####
+                    ## Check if the collateral height is already detemined
+                    ## if not try it!
+                    #####
+
+                    if collateral.block <= 0:
+
+                        collateral.updateBlock(self.collaterals.height(collateral))
+
+                        if collateral.block > 0:
+                            logger.info("Collateral block updated {} => {}".format(str(collateral), collateral.block))
+                            dirty.add(collateral)
+                            self.columns.set(node)
+
+                    # Nothing to parse if the line didn't change since the last refresh
+                    if raw == None:
+                        continue
 
-                    if update['status']\
-                    or update['protocol']\
-                    or update['payee']\
-                    or update['lastPaid']\
-                    or update['timeout']:
-                        self.db.updateNode(collateral,node)
+                    with parseTime:
+                        update = node.update(raw)
+
+                    parsed += 1
+                    touched.append(collateral)
 
                     if sum(map(lambda x: x, update.values())):
+                        updates[collateral] = (node, update)
+                        dirty.add(collateral)
+
+                    if update['ip'] or update['payee']:
+                        self.index.add(node)
+
+                    self.columns.set(node)
+
+                for collateral in diff.removed:
 
-                        if self.nodeChangeCB != None:
-                            self.nodeChangeCB(update, node)
+                    logger.info("Remove node {}".format(collateral))
+
+                    batch.delete(collateral)
+
+                    self.nodeList.pop(collateral,None)
+                    self.collateralKeys.pop(self.collateralKey(collateral), None)
+                    self.columns.remove(collateral)
+                    self.index.remove(collateral)
+                    self.timeouts.remove(collateral)
+                    self.payoutQueue.remove(collateral)
 
                 #####
-                ## Check if the collateral height is already detemined
-                ## if not try it!
+                ## Evaluate the timeouts of the changed nodes and the due ones
                 #####
 
-                if collateral.block <= 0:
-                    logger.info("Collateral block missing {}".format(str(collateral)))
+                with self.metrics.timer('phase_seconds', cycle='refresh', phase='timeouts'):
+                    self.checkTimeouts(updates, touched)
 
-                    collateral.updateBlock(self.getCollateralAge(collateral.hash))
+                diff.changed = list(updates.values())
+                dirty.update(updates.keys())
 
-                    if collateral.block > 0:
-                        self.db.updateNode(collateral,node)
-                    else:
-                        logger.warning("Could not fetch collateral block {}".format(str(collateral)))
+                for collateral in dirty:
+                    batch.upsert(collateral,self.nodeList[collateral])
 
+                self.metrics.observe('phase_seconds', parseTime.seconds, cycle='refresh', phase='parse')
 
-            #####
-            ## Invoke the callback if we have new nodes
-            #####
+                logger.info("Nodelist diff: {}".format(diff))
+
+                logger.debug("calculatePositions start")
+
+                #####
+                ## Update vars for calculations
+                #
+                ####
+
+                self.updateCounters()
+
+                # Freeze the network parameters for this cycle
+                enabledWithMinProtocol = self.enabledWithMinProtocol()
+                minimumUptime = self.minimumUptime()
+
+                with self.metrics.timer('phase_seconds', cycle='refresh', phase='positions') as watch:
+                    self.calculatePositions(protocolRequirement, enabledWithMinProtocol, minimumUptime)
+
+                logger.debug("calculatePositions done in {:.3f}s".format(watch.seconds))
 
-            if len(newNodes) and self.networkCB:
+                if self.qualifiedUpgrade != -1:
 
-                self.networkCB(newNodes, True)
+                    with self.metrics.timer('phase_seconds', cycle='refresh', phase='upgrade'):
+                        self.remainingUpgradeModeDuration = self.calculateUpgradeModeDuration(protocolRequirement, enabledWithMinProtocol, minimumUptime)
 
-                logger.info("Created: {}".format(len(nodes.values())))
-                logger.info("Enabled: {}\n".format(sum(map(lambda x: x.split()[STATUS_INDEX]  == "ENABLED", list(nodes.values())))))
+                    logger.info("calculateUpgradeModeDuration done {}".format("Success" if self.remainingUpgradeModeDuration else "Error?"))
+                else:
+                    self.remainingUpgradeModeDuration = None
+
+                # Publish the new state for the readers
+                with self.metrics.timer('phase_seconds', cycle='refresh', phase='snapshot'):
+                    self.snapshot = self.createSnapshot()
+
+                initial = self.lastRefresh == -1
+                self.lastRefresh = time.time()
+
+            finally:
+                self.release()
+
+            writes = self.queueWrites(batch, 'refresh')
+
+            # The list is complete after the first refresh
+            if initial:
+                self.freezeObjects()
 
             #####
-            ## Remove nodes from the DB that are not longer in the global list
+            ## Invoke the callbacks with the published state
             #####
 
-            dbCount = self.db.getNodeCount()
+            snapshot = self.snapshot
+            callbacks = 0
 
-            if dbCount > len(nodes):
+            with self.metrics.timer('phase_seconds', cycle='refresh', phase='callbacks'):
 
-                removedNodes = []
+                if self.nodeChangeCB != None:
 
-                logger.warning("Unequal node count - DB {}, CLI {}".format(dbCount,len(nodes)))
+                    for node, update in diff.changed:
+                        self.nodeChangeCB(update, snapshot.nodes.get(node.collateral, node))
+                        callbacks += 1
 
-                dbNodes = self.db.getNodes(['collateral'])
+                if len(newNodes) and self.networkCB:
 
-                for dbNode in dbNodes:
+                    self.networkCB(newNodes, True)
+                    callbacks += 1
 
-                    collateral = Transaction.fromString(dbNode['collateral'])
+                    logger.info("Created: {}".format(snapshot.count()))
+                    logger.info("Enabled: {}\n".format(snapshot.enabled()))
 
-                    if not collateral in currentList:
-                        logger.info("Remove node {}".format(dbNode))
-                        removedNodes.append(dbNode['collateral'])
-                        self.db.deleteNode(collateral)
-                        self.nodeList.pop(collateral,None)
+                if len(diff.removed) and self.networkCB:
+                    self.networkCB(diff.removed, False)
+                    callbacks += 1
 
-                if len(removedNodes) != (dbCount - len(nodes)):
-                    logger.warning("Remove nodes - something messed up.")
+            self.countCycle(parsed = parsed, changed = len(diff.changed), added = len(newNodes),
+                            removed = len(diff.removed), writes = writes, callbacks = callbacks)
 
-                if self.networkCB:
-                    self.networkCB(removedNodes, False)
+            return True
 
-            logger.info("calculatePositions start")
+        #####
+        # Disabled rank updates due to confusion of the users
+        #self.updateRanks()
+        #####
 
-            #####
-            ## Update vars for calculations
-            #
-            ####
+    ######
+    # Evaluate the timeouts of the nodes in :touched (new lastseen or
+    # status) and of the nodes with an expired deadline, then schedule
+    # their next deadline. Adds the changes to :updates, a dict of
+    # collateral => (node, update).
+    ######
+    def checkTimeouts(self, updates, touched = ()):
 
-            nodes90024 = list(filter(lambda x: x.protocol == 90024, self.nodeList.values()))
-            nodes90025 = list(filter(lambda x: x.protocol == 90025, self.nodeList.values()))
+        now = int(time.time())
 
-            self.protocol_90024 = len(nodes90024)
-            self.protocol_90025 = len(nodes90025)
+        due = set(touched)
+        due.update(self.timeouts.expired(now))
 
-            self.enabled_90024 = len(list(filter(lambda x: x.status == "ENABLED", nodes90024)))
-            self.enabled_90025 = len(list(filter(lambda x: x.status == "ENABLED", nodes90025)))
+        for collateral in due:
 
-            #####
-            ## Update the the position indicator of the node
-            #
-            # CURRENTL MISSING:
-            #   https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L554
-            #####
+            node = self.nodeList.get(collateral)
 
-            def calculatePositions(upgradeMode):
+            if node == None:
+                continue
 
-                self.lastPaidVec = []
+            if node.checkTimeout(now):
 
-                for collateral, node in self.nodeList.items():
+                if collateral not in updates:
+                    updates[collateral] = (node, SmartNode.emptyUpdate())
 
-                    if not upgradeMode and node.activeSeconds < self.minimumUptime():# https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L561
-                        node.updatePosition(POS_TOO_NEW)
-                    elif node.protocol < protocolRequirement:# https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L545
-                        node.updatePosition(POS_UPDATE_REQUIRED)
-                    elif (self.lastBlock - node.collateral.block) < self.enabledWithMinProtocol():
-                        node.updatePosition(POS_COLLATERAL_AGE)
-                    elif node.status == 'ENABLED': #https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L539
-                        self.lastPaidVec.append(LastPaid(node.lastPaidBlock, collateral))
-                    else:
-                        node.updatePosition(POS_NOT_QUALIFIED)
+                updates[collateral][1]['timeout'] = True
 
-                if not upgradeMode and len(self.lastPaidVec) < (self.enabledWithMinProtocol() / 3):
-                    self.qualifiedUpgrade = len(self.lastPaidVec)
-                    logger.info("Start upgradeMode calculation: {}".format(self.qualifiedUpgrade))
-                    calculatePositions(True)
-                    return
+            self.timeouts.schedule(collateral, node.timeoutDeadline(now))
 
-                if not upgradeMode:
-                    self.qualifiedUpgrade = -1
+    ######
+    # Hand :batch over to the writer. Returns the number of queued writes.
+    ######
+    def queueWrites(self, batch, cycle):
 
-                self.qualifiedNormal = len(self.lastPaidVec)
+        with self.metrics.timer('phase_seconds', cycle=cycle, phase='db'):
+            self.writer.submit(batch)
 
-            calculatePositions(False)
+        return len(batch)
 
+    ######
+    # Exclude the long living objects (nodes, collaterals, indexes) from
+    # the garbage collection, they would get scanned over and over again.
+    ######
+    def freezeObjects(self):
 
-            #####
-            ## Update positions
-            #####
+        gc.collect()
+        gc.freeze()
 
-            self.lastPaidVec.sort()
+        logger.info("Excluded {} objects from the gc".format(gc.get_freeze_count()))
 
-            value = 0
-            for lastPaid in self.lastPaidVec:
-                value +=1
-                self.nodeList[lastPaid.transaction].updatePosition(value)
+    ######
+    # Add the work of an update cycle to the metrics counters.
+    ######
+    def countCycle(self, parsed = 0, changed = 0, added = 0, removed = 0, writes = 0, callbacks = 0):
 
-            logger.info("calculatePositions done")
+        self.metrics.increment('nodes_parsed_total', parsed)
+        self.metrics.increment('nodes_changed_total', changed)
+        self.metrics.increment('nodes_added_total', added)
+        self.metrics.increment('nodes_removed_total', removed)
+        self.metrics.increment('db_writes_total', writes)
+        self.metrics.increment('callbacks_total', callbacks)
 
-            if self.qualifiedUpgrade != -1:
-                logger.info("calculateUpgradeModeDuration start")
-                self.remainingUpgradeModeDuration = self.calculateUpgradeModeDuration()
-                logger.info("calculateUpgradeModeDuration done {}".format("Success" if self.remainingUpgradeModeDuration else "Error?"))
+    ######
+    # Current metrics in the text format of prometheus, with the node
+    # counts and the daemon call latencies as gauges.
+    ######
+    def metricsText(self):
 
-            self.release()
+        snapshot = self.snapshot
+
+        self.metrics.gauge('nodes', snapshot.count())
+        self.metrics.gauge('nodes_enabled', snapshot.enabled())
+        self.metrics.gauge('last_block', snapshot.lastBlock)
+
+        for method, entry in self.latency().items():
+            self.metrics.gauge('daemon_calls', entry['calls'], method=method)
+            self.metrics.gauge('daemon_errors', entry['errors'], method=method)
+            self.metrics.gauge('daemon_seconds_avg', entry['avg'], method=method)
+            self.metrics.gauge('daemon_seconds_max', entry['max'], method=method)
+
+        return self.metrics.render()
+
+    ######
+    # Key of the collateral in the nodelist of the daemon
+    ######
+    def collateralKey(self, collateral):
+        return "COutPoint({}, {})".format(collateral.hash, collateral.index)
+
+    def updateCounters(self):
+
+        protocol = self.columns.view('protocol')
+        enabled = self.columns.view('status') == self.columns.enabledCode
+
+        self.protocol_90024 = int(numpy.count_nonzero(protocol == 90024))
+        self.protocol_90025 = int(numpy.count_nonzero(protocol == 90025))
+
+        self.enabled_90024 = int(numpy.count_nonzero(enabled & (protocol == 90024)))
+        self.enabled_90025 = int(numpy.count_nonzero(enabled & (protocol == 90025)))
+
+    #####
+    ## Update the the position indicator of the nodes
+    #
+    # CURRENTL MISSING:
+    #   https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L554
+    #####
+    def calculatePositions(self, protocolRequirement, enabledWithMinProtocol, minimumUptime):
+
+        columns = self.columns
+        size = len(columns)
+
+        lastPaidBlock = columns.view('lastPaidBlock')
+
+        # https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L561
+        tooNew = columns.view('activeSeconds') < minimumUptime
+
+        state = numpy.select([columns.view('protocol') < protocolRequirement,# https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L545
+                              (self.lastBlock - columns.view('collateralBlock')) < enabledWithMinProtocol,
+                              columns.view('status') == columns.enabledCode],#https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L539
+                             [POS_UPDATE_REQUIRED,
+                              POS_COLLATERAL_AGE,
+                              STATE_QUEUED],
+                             POS_NOT_QUALIFIED)
+
+        qualified = int(numpy.count_nonzero((state == STATE_QUEUED) & ~tooNew))
+
+        upgradeMode = qualified < (enabledWithMinProtocol / 3)
+
+        if upgradeMode:
+            self.qualifiedUpgrade = qualified
+            logger.info("Start upgradeMode calculation: {}".format(self.qualifiedUpgrade))
+        else:
+            self.qualifiedUpgrade = -1
+            state = numpy.where(tooNew, POS_TOO_NEW, state)
+
+        queued = state == STATE_QUEUED
+        queuedPaidBlock = numpy.where(queued, lastPaidBlock, -1)
 
         #####
-        # Disabled rank updates due to confusion of the users
-        #self.updateRanks()
+        ## Move only the nodes with changes in the queue
         #####
-        self.startTimer()
+
+        changed = numpy.nonzero((state != columns.view('state')) |\
+                                (queuedPaidBlock != columns.view('queuedPaidBlock')))[0]
+
+        for row in changed:
+
+            node = self.nodeList[columns.collaterals[row]]
+
+            if queued[row]:
+                node.enqueue(self.payoutQueue)
+            else:
+                self.payoutQueue.remove(node.collateral)
+                node.updatePosition(int(state[row]))
+
+        columns.state[:size] = state
+        columns.queuedPaidBlock[:size] = queuedPaidBlock
+
+        self.qualifiedNormal = len(self.payoutQueue)
 
     def updateRanks(self):
 
@@ -716,9 +1806,7 @@ class SmartNodeList(object):
 
         try:
 
-            rankResult = subprocess.check_output(['smartcash-cli', 'smartnodelist','rank'])
-            rankResult = subprocess.check_output(['smartcash-cli', 'smartnodelist','rank'])
-            ranks = json.loads(rankResult.decode('utf-8'))
+            ranks = self.request('smartnodelist','rank')
 
         except Exception as e:
                 logging.error('Error at %s', 'update ranks', exc_info=e)
@@ -726,7 +1814,7 @@ class SmartNodeList(object):
         else:
 
             if 'error' in ranks:
-                logger.warning("could not update ranks {}".format(rankResult))
+                logger.warning("could not update ranks {}".format(ranks))
                 self.pushAdmin("No valid ranklist")
                 return
 
@@ -741,14 +1829,49 @@ class SmartNodeList(object):
                 else:
                     self.nodeList[collateral].updateRank(data)
 
-    def count(self, protocol = -1):
+    ######
+    # Create a snapshot of the current state. Requires the nodelist lock
+    # or no running update. If :changed is given only those nodes get
+    # frozen again, the others are shared with the previous snapshot.
+    ######
+    def createSnapshot(self, changed = None):
 
-        if protocol == 90024:
-            return self.protocol_90024
-        elif protocol == 90025:
-            return self.protocol_90025
+        if changed != None:
+
+            nodes = dict(self.snapshot.nodes)
+
+            for node in changed:
+                nodes[node.collateral] = node.freeze()
+
+        else:
+
+            nodes = {}
+
+            for collateral, node in self.nodeList.items():
+                nodes[collateral] = node.freeze()
+
+        # The readers must not see the index changes of later cycles
+        if self.snapshot != None and self.snapshot.index.version == self.index.version:
+            index = self.snapshot.index
         else:
-            return len(self.nodeList)
+            index = self.index.copy()
+
+        return NetworkSnapshot(nodes = nodes,
+                               index = index,
+                               last_block = self.lastBlock,
+                               protocol_90024 = self.protocol_90024,
+                               protocol_90025 = self.protocol_90025,
+                               enabled_90024 = self.enabled_90024,
+                               enabled_90025 = self.enabled_90025,
+                               qualified_normal = self.qualifiedNormal,
+                               qualified_upgrade = self.qualifiedUpgrade,
+                               remaining_upgrade_mode_duration = self.remainingUpgradeModeDuration,
+                               protocol_requirement = self.protocolRequirement(),
+                               enabled_with_min_protocol = self.enabledWithMinProtocol(),
+                               minimum_uptime = self.minimumUptime())
+
+    def count(self, protocol = -1):
+        return self.snapshot.count(protocol)
 
     def protocolRequirement(self):
 
@@ -768,127 +1891,51 @@ class SmartNodeList(object):
         return self.enabledWithMinProtocol() * 156
 
     def enabled(self, protocol = -1):
+        return self.snapshot.enabled(protocol)
 
-        if protocol == 90024:
-            return self.enabled_90024
-        elif protocol == 90025:
-            return self.enabled_90025
-        else:
-            return self.enabled_90024 + self.enabled_90025
-
-    def calculateUpgradeModeDuration(self):
+    ######
+    # The upgrade mode ends as soon as enough nodes of the qualifying nodes
+    # reach the minimum uptime. That happens when the node with the
+    # k-th largest uptime reaches it, so the remaining duration is the
+    # difference of its uptime to the minimum uptime.
+    ######
+    def calculateUpgradeModeDuration(self, protocolRequirement, enabledWithMinProtocol, minimumUptime):
 
-        # Start with an accuracy of 5 nodes.
-        # Will become increased if it takes too long
-        accuracy = 20
         # Minimum required nodes to continue with normal mode
-        requiredNodes = int(self.enabledWithMinProtocol() / 3)
-        # Get the max active seconds to determine a start point
-        currentCheckTime = max(list(map(lambda x: x.activeSeconds if x.protocol == 90025 and x.status == 'ENABLED' else 0, self.nodeList.values())))
-        logger.debug("Maximum uptime {}".format(currentCheckTime))
-        # Start value
-        step = currentCheckTime * 0.5
-        currentCheckTime -= step
-
-        # Start time for accuracy descrease if needed
-        start = int(time.time())
-        rounds = 1
-
-        calcCount = None
-
-        while accuracy < 1000:
-
-            step *= 0.5
-
-            calcCount = len(list(filter(lambda x: x.protocol == self.protocolRequirement() and\
-                                                  x.status == 'ENABLED' and\
-                                                  (self.lastBlock - x.collateral.block) >= self.enabledWithMinProtocol() and\
-                                                  x.activeSeconds > currentCheckTime, self.nodeList.values() )))
-
-            logger.debug("Current count: {}".format(calcCount))
-            logger.debug("Current time: {}".format(currentCheckTime))
-            logger.debug("Current accuracy: {}".format(accuracy))
-            logger.debug("Current accuracy matched: {}\n".format(abs(requiredNodes - calcCount)))
-
-            if int(time.time()) - start >= 2 * rounds:
-                rounds += 1
-                accuracy += 20
-
-            if abs(requiredNodes - calcCount) < accuracy:
-                logger.info("Final accuracy {}".format(accuracy))
-                logger.info("Final accuracy matched {}".format(abs(requiredNodes - calcCount)))
-                logger.info("Remaining duration: {}".format( util.secondsToText((self.minimumUptime() - currentCheckTime))))
-                logger.info("CalcTime: {}, Rounds: {}".format( int(time.time()) - start,rounds))
-                return self.minimumUptime() - currentCheckTime
-            elif calcCount > requiredNodes:
-                currentCheckTime += step
-            else:
-                currentCheckTime -= step
+        requiredNodes = math.ceil(enabledWithMinProtocol / 3)
 
-        logger.warning("Could not determine duration?!")
-        logger.warning("Final accuracy {}".format(accuracy))
-        logger.warning("Final accuracy before step out {}".format(abs(requiredNodes - calcCount)))
+        columns = self.columns
 
-        return None
-
-    def getNodeByIp(self, ip):
-        return self.db.getNodeByIp(ip)
+        # Uptimes of the nodes which would qualify with enough uptime
+        qualifying = columns.view('activeSeconds')[(columns.view('protocol') >= protocolRequirement) &\
+                                                   (columns.view('status') == columns.enabledCode) &\
+                                                   ((self.lastBlock - columns.view('collateralBlock')) >= enabledWithMinProtocol)]
 
-    def getNodeCountForProtocol(self, protocol):
-        return self.db.getNodeCount('protocol={}'.format(protocol))
+        if requiredNodes <= 0 or len(qualifying) < requiredNodes:
+            logger.warning("Could not determine duration, {} of {} required nodes qualify".format(len(qualifying), requiredNodes))
+            return None
 
-    def getNodes(self, collaterals):
+        # k-th largest uptime without a full sort
+        index = len(qualifying) - requiredNodes
+        threshold = int(numpy.partition(qualifying, index)[index])
 
-        nodes = []
+        logger.info("Required nodes {}, threshold uptime {}".format(requiredNodes, threshold))
+        logger.info("Remaining duration: {}".format(util.secondsToText(minimumUptime - threshold)))
 
-        for c in collaterals:
+        return max(minimumUptime - threshold, 0)
 
-            collateral = None
+    def getNodeByIp(self, ip):
+        return self.snapshot.getNodeByIp(ip)
 
-            if isinstance(c,Transaction):
-                collateral = collateral
-            else:
-                collateral = Transaction.fromString(c)
-                logger.debug("collateral from string ")
+    def getNodesByPayee(self, payee):
+        return self.snapshot.getNodesByPayee(payee)
 
-            if collateral in self.nodeList:
-                nodes.append(self.nodeList[collateral])
+    def getNodeCountForProtocol(self, protocol):
+        # The database lags behind with the write-behind
+        return self.snapshot.count(protocol)
 
-        return nodes
+    def getNodes(self, collaterals):
+        return self.snapshot.getNodes(collaterals)
 
     def lookup(self, collateral):
-
-        result = None
-        node = self.getNodes([collateral])
-
-        if len(node) == 1:
-            result = {}
-            node = node[0]
-
-            uptimeString = None
-
-            if node.activeSeconds > 0:
-                uptimeString = util.secondsToText(node.activeSeconds)
-            else:
-                uptimeString = "No uptime!"
-
-            result['ip'] = node.cleanIp()
-            result['position'] = node.position < self.enabledWithMinProtocol() * 0.1 and node.position > 0
-            result['position_string'] = node.positionString()
-
-            result['status'] = node.status == 'ENABLED'
-            result['status_string'] = "{}".format(node.status)
-
-            result['uptime'] = node.activeSeconds >= self.minimumUptime()
-            result['uptime_string'] = uptimeString
-
-            result['protocol'] = node.protocol == self.protocolRequirement()
-            result['protocol_string'] = "{}".format(node.protocol)
-
-            result['collateral'] = (self.lastBlock - node.collateral.block) >= self.enabledWithMinProtocol()
-
-            result['collateral_string'] = "{}".format((self.lastBlock - node.collateral.block))
-
-            result['upgrade_mode'] = self.qualifiedUpgrade != -1
-
-        return result
+        return self.snapshot.lookup(collateral)
@@ -331,6 +331,7 @@ class SmartNodeBotTelegram(object):
         #### Setup admin handler, Not public ####
         dp.add_handler(CommandHandler('broadcast', self.broadcast, pass_args=True))
         dp.add_handler(CommandHandler('stats', self.stats, pass_args=True))
+        dp.add_handler(CommandHandler('metrics', self.metrics, pass_args=True))
         dp.add_handler(CommandHandler('loglevel', self.loglevel, pass_args=True))
         dp.add_handler(CommandHandler('settings', self.settings, pass_args=True))
 
@@ -534,6 +535,20 @@ class SmartNodeBotTelegram(object):
             response = common.unknown(self)
             self.sendMessage(update.message.chat_id, response)
 
+    def metrics(self, bot, update, args):
+
+        if len(args) == 1 and\
+           self.adminCheck(update.message.chat_id, args[0]):
+
+            logger.warning("metrics - access granted")
+
+            response = common.metrics(self)
+
+            self.sendMessage(self.admin, response)
+        else:
+            response = common.unknown(self)
+            self.sendMessage(update.message.chat_id, response)
+
     def loglevel(self, bot, update, args):
 
         if len(args) >= 2 and\
@@ -3,27 +3,194 @@
 import os, stat
 import threading
 import sqlite3 as sql
+import urllib.parse
 import re
+from contextlib import contextmanager
 
 import telegram
 import discord
 
+#####
+#
+# SQLite storage with one writer connection and a pool of up to :readers
+# read-only connections. After enableWal() the database runs in WAL mode,
+# so the readers see the last commit and never wait for the writer. The
+# owner enables it once the database is known to be its own.
+#
+#   with storage.read() as db:    pooled reader, never commits
+#   with storage.write() as db:   the single writer, commits at the end
+#                                 or rolls back if the block raised
+#
+# The context manager of the object itself is the writer.
+#
+# In-memory databases can't be shared, the reads use the writer there.
+#
+#####
+
 class ThreadedSQLite(object):
-    def __init__(self, dburi):
+
+    def __init__(self, dburi, readers = 4, timeout = 30):
+
+        self.dburi = dburi
+        self.timeout = timeout
+        self.maxReaders = readers
+
         self.lock = threading.Lock()
-        self.connection = sql.connect(dburi, check_same_thread=False)
+        self.connection = sql.connect(dburi, timeout=timeout, check_same_thread=False)
         self.connection.row_factory = sql.Row
         self.cursor = None
+
+        self.shared = dburi != ':memory:' and not dburi.startswith('file::memory:')
+
+        # Idle reader connections and the number of opened ones
+        self.readerCondition = threading.Condition()
+        self.readers = []
+        self.openedReaders = 0
+
     def __enter__(self):
         self.lock.acquire()
         self.cursor = self.connection.cursor()
         return self
+
     def __exit__(self, type, value, traceback):
+
+        try:
+
+            if type == None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+
+        finally:
+
+            if self.cursor is not None:
+                self.cursor.close()
+                self.cursor = None
+
+            self.lock.release()
+
+        return False
+
+    def write(self):
+        return self
+
+    ######
+    # Switch the database file to the WAL journal. Changes the file on
+    # disk, so only call it after the schema got accepted.
+    ######
+    def enableWal(self):
+
+        if not self.shared:
+            return
+
+        self.lock.acquire()
+
+        try:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # Durable with the WAL except for a power loss
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        finally:
+            self.lock.release()
+
+    def openReader(self):
+
+        if self.dburi.startswith('file:'):
+            uri = self.dburi + ('&' if '?' in self.dburi else '?') + 'mode=ro'
+        else:
+            uri = 'file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(self.dburi)))
+
+        connection = sql.connect(uri, uri=True, timeout=self.timeout, check_same_thread=False)
+        connection.row_factory = sql.Row
+
+        return connection
+
+    def acquireReader(self):
+
+        self.readerCondition.acquire()
+
+        try:
+
+            while not len(self.readers) and self.openedReaders >= self.maxReaders:
+                self.readerCondition.wait()
+
+            if len(self.readers):
+                return self.readers.pop()
+
+            self.openedReaders += 1
+
+        finally:
+            self.readerCondition.release()
+
+        try:
+            return self.openReader()
+        except:
+
+            self.readerCondition.acquire()
+            self.openedReaders -= 1
+            self.readerCondition.notify()
+            self.readerCondition.release()
+
+            raise
+
+    def releaseReader(self, connection):
+
+        self.readerCondition.acquire()
+        self.readers.append(connection)
+        self.readerCondition.notify()
+        self.readerCondition.release()
+
+    @contextmanager
+    def read(self):
+
+        if not self.shared:
+
+            with self as db:
+                yield db
+
+            return
+
+        connection = self.acquireReader()
+        reader = SQLiteReader(connection)
+
+        try:
+            yield reader
+        finally:
+
+            reader.close()
+
+            # Don't hand out a connection with an open transaction
+            if connection.in_transaction:
+                connection.rollback()
+
+            self.releaseReader(connection)
+
+    def close(self):
+
+        self.readerCondition.acquire()
+
+        for connection in self.readers:
+            connection.close()
+
+        self.readers = []
+        self.openedReaders = 0
+
+        self.readerCondition.release()
+
+        self.lock.acquire()
+        self.connection.close()
         self.lock.release()
-        self.connection.commit()
-        if self.cursor is not None:
-            self.cursor.close()
-            self.cursor = None
+
+######
+# The db object of ThreadedSQLite.read(), a cursor of a pooled reader.
+######
+class SQLiteReader(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.cursor()
+
+    def close(self):
+        self.cursor.close()
 
 class RepeatingTimer(object):
 
@@ -100,13 +267,3 @@ def crossMessengerSplit(obj):
         result['chat'] = obj.channel.id
 
     return result
-
-def memcmp ( str1, str2, count):
-
-    while count > 0:
-        count -= 1
-
-        if str1[count] != str2[count]:
-            return -1 if str1[count] < str2[count] else 1
-
-    return 0
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+logger = logging.getLogger("zmqnotify")
+
+#####
+#
+# Subscribes to the hashblock notifications of the daemon
+# (-zmqpubhashblock) and calls :callback with the hash of each new block.
+#
+#####
+
+class BlockNotifier(object):
+
+    def __init__(self, address, callback):
+
+        if zmq == None:
+            raise RuntimeError("pyzmq is required for the block notifications.")
+
+        self.address = address
+        self.callback = callback
+        self.running = False
+        self.thread = None
+        self.sequence = None
+
+    def start(self):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="BlockNotifier", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+
+        self.running = False
+
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+
+        context = zmq.Context.instance()
+        socket = context.socket(zmq.SUB)
+        # Wake up periodically to check if we should stop
+        socket.setsockopt(zmq.RCVTIMEO, 1000)
+        socket.setsockopt(zmq.SUBSCRIBE, b'hashblock')
+        socket.connect(self.address)
+
+        logger.info("Subscribed to hashblock at {}".format(self.address))
+
+        while self.running:
+
+            try:
+                message = socket.recv_multipart()
+            except zmq.Again:
+                continue
+            except zmq.ZMQError as e:
+                logger.error("Receive failed", exc_info=e)
+                continue
+
+            if len(message) < 2 or message[0] != b'hashblock':
+                continue
+
+            if len(message) > 2:
+
+                sequence = int.from_bytes(message[2], 'little')
+
+                if self.sequence != None and sequence != self.sequence + 1:
+                    logger.warning("Missed {} block notifications".format(sequence - self.sequence - 1))
+
+                self.sequence = sequence
+
+            blockHash = message[1].hex()
+
+            logger.info("New block {}".format(blockHash))
+
+            try:
+                self.callback(blockHash)
+            except Exception as e:
+                logger.error("Block callback failed", exc_info=e)
+
+        socket.close()
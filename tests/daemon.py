@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#####
+#
+# Raised by a handler of the FakeDaemon to answer with an error object.
+#
+#####
+
+class DaemonError(Exception):
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+#####
+#
+# In-process JSON-RPC stand-in for the smartcashd. :handlers maps the
+# method names to functions which get called with the params. Counts the
+# accepted connections and the received calls per method.
+#
+# With dropKeepAlive set the connection gets closed after each response
+# without telling the client, like a daemon which dropped an idle
+# keep-alive connection.
+#
+#####
+
+class FakeDaemon(object):
+
+    def __init__(self, handlers = None, port = 0):
+
+        self.handlers = dict(handlers) if handlers else {}
+        self.dropKeepAlive = False
+        self.sem = threading.Lock()
+        self.connections = 0
+        self.sockets = []
+        self.calls = {}
+
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+
+                super().setup()
+
+                daemon.sem.acquire()
+                daemon.connections += 1
+                daemon.sockets.append(self.connection)
+                daemon.sem.release()
+
+            def do_POST(self):
+
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+
+                if isinstance(payload, list):
+                    result = [daemon.answer(x) for x in payload]
+                else:
+                    result = daemon.answer(payload)
+
+                data = json.dumps(result).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+                if daemon.dropKeepAlive:
+                    self.close_connection = True
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def answer(self, request):
+
+        method = request['method']
+
+        self.sem.acquire()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.sem.release()
+
+        response = {'result': None, 'error': None, 'id': request['id']}
+
+        if method not in self.handlers:
+            response['error'] = {'code': -32601, 'message': 'Method not found'}
+            return response
+
+        try:
+            response['result'] = self.handlers[method](*request['params'])
+        except DaemonError as e:
+            response['error'] = {'code': e.code, 'message': str(e)}
+
+        return response
+
+    def count(self, method):
+
+        self.sem.acquire()
+        count = self.calls.get(method, 0)
+        self.sem.release()
+
+        return count
+
+    ######
+    # Stop the server and drop the open keep-alive connections.
+    ######
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+
+        self.sem.acquire()
+
+        for connection in self.sockets:
+
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        self.sockets = []
+
+        self.sem.release()
+
+#####
+#
+# Synthetic network of :count smartnodes with the daemon calls of the
+# SmartNodeList as FakeDaemon handlers. :blocks is the current height.
+#
+#####
+
+class FakeNetwork(object):
+
+    def __init__(self, count, blocks = 500000, now = None):
+
+        now = now if now else int(time.time())
+
+        self.blocks = blocks
+        self.synced = True
+        self.nodes = {}
+
+        for i in range(count):
+
+            collateral = "COutPoint({:064x}, {})".format(i + 1, i % 2)
+
+            self.nodes[collateral] = "ENABLED 90025 S{:033d} {} {} {} {} 10.0.{}.{}:9678".format(i,
+                                                                                              now - 60 - i % 600,
+                                                                                              100000 + i,
+                                                                                              now - 86400 + i,
+                                                                                              400000 + i,
+                                                                                              i // 250,
+                                                                                              i % 250)
+
+    def snsync(self, mode):
+
+        return {'IsBlockchainSynced': self.synced,
+                'IsMasternodeListSynced': self.synced,
+                'IsWinnersListSynced': self.synced}
+
+    def smartnodelist(self, mode = 'full', *params):
+
+        if mode == 'full':
+            return self.nodes
+        elif mode == 'lastseen':
+            return {key: int(value.split()[3]) for key, value in self.nodes.items()}
+        elif mode == 'status':
+            return {key: value.split()[0] for key, value in self.nodes.items()}
+
+        raise DaemonError(-8, "Invalid mode")
+
+    def handlers(self):
+
+        return {'snsync': self.snsync,
+                'getinfo': lambda: {'blocks': self.blocks},
+                'getblockcount': lambda: self.blocks,
+                'smartnodelist': self.smartnodelist,
+                'getrawtransaction': lambda txhash, verbose: {'blockhash': txhash},
+                'getblock': lambda blockHash: {'height': int(blockHash, 16) % 400000}}
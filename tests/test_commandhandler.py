@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from src.commandhandler import common
+from src.metrics import Metrics
+
+######
+# Stand-in for the bot and its nodelist, the formatters only read the
+# messenger and the metrics.
+######
+class FakeBot(object):
+
+    def __init__(self, messenger, metrics):
+
+        class NodeList(object):
+            pass
+
+        self.messenger = messenger
+        self.nodeList = NodeList()
+        self.nodeList.metrics = metrics
+
+class MetricsCommandTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metrics = Metrics()
+
+        self.metrics.increment('nodes_parsed_total', 1000)
+        self.metrics.increment('db_write_errors_total')
+        self.metrics.increment('cycles_skipped_total', 0)
+        self.metrics.gauge('db_queue_depth', 12)
+        self.metrics.observe('cycle_seconds', 1.5, type='refresh')
+        self.metrics.observe('cycle_lag_seconds', 0.01)
+        self.metrics.observe('phase_seconds', 0.2, cycle='refresh', phase='upgrade_duration')
+        self.metrics.observe('db_flush_seconds', 0.05)
+        self.metrics.observe('db_commit_seconds', 0.02)
+        self.metrics.observe('db_write_delay_seconds', 2.1)
+
+    def testTelegramMarkdown(self):
+
+        response = common.metrics(FakeBot('telegram', self.metrics))
+
+        # A single underscore opens an italic entity which never ends
+        self.assertNotIn('_', response)
+        self.assertEqual(response.count('*') % 2, 0)
+        self.assertEqual(response.count('`') % 2, 0)
+
+        for name in ('nodes parsed: 1000', 'db write errors: 1', 'cycle refresh: 1,',
+                     'phase refresh upgrade duration: 1,', 'cycle lag: 1,', 'db flush: 1,',
+                     'db commit: 1,', 'db write delay: 1,'):
+            self.assertIn(name, response)
+
+    def testDiscordMarkdown(self):
+
+        response = common.metrics(FakeBot('discord', self.metrics))
+
+        # Only the underline markers of the title
+        self.assertEqual(response.count('_'), 4)
+        self.assertIn('db write delay: 1,', response)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from src import database
+
+class BotDatabaseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+
+        self.path = os.path.join(directory, 'bot.db')
+        self.db = database.BotDatabase(self.path)
+
+        self.db.addNode('aa-0', 'Bravo', 1, 'first')
+        self.db.addNode('bb-1', 'Alpha', 1, 'first')
+        self.db.addNode('aa-0', 'Shared', 2, 'second')
+        # Discord ids are strings
+        self.db.addNode('cc-0', 'Other', '3', 'third')
+
+    def row(self, row):
+        return dict(row) if row != None else None
+
+    def rows(self, rows):
+        return list(map(self.row, rows))
+
+    ######
+    # Compare all reads of the cache with a fresh load of the database.
+    ######
+    def assertCoherent(self):
+
+        fresh = database.BotDatabase(self.path)
+
+        self.assertEqual(self.rows(self.db.getUsers()), self.rows(fresh.getUsers()))
+        self.assertEqual(self.rows(self.db.getAllNodes()), self.rows(fresh.getAllNodes()))
+
+        for userId in (1, 2, 3, '3', 4):
+            self.assertEqual(self.row(self.db.getUser(userId)), self.row(fresh.getUser(userId)))
+            self.assertEqual(self.rows(self.db.getAllNodes(userId)), self.rows(fresh.getAllNodes(userId)))
+
+        for collateral in ('aa-0', 'bb-1', 'cc-0', 'dd-0'):
+
+            self.assertEqual(self.rows(self.db.getNodes(collateral)), self.rows(fresh.getNodes(collateral)))
+
+            for userId in (1, 2, 3):
+                self.assertEqual(self.row(self.db.getNodes(collateral, userId)), self.row(fresh.getNodes(collateral, userId)))
+
+        fresh.connection.close()
+
+    def testReadsDontQuery(self):
+
+        with mock.patch.object(self.db.connection, 'read', side_effect=AssertionError("read query")):
+
+            self.assertEqual(self.db.getUser(1)['name'], 'first')
+            self.assertEqual([x['name'] for x in self.db.getAllNodes(1)], ['Alpha', 'Bravo'])
+            self.assertEqual(self.db.getNodes('aa-0', 2)['name'], 'Shared')
+            self.assertEqual(len(self.db.getNodes('aa-0')), 2)
+            self.assertEqual(self.db.getUser('3')['name'], 'third')
+            self.assertEqual(len(self.db.getUsers()), 3)
+
+        self.assertCoherent()
+
+    def testAddNode(self):
+
+        self.assertTrue(self.db.addNode('dd-0', 'New', 4, 'fourth'))
+        # Known nodes are skipped
+        self.assertFalse(self.db.addNode('aa-0', 'Again', 1, 'first'))
+
+        self.assertEqual(self.db.getUser(4)['name'], 'fourth')
+        self.assertEqual(self.db.getNodes('dd-0', 4)['name'], 'New')
+        self.assertEqual(self.db.getNodes('aa-0', 1)['name'], 'Bravo')
+
+        self.assertCoherent()
+
+    def testUpdates(self):
+
+        self.db.updateNode('aa-0', 1, 'Aardvark')
+        self.db.updateUsername('renamed', 2)
+        self.db.updateStatusNotification(1, 0)
+        self.db.updateTimeoutNotification(2, 0)
+        self.db.updateRewardNotification('3', 0)
+        self.db.updateNetworkNotification(1, 1)
+
+        # Ordered by name again
+        self.assertEqual([x['name'] for x in self.db.getAllNodes(1)], ['Aardvark', 'Alpha'])
+        self.assertEqual(self.db.getNodes('aa-0', 2)['name'], 'Shared')
+        self.assertEqual(self.db.getUser(2)['name'], 'renamed')
+        self.assertEqual(self.db.getUser(1)['status_n'], 0)
+        self.assertEqual(self.db.getUser(1)['network_n'], 1)
+        self.assertEqual(self.db.getUser(3)['reward_n'], 0)
+
+        self.assertCoherent()
+
+    def testDeleteNode(self):
+
+        self.db.deleteNode('aa-0', 1)
+
+        self.assertIsNone(self.db.getNodes('aa-0', 1))
+        self.assertEqual(self.db.getNodes('aa-0', 2)['name'], 'Shared')
+        self.assertEqual([x['name'] for x in self.db.getAllNodes(1)], ['Alpha'])
+
+        self.db.deleteNodesForUser(1)
+
+        self.assertEqual(self.db.getAllNodes(1), [])
+        self.assertEqual(self.db.getNodes('bb-1'), [])
+
+        self.assertCoherent()
+
+    def testDeleteNodesWithId(self):
+
+        # Cached results of both users
+        self.assertEqual(len(self.db.getAllNodes(1)), 2)
+        self.assertEqual(len(self.db.getAllNodes(2)), 1)
+
+        self.db.deleteNodesWithId('aa-0')
+
+        self.assertEqual([x['name'] for x in self.db.getAllNodes(1)], ['Alpha'])
+        self.assertEqual(self.db.getAllNodes(2), [])
+        self.assertEqual(self.db.getNodes('aa-0'), [])
+        self.assertNotIn('aa-0', [x['collateral'] for x in self.db.getAllNodes()])
+
+        self.assertCoherent()
+
+    def testDeleteUser(self):
+
+        self.db.deleteUser('3')
+
+        self.assertIsNone(self.db.getUser(3))
+        self.assertEqual(len(self.db.getUsers()), 2)
+
+        self.assertCoherent()
+
+    def testFailedWriteKeepsTheCache(self):
+
+        users = self.rows(self.db.getUsers())
+        nodes = self.rows(self.db.getAllNodes())
+
+        with self.assertRaises(sqlite3.Error):
+            self.db.execute("UPDATE missing SET name=?", ['x'], [1])
+
+        self.assertEqual(self.rows(self.db.getUsers()), users)
+        self.assertEqual(self.rows(self.db.getAllNodes()), nodes)
+
+        self.assertCoherent()
+
+if __name__ == '__main__':
+    unittest.main()
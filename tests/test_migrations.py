@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from src import database
+from src import migrations
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    ######
+    # Create the database :name with the statements :schema and return its path.
+    ######
+    def create(self, name, *schema):
+
+        path = os.path.join(self.directory, name)
+
+        connection = sqlite3.connect(path)
+
+        for statement in schema:
+            connection.execute(statement)
+
+        connection.commit()
+        connection.close()
+
+        return path
+
+    def query(self, path, query):
+
+        connection = sqlite3.connect(path)
+        rows = connection.execute(query).fetchall()
+        connection.close()
+
+        return rows
+
+    def testFreshDatabases(self):
+
+        botPath = os.path.join(self.directory, 'bot.db')
+        nodePath = os.path.join(self.directory, 'nodes.db')
+
+        database.BotDatabase(botPath)
+        database.NodeDatabase(nodePath)
+
+        self.assertEqual(self.query(botPath, "PRAGMA user_version"), [(migrations.botMigrations[-1][0],)])
+        self.assertEqual(self.query(nodePath, "PRAGMA user_version"), [(migrations.nodeMigrations[-1][0],)])
+
+        self.assertEqual(self.query(botPath, "PRAGMA journal_mode"), [('wal',)])
+        self.assertEqual(self.query(nodePath, "PRAGMA journal_mode"), [('wal',)])
+
+    def testUnversionedLayout(self):
+
+        path = self.create('bot.db',
+                           "CREATE TABLE users (id INTEGER PRIMARY KEY, name INTEGER, status_n INTEGER, reward_n INTEGER,\
+                                                timeout_n INTEGER, network_n INTEGER, detail_n INTEGER, last_activity INTEGER)",
+                           "CREATE TABLE nodes (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,\
+                                                collateral STRING NOT NULL, name TEXT NOT NULL)",
+                           "INSERT INTO nodes (user_id, collateral, name) VALUES (1, 'aa-0', 'first')",
+                           "INSERT INTO nodes (user_id, collateral, name) VALUES (1, 'aa-0', 'second')",
+                           "INSERT INTO nodes (user_id, collateral, name) VALUES (2, 'aa-0', 'other')")
+
+        database.BotDatabase(path)
+
+        self.assertEqual(self.query(path, "PRAGMA user_version"), [(2,)])
+        self.assertEqual(self.query(path, "SELECT user_id, name FROM nodes ORDER BY id"), [(1, 'first'), (2, 'other')])
+
+    def testLegacyLayout(self):
+
+        botPath = self.create('bot.db',
+                              "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, last_activity INTEGER)",
+                              "CREATE TABLE nodes (node_id INTEGER, user_id INTEGER, name TEXT)")
+
+        nodePath = self.create('nodes.db',
+                               "CREATE TABLE nodes (id INTEGER PRIMARY KEY, txhash TEXT, txindex INTEGER, payee TEXT, status TEXT)")
+
+        with self.assertRaises(migrations.MigrationError):
+            database.BotDatabase(botPath)
+
+        with self.assertRaises(migrations.MigrationError):
+            database.NodeDatabase(nodePath)
+
+        # Nothing got stamped or created
+        self.assertEqual(self.query(botPath, "PRAGMA user_version"), [(0,)])
+        self.assertEqual(self.query(nodePath, "PRAGMA user_version"), [(0,)])
+        self.assertEqual(self.query(nodePath, "SELECT name FROM sqlite_master WHERE type = 'index'"), [])
+
+        # And the journal of the files is untouched
+        for path in (botPath, nodePath):
+            self.assertEqual(self.query(path, "PRAGMA journal_mode"), [('delete',)])
+            self.assertFalse(os.path.exists(path + '-wal'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import time
+import unittest
+
+from src.rpc import SmartCashRPC, RPCPool, RPCError, streamResult
+from tests.daemon import FakeDaemon, FakeNetwork, DaemonError
+
+def failing(*params):
+    raise DaemonError(-5, "No information available about transaction")
+
+class SmartCashRPCTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.nodes = {"COutPoint({:064x}, {})".format(i, i % 2): "ENABLED 90025 S{} {}".format(i, 1500000000 + i)
+                      for i in range(500)}
+
+        self.daemon = FakeDaemon({'getblockcount': lambda: 1000,
+                                  'getblock': lambda blockHash: {'height': int(blockHash)},
+                                  'getrawtransaction': failing,
+                                  'smartnodelist': lambda mode: self.nodes})
+
+        self.rpc = SmartCashRPC('127.0.0.1', self.daemon.port, 'user', 'password', timeout = 5)
+
+    def tearDown(self):
+        self.rpc.close()
+        self.daemon.stop()
+
+    def testKeepAlive(self):
+
+        for i in range(5):
+            self.assertEqual(self.rpc.call('getblockcount'), 1000)
+
+        self.assertEqual(self.daemon.connections, 1)
+
+    def testReconnectAfterDroppedConnection(self):
+
+        self.daemon.dropKeepAlive = True
+
+        self.assertEqual(self.rpc.call('getblockcount'), 1000)
+        # The pooled connection is closed by now, the retry opens a new one
+        self.assertEqual(self.rpc.call('getblockcount'), 1000)
+
+        self.assertEqual(self.daemon.connections, 2)
+        self.assertEqual(self.daemon.count('getblockcount'), 2)
+
+        stats = self.rpc.latency()['getblockcount']
+        self.assertEqual(stats['calls'], 2)
+        self.assertEqual(stats['errors'], 0)
+
+    def testCallError(self):
+
+        with self.assertRaises(RPCError) as context:
+            self.rpc.call('getrawtransaction', 'aa', 1)
+
+        self.assertEqual(context.exception.code, -5)
+        self.assertFalse(context.exception.transport)
+
+    def testTransportError(self):
+
+        self.daemon.stop()
+
+        with self.assertRaises(RPCError) as context:
+            self.rpc.call('getblockcount')
+
+        self.assertTrue(context.exception.transport)
+
+    def testBatchErrorMapping(self):
+
+        calls = [('getblock', '7'),
+                 ('getrawtransaction', 'aa', 1),
+                 ('unknown',),
+                 ('getblock', '9')]
+
+        results = self.rpc.batch(calls * 3, chunkSize = 5)
+
+        self.assertEqual(len(results), 12)
+        self.assertEqual(self.daemon.count('getblock'), 6)
+
+        for offset in range(0, 12, 4):
+
+            self.assertEqual(results[offset], {'height': 7})
+            self.assertIsInstance(results[offset + 1], RPCError)
+            self.assertEqual(results[offset + 1].code, -5)
+            self.assertIsInstance(results[offset + 2], RPCError)
+            self.assertEqual(results[offset + 2].code, -32601)
+            self.assertEqual(results[offset + 3], {'height': 9})
+
+    def testStream(self):
+
+        members = list(self.rpc.stream('smartnodelist', 'full'))
+
+        self.assertEqual(dict(members), self.nodes)
+        self.assertEqual([x[0] for x in members], list(self.nodes.keys()))
+
+        # The connection is reusable after the stream
+        self.assertEqual(self.rpc.call('getblockcount'), 1000)
+        self.assertEqual(self.daemon.connections, 1)
+
+class StreamResultTest(unittest.TestCase):
+
+    def parse(self, response, chunkSize = 7):
+
+        data = io.BytesIO(json.dumps(response).encode('utf-8'))
+
+        return list(streamResult(lambda size: data.read(min(size, chunkSize))))
+
+    def testChunks(self):
+
+        result = {'a': 1, 'b': -2.5e3, 'c': 'x y', 'd': [1, {'e': None}], 'f': 'ünïcode'}
+
+        for chunkSize in (1, 2, 3, 64):
+            self.assertEqual(dict(self.parse({'result': result, 'error': None, 'id': 1}, chunkSize)), result)
+
+    def testErrorEnvelope(self):
+
+        with self.assertRaises(RPCError) as context:
+            self.parse({'result': None, 'error': {'code': -28, 'message': 'Loading'}, 'id': 1})
+
+        self.assertEqual(context.exception.code, -28)
+        self.assertFalse(context.exception.transport)
+
+    def testTruncated(self):
+
+        data = io.BytesIO(b'{"result": {"a": 1, "b": 2')
+
+        with self.assertRaises(RPCError) as context:
+            list(streamResult(data.read))
+
+        self.assertTrue(context.exception.transport)
+
+def warmingUp(*params):
+    raise DaemonError(RPCPool.WARMUP_ERROR, "Loading block index...")
+
+class RPCPoolTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.networks = [FakeNetwork(0), FakeNetwork(0)]
+        self.daemons = [FakeDaemon(x.handlers()) for x in self.networks]
+        self.clients = [SmartCashRPC('127.0.0.1', x.port, 'user', 'password', timeout = 5) for x in self.daemons]
+
+        self.pool = RPCPool(self.clients, checkInterval = 3600, checkTimeout = 0.5, minRetry = 0.5, maxRetry = 0.5)
+
+        self.primary, self.secondary = self.pool.endpoints
+
+    def tearDown(self):
+
+        self.pool.close()
+
+        for daemon in self.daemons:
+            daemon.stop()
+
+    def warmUp(self, index):
+
+        for method in ('snsync', 'getblockcount', 'getinfo'):
+            self.daemons[index].handlers[method] = warmingUp
+
+    def recover(self, index):
+        self.daemons[index].handlers.update(self.networks[index].handlers())
+
+    def testPrefersTheCurrentEndpoint(self):
+
+        for i in range(3):
+            self.assertEqual(self.pool.call('getblockcount'), 500000)
+
+        self.assertIs(self.pool.current, self.primary)
+        self.assertEqual(self.daemons[0].count('getblockcount'), 4)
+        self.assertEqual(self.daemons[1].count('getblockcount'), 1)
+
+    def testDeadPrimary(self):
+
+        self.daemons[0].stop()
+
+        self.assertEqual(self.pool.call('getblockcount'), 500000)
+
+        self.assertIs(self.pool.current, self.secondary)
+        self.assertFalse(self.primary.available(time.time()))
+        self.assertGreater(self.primary.failures, 0)
+
+    def testWarmup(self):
+
+        self.warmUp(0)
+
+        self.assertEqual(self.pool.call('getblockcount'), 500000)
+
+        self.assertIs(self.pool.current, self.secondary)
+        self.assertFalse(self.primary.available(time.time()))
+
+        # Inside the backoff the primary doesn't get asked
+        calls = self.daemons[0].count('getblockcount')
+        self.pool.call('getblockcount')
+        self.assertEqual(self.daemons[0].count('getblockcount'), calls)
+
+    def testUnsyncedFailover(self):
+
+        self.assertIs(self.pool.current, self.primary)
+        self.assertTrue(self.pool.call('snsync', 'status')['IsBlockchainSynced'])
+
+        # The primary reports unsynced between the health checks
+        self.networks[0].synced = False
+
+        self.assertTrue(self.pool.call('snsync', 'status')['IsBlockchainSynced'])
+        self.assertIs(self.pool.current, self.secondary)
+        self.assertFalse(self.primary.synced)
+
+        calls = self.daemons[0].count('getblockcount')
+        self.pool.call('getblockcount')
+        self.assertEqual(self.daemons[0].count('getblockcount'), calls)
+
+        # Without a synced endpoint the unsynced state gets through
+        self.networks[1].synced = False
+
+        self.assertFalse(self.pool.call('snsync', 'status')['IsBlockchainSynced'])
+
+    def testRecoveryAfterBackoff(self):
+
+        self.warmUp(0)
+
+        self.assertEqual(self.pool.call('getblockcount'), 500000)
+        self.assertIs(self.pool.current, self.secondary)
+
+        self.recover(0)
+        self.daemons[1].stop()
+
+        # Inside the backoff the primary is only the last resort
+        self.assertEqual(self.pool.call('getblockcount'), 500000)
+        self.assertIs(self.pool.current, self.primary)
+        self.assertEqual(self.primary.failures, 0)
+
+        time.sleep(0.6)
+
+        # The secondary is back in the rotation after its backoff
+        self.assertTrue(self.secondary.available(time.time()))
+
+    def testBoundedHealthCheck(self):
+
+        def hanging(*params):
+            time.sleep(2)
+            return self.networks[0].snsync(*params)
+
+        self.daemons[0].handlers['snsync'] = hanging
+        self.pool.minRetry = self.pool.maxRetry = 30
+
+        start = time.monotonic()
+        self.pool.check()
+        seconds = time.monotonic() - start
+
+        self.assertLess(seconds, 1.5)
+        self.assertFalse(self.primary.available(time.time()))
+        self.assertTrue(self.secondary.healthy(time.time()))
+        self.assertIs(self.pool.current, self.secondary)
+
+if __name__ == '__main__':
+    unittest.main()
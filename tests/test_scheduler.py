@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+import unittest
+from unittest import mock
+
+from src.metrics import Metrics
+from src.scheduler import CycleScheduler
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.metrics = Metrics()
+        self.scheduler = CycleScheduler(lambda: True, 10, maxBackoff = 60, metrics = self.metrics)
+        self.scheduler.nextRun = 100
+
+    ######
+    # Schedule after a cycle which started at :started and ended at :now.
+    ######
+    def schedule(self, started, now, triggered = False, healthy = True):
+
+        with mock.patch('src.scheduler.time.monotonic', return_value=now):
+            self.scheduler.schedule(started, triggered, healthy)
+
+        return self.scheduler.nextRun
+
+    def testGridFromTheCycleStart(self):
+
+        # A slow cycle doesn't push the next one back
+        self.assertEqual(self.schedule(100, 107), 110)
+        self.assertEqual(self.schedule(110, 111), 120)
+        self.assertEqual(self.schedule(120.5, 129.9), 130)
+
+    def testMissedSlots(self):
+
+        # Ran over two slots, the next cycle starts right away on the grid
+        self.assertEqual(self.schedule(100, 125), 120)
+        self.assertEqual(self.scheduler.skipped, 1)
+
+        self.assertEqual(self.schedule(120, 121), 130)
+        self.assertEqual(self.metrics.counter('cycles_skipped_total'), 1)
+
+    def testTriggeredCycle(self):
+
+        # Ahead of its slot, the slot stays
+        self.assertEqual(self.schedule(95, 96, triggered = True), 100)
+        # Started at its slot, used up
+        self.assertEqual(self.schedule(100, 101, triggered = True), 110)
+
+    def testBackoff(self):
+
+        self.assertEqual(self.schedule(100, 101, healthy = False), 120)
+        self.assertEqual(self.schedule(120, 121, healthy = False), 160)
+        self.assertEqual(self.schedule(160, 161, healthy = False), 220)
+        # Capped at maxBackoff
+        self.assertEqual(self.schedule(220, 221, healthy = False), 280)
+        self.assertEqual(self.scheduler.failures, 4)
+
+        # A healthy cycle continues the grid from its start
+        self.assertEqual(self.schedule(280, 282), 290)
+        self.assertEqual(self.scheduler.failures, 0)
+
+class CycleSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.starts = []
+        self.results = []
+        self.duration = 0
+        self.running = 0
+        self.overlaps = 0
+        self.sem = threading.Lock()
+        self.scheduler = None
+
+    def tearDown(self):
+
+        if self.scheduler:
+            self.scheduler.stop()
+
+    def cycle(self):
+
+        self.sem.acquire()
+        self.running += 1
+        self.overlaps += self.running > 1
+        self.starts.append(time.monotonic())
+        result = self.results.pop(0) if len(self.results) else True
+        self.sem.release()
+
+        time.sleep(self.duration)
+
+        self.sem.acquire()
+        self.running -= 1
+        self.sem.release()
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    def waitForCycles(self, count, timeout = 5):
+
+        deadline = time.monotonic() + timeout
+
+        while len(self.starts) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertGreaterEqual(len(self.starts), count)
+
+    def testDriftFreeCadence(self):
+
+        self.duration = 0.06
+        self.scheduler = CycleScheduler(self.cycle, 0.2)
+        self.scheduler.start()
+
+        self.waitForCycles(5)
+        self.scheduler.stop()
+
+        # Measured from the cycle starts, the durations don't add up
+        for i, start in enumerate(self.starts[:5]):
+            self.assertAlmostEqual(start - self.starts[0], i * 0.2, delta = 0.05)
+
+    def testBackoffAfterFailures(self):
+
+        self.results = [False, RuntimeError("Daemon down"), True]
+        self.scheduler = CycleScheduler(self.cycle, 0.1)
+        self.scheduler.start()
+
+        self.waitForCycles(4)
+        self.scheduler.stop()
+
+        # 0.2s after the failure, 0.4s after the exception, then the grid
+        self.assertAlmostEqual(self.starts[1] - self.starts[0], 0.2, delta = 0.05)
+        self.assertAlmostEqual(self.starts[2] - self.starts[1], 0.4, delta = 0.05)
+        self.assertAlmostEqual(self.starts[3] - self.starts[2], 0.1, delta = 0.05)
+        self.assertEqual(self.scheduler.failures, 0)
+
+    def testTriggersDontOverlap(self):
+
+        self.duration = 0.1
+        self.scheduler = CycleScheduler(self.cycle, 600)
+        self.scheduler.start()
+
+        self.waitForCycles(1)
+
+        # Triggers during a cycle run one cycle after it
+        for i in range(5):
+            self.scheduler.trigger()
+            time.sleep(0.01)
+
+        self.waitForCycles(2)
+        time.sleep(0.3)
+
+        self.assertEqual(len(self.starts), 2)
+        self.assertEqual(self.overlaps, 0)
+
+if __name__ == '__main__':
+    unittest.main()
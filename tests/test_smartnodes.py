@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+
+import gc
+import os
+import random
+import functools
+import math
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from src import database
+from src.rpc import SmartCashRPC, RPCError
+from src.smartnodes import SmartNode, SmartNodeList, Transaction, CollateralResolver, PayoutQueue, TimeoutQueue
+from tests.daemon import FakeDaemon, FakeNetwork, DaemonError
+
+######
+# Collateral string "hash-index" of the nodelist key :key.
+######
+def collateralString(key):
+    return "{}-{}".format(*re.match(r'COutPoint\((\w+), (\d+)\)', key).groups())
+
+class SmartNodeListTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+        self.network = FakeNetwork(100)
+        self.daemon = FakeDaemon(self.network.handlers())
+        self.addCleanup(self.daemon.stop)
+
+        rpc = SmartCashRPC('127.0.0.1', self.daemon.port, 'user', 'password', timeout = 5)
+        self.addCleanup(rpc.close)
+
+        self.nodeList = SmartNodeList(database.NodeDatabase(os.path.join(self.directory, 'nodes.db')), rpc)
+
+        self.assertTrue(self.nodeList.updateList())
+
+    ######
+    # Run a full refresh with a new block.
+    ######
+    def refresh(self):
+
+        self.network.blocks += 1
+        self.assertTrue(self.nodeList.updateList())
+        self.assertEqual(self.nodeList.lastBlock, self.network.blocks)
+
+    def testSnapshotIndexIsDetached(self):
+
+        keys = list(self.network.nodes.keys())
+        moved, removed = keys[0], keys[1]
+
+        snapshot = self.nodeList.snapshot
+        movedNode = snapshot.getNodes([collateralString(moved)])[0]
+        removedNode = snapshot.getNodes([collateralString(removed)])[0]
+
+        self.network.nodes[moved] = self.network.nodes[moved].replace(movedNode.ip, '10.99.0.1:9678')
+        del self.network.nodes[removed]
+
+        added = "COutPoint({:064x}, 0)".format(999999)
+        self.network.nodes[added] = self.network.nodes[keys[2]].replace('10.0.0.2:9678', '10.98.0.1:9678')
+
+        self.refresh()
+
+        # The old snapshot keeps its state
+        self.assertIs(snapshot.getNodeByIp(movedNode.cleanIp()).collateral, movedNode.collateral)
+        self.assertIsNone(snapshot.getNodeByIp('10.99.0.1'))
+        self.assertIs(snapshot.getNodeByIp(removedNode.cleanIp()).collateral, removedNode.collateral)
+        self.assertEqual(snapshot.getNodes([collateralString(added)]), [])
+
+        current = self.nodeList.snapshot
+
+        self.assertEqual(str(current.getNodeByIp('10.99.0.1').collateral), collateralString(moved))
+        self.assertIsNone(current.getNodeByIp(movedNode.cleanIp()))
+        self.assertIsNone(current.getNodeByIp(removedNode.cleanIp()))
+        self.assertEqual(len(current.getNodes([collateralString(added)])), 1)
+        self.assertEqual(str(current.getNodeByIp('10.98.0.1').collateral), collateralString(added))
+
+    def testProbeKeepsTheIndex(self):
+
+        snapshot = self.nodeList.snapshot
+
+        self.assertTrue(self.nodeList.updateList())
+
+        self.assertIsNot(self.nodeList.snapshot, snapshot)
+        self.assertIs(self.nodeList.snapshot.index, snapshot.index)
+
+    def testSnapshotCollateralIsDetached(self):
+
+        collateral = next(iter(self.nodeList.nodeList))
+        frozen = self.nodeList.snapshot.nodes[collateral]
+
+        self.assertIsNot(frozen.collateral, collateral)
+
+        block = frozen.collateral.block
+        collateral.updateBlock(block + 1)
+
+        self.assertEqual(frozen.collateral.block, block)
+
+    def testProbePublishesTheLastSeen(self):
+
+        key = next(iter(self.network.nodes))
+        fields = self.network.nodes[key].split()
+        fields[3] = str(int(fields[3]) + 5)
+        self.network.nodes[key] = " ".join(fields)
+
+        # Same block, the cycle only probes
+        self.assertTrue(self.nodeList.updateList())
+
+        node = self.nodeList.snapshot.getNodes([collateralString(key)])[0]
+
+        self.assertEqual(node.lastSeen, int(fields[3]))
+        self.assertEqual(node.status, 'ENABLED')
+
+    def testRefreshParsesOnlyTheChangedLines(self):
+
+        key = next(iter(self.network.nodes))
+        self.network.nodes[key] = self.network.nodes[key].replace('ENABLED', 'EXPIRED')
+
+        parsed = self.nodeList.metrics.counter('nodes_parsed_total')
+
+        self.refresh()
+
+        self.assertEqual(self.nodeList.metrics.counter('nodes_parsed_total') - parsed, 1)
+        self.assertEqual(self.nodeList.snapshot.getNodes([collateralString(key)])[0].status, 'EXPIRED')
+
+    def testCountsFromTheSnapshot(self):
+
+        # Like a database behind the write-behind queue
+        with self.nodeList.db.connection.write() as db:
+            db.cursor.execute("DELETE FROM nodes")
+
+        self.assertEqual(self.nodeList.getNodeCountForProtocol(90025), 100)
+        self.assertEqual(self.nodeList.getNodeCountForProtocol(90024), 0)
+
+    def testConstructorDoesntFreezeTheGc(self):
+
+        count = gc.get_freeze_count()
+
+        SmartNodeList(database.NodeDatabase(os.path.join(self.directory, 'other.db')))
+
+        self.assertEqual(gc.get_freeze_count(), count)
+
+    def testFailedBlockCountProbes(self):
+
+        def failing():
+            raise DaemonError(-1, "Block count failed")
+
+        self.daemon.handlers['getblockcount'] = failing
+
+        cycles = []
+        refreshList = self.nodeList.refreshList
+        probeList = self.nodeList.probeList
+
+        def refresh():
+            cycles.append('refresh')
+            return refreshList()
+
+        def probe():
+            cycles.append('probe')
+            return probeList()
+
+        self.nodeList.refreshList = refresh
+        self.nodeList.probeList = probe
+
+        for i in range(3):
+            self.assertTrue(self.nodeList.updateList())
+
+        self.assertEqual(cycles, ['probe'] * 3)
+
+        # The refresh interval still applies
+        self.nodeList.lastRefresh -= self.nodeList.refreshInterval
+
+        self.assertTrue(self.nodeList.updateList())
+        self.assertEqual(cycles[-1], 'refresh')
+
+    def testFailedParseReleasesTheLock(self):
+
+        added = "COutPoint({:064x}, 0)".format(999999)
+        self.network.nodes[added] = self.network.nodes[next(iter(self.network.nodes))].replace('10.0.0.0:9678', '10.98.0.1:9678')
+
+        fromRaw = SmartNode.fromRaw
+        failures = []
+
+        def failing(collateral, raw):
+
+            if not len(failures):
+                failures.append(collateral)
+                raise IndexError("Malformed nodelist line")
+
+            return fromRaw(collateral, raw)
+
+        with mock.patch.object(SmartNode, 'fromRaw', side_effect=failing):
+
+            self.network.blocks += 1
+
+            with self.assertRaises(IndexError):
+                self.nodeList.updateList()
+
+            self.assertFalse(self.nodeList.nodeListSem.locked())
+            self.assertFalse(self.nodeList.cycleSem.locked())
+
+            self.refresh()
+
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(len(self.nodeList.snapshot.getNodes([collateralString(added)])), 1)
+
+class TimeoutQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collaterals = [Transaction('{:064x}'.format(i + 1), 0, -1) for i in range(5)]
+        self.queue = TimeoutQueue()
+
+    def testExpiredInOrder(self):
+
+        for collateral, deadline in zip(self.collaterals, (50, 10, 40, 20, 30)):
+            self.queue.schedule(collateral, deadline)
+
+        self.assertEqual(self.queue.expired(5), [])
+        self.assertEqual(self.queue.expired(30), [self.collaterals[1], self.collaterals[3], self.collaterals[4]])
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.expired(100), [self.collaterals[2], self.collaterals[0]])
+        self.assertEqual(self.queue.expired(1000), [])
+
+    def testRescheduleAndRemove(self):
+
+        first, second, third = self.collaterals[:3]
+
+        self.queue.schedule(first, 50)
+        # A later deadline keeps the earlier one
+        self.queue.schedule(first, 80)
+        # An earlier one replaces it
+        self.queue.schedule(second, 50)
+        self.queue.schedule(second, 20)
+
+        self.queue.schedule(third, 30)
+        self.queue.remove(third)
+
+        self.assertEqual(self.queue.expired(49), [second])
+        self.assertEqual(self.queue.expired(79), [first])
+        self.assertNotIn(first, self.queue)
+
+        # None unschedules
+        self.queue.schedule(first, 90)
+        self.queue.schedule(first, None)
+
+        self.assertEqual(self.queue.expired(1000), [])
+        self.assertEqual(len(self.queue), 0)
+
+    def testCompaction(self):
+
+        collateral = self.collaterals[0]
+
+        for deadline in range(5000, 0, -1):
+            self.queue.schedule(collateral, deadline)
+
+        self.assertLessEqual(len(self.queue.heap), 1024 + 3)
+        self.assertEqual(self.queue.expired(1), [collateral])
+
+class TimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+
+        self.now = int(time.time())
+
+        self.network = FakeNetwork(100, now = self.now)
+        self.daemon = FakeDaemon(self.network.handlers())
+        self.addCleanup(self.daemon.stop)
+
+        rpc = SmartCashRPC('127.0.0.1', self.daemon.port, 'user', 'password', timeout = 5)
+        self.addCleanup(rpc.close)
+
+        self.nodeList = SmartNodeList(database.NodeDatabase(os.path.join(directory, 'nodes.db')), rpc)
+
+        self.assertTrue(self.nodeList.updateList())
+
+    def testNodeTimeline(self):
+
+        node = next(iter(self.nodeList.nodeList.values()))
+        lastSeen = node.lastSeen
+
+        self.assertEqual(node.timeoutDeadline(lastSeen + 100), lastSeen + 1801)
+
+        # Enters the window
+        self.assertFalse(node.checkTimeout(lastSeen + 1800))
+        self.assertTrue(node.checkTimeout(lastSeen + 1801))
+        self.assertEqual(node.timeout, lastSeen + 1801)
+
+        # Notified again after 5 minutes
+        deadline = node.timeoutDeadline(lastSeen + 1801)
+        self.assertEqual(deadline, lastSeen + 1801 + 301)
+        self.assertFalse(node.checkTimeout(deadline - 1))
+        self.assertTrue(node.checkTimeout(deadline))
+
+        # An overdue notification is due right away
+        self.assertEqual(node.timeoutDeadline(lastSeen + 3800), lastSeen + 3801)
+        self.assertTrue(node.checkTimeout(lastSeen + 3800))
+
+        # Relaxed after the window
+        self.assertEqual(node.timeoutDeadline(lastSeen + 3800), lastSeen + 3900)
+        self.assertTrue(node.checkTimeout(lastSeen + 3900))
+        self.assertEqual(node.timeout, -1)
+        self.assertIsNone(node.timeoutDeadline(lastSeen + 3900))
+
+    def testOnlyExpiredNodesGetEvaluated(self):
+
+        # The lastseen of node i is now - 60 - i, i >= 41 enter the window
+        # at now + 1700
+        expected = {c for c, node in self.nodeList.nodeList.items() if node.lastSeen + 1801 <= self.now + 1700}
+        self.assertEqual(len(expected), 59)
+
+        checkTimeout = SmartNode.checkTimeout
+        evaluated = []
+
+        def counting(node, now):
+            evaluated.append(node.collateral)
+            return checkTimeout(node, now)
+
+        updates = {}
+
+        with mock.patch.object(SmartNode, 'checkTimeout', autospec=True, side_effect=counting),\
+             mock.patch('src.smartnodes.time.time', return_value=self.now + 1700):
+            self.nodeList.checkTimeouts(updates)
+
+        self.assertEqual(set(evaluated), expected)
+        self.assertEqual(len(evaluated), len(expected))
+        self.assertEqual(set(updates.keys()), expected)
+
+        for node, update in updates.values():
+            self.assertTrue(update['timeout'])
+            self.assertEqual(node.timeout, self.now + 1700)
+
+        # Nothing due in between
+        evaluated.clear()
+
+        with mock.patch.object(SmartNode, 'checkTimeout', autospec=True, side_effect=counting),\
+             mock.patch('src.smartnodes.time.time', return_value=self.now + 1700):
+            self.nodeList.checkTimeouts({})
+
+        self.assertEqual(evaluated, [])
+
+class UpgradeModeTest(unittest.TestCase):
+
+    def setUp(self):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+
+        self.network = FakeNetwork(300)
+        self.daemon = FakeDaemon(self.network.handlers())
+        self.addCleanup(self.daemon.stop)
+
+        rpc = SmartCashRPC('127.0.0.1', self.daemon.port, 'user', 'password', timeout = 5)
+        self.addCleanup(rpc.close)
+
+        self.nodeList = SmartNodeList(database.NodeDatabase(os.path.join(directory, 'nodes.db')), rpc)
+
+    ######
+    # Give the nodes random states and uptimes, the collaterals of the
+    # first ~160 nodes are old enough with the low block height. Each
+    # seed is a new block to get a full refresh.
+    ######
+    def randomize(self, seed):
+
+        generator = random.Random(seed)
+
+        self.network.blocks = 400 + seed
+
+        for key, line in self.network.nodes.items():
+
+            fields = line.split()
+            fields[0] = 'EXPIRED' if generator.random() < 0.1 else 'ENABLED'
+            fields[1] = '90024' if generator.random() < 0.1 else '90025'
+            fields[4] = str(generator.randint(0, 60000))
+            self.network.nodes[key] = " ".join(fields)
+
+    def testExactDuration(self):
+
+        for seed in range(5):
+
+            self.randomize(seed)
+            self.assertTrue(self.nodeList.updateList())
+
+            snapshot = self.nodeList.snapshot
+            self.assertTrue(snapshot.upgradeMode())
+
+            enabled = snapshot.enabledWithMinProtocol
+            minimumUptime = snapshot.minimumUptime
+            required = math.ceil(enabled / 3)
+
+            qualifying = [node.activeSeconds for node in snapshot.nodes.values()
+                          if node.status == 'ENABLED' and node.protocol >= snapshot.protocolRequirement and
+                             snapshot.lastBlock - node.collateral.block >= enabled]
+
+            duration = snapshot.remainingUpgradeModeDuration
+
+            self.assertEqual(duration, max(minimumUptime - sorted(qualifying, reverse=True)[required - 1], 0))
+
+            # Enough nodes reach the minimum uptime after the duration, not a second earlier
+            self.assertGreaterEqual(len([x for x in qualifying if x + duration >= minimumUptime]), required)
+            self.assertLess(len([x for x in qualifying if x + duration - 1 >= minimumUptime]), required)
+
+    def testNotEnoughQualifyingNodes(self):
+
+        self.randomize(0)
+
+        # Only young collaterals
+        self.network.blocks = 200
+
+        self.assertTrue(self.nodeList.updateList())
+
+        self.assertTrue(self.nodeList.snapshot.upgradeMode())
+        self.assertIsNone(self.nodeList.snapshot.remainingUpgradeModeDuration)
+
+######
+# Order of the last paid vector like the LastPaid objects of v1.1 sorted
+# it: by the last paid block, then with a memcmp over the hash bytes from
+# the end and the index.
+######
+def legacyCompare(a, b):
+
+    if a[0] != b[0]:
+        return -1 if a[0] < b[0] else 1
+
+    first, second = bytes.fromhex(a[1].hash), bytes.fromhex(b[1].hash)
+    count = len(first)
+
+    while count > 0:
+        count -= 1
+
+        if first[count] != second[count]:
+            return -1 if first[count] < second[count] else 1
+
+    return (a[1].index > b[1].index) - (a[1].index < b[1].index)
+
+class PayoutQueueTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.random = random.Random(4711)
+
+        hashes = ['{:064x}'.format(self.random.getrandbits(256)) for i in range(150)]
+        # Hashes which only differ in the first or the last byte
+        hashes += ['{:02x}'.format(i) + '00' * 31 for i in range(0, 256, 51)]
+        hashes += ['00' * 31 + '{:02x}'.format(i) for i in range(0, 256, 51)]
+
+        # Some collaterals share their hash
+        self.collaterals = [Transaction(h, self.random.choice([0, 0, 1, 2]), -1) for h in hashes]
+        self.collaterals += [Transaction(h, 5, -1) for h in hashes[:20]]
+
+        self.queue = PayoutQueue()
+        self.paid = {}
+
+    def update(self, collateral, lastPaidBlock):
+        self.paid[collateral] = lastPaidBlock
+        self.queue.update(collateral, lastPaidBlock)
+
+    def remove(self, collateral):
+        self.paid.pop(collateral, None)
+        self.queue.remove(collateral)
+
+    def assertLegacyOrder(self):
+
+        expected = sorted(((b, c) for c, b in self.paid.items()), key=functools.cmp_to_key(legacyCompare))
+
+        self.assertEqual(len(self.queue), len(expected))
+
+        for position, (lastPaidBlock, collateral) in enumerate(expected, 1):
+            self.assertEqual(self.queue.position(collateral), position)
+
+    def testOrder(self):
+
+        for collateral in self.random.sample(self.collaterals, len(self.collaterals)):
+            # Few distinct blocks for many ties
+            self.update(collateral, self.random.randint(0, 10))
+
+        self.assertLegacyOrder()
+
+    def testIncrementalUpdates(self):
+
+        for collateral in self.collaterals:
+            self.update(collateral, self.random.randint(0, 10))
+
+        for cycle in range(20):
+
+            for collateral in self.random.sample(self.collaterals, 15):
+
+                if self.random.random() < 0.3:
+                    self.remove(collateral)
+                else:
+                    self.update(collateral, self.random.randint(0, 12))
+
+            self.assertLegacyOrder()
+
+        missing = next(c for c in self.collaterals if c not in self.paid)
+
+        self.assertNotIn(missing, self.queue)
+        self.assertIsNone(self.queue.position(missing))
+        self.assertFalse(self.queue.remove(missing))
+
+    def testUnchangedBlockDoesntMove(self):
+
+        collateral = self.collaterals[0]
+
+        self.assertTrue(self.queue.update(collateral, 5))
+        self.assertFalse(self.queue.update(collateral, 5))
+        self.assertTrue(self.queue.update(collateral, 6))
+        self.assertEqual(len(self.queue), 1)
+
+class CollateralResolverTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.collaterals = [Transaction('{:064x}'.format(i + 1), 0, -1) for i in range(3)]
+        # Block hash of the collaterals which are in the chain
+        self.blockHashes = {}
+        self.calls = []
+
+        self.resolver = CollateralResolver(self.batchRequest, minRetry = 30, maxRetry = 100)
+
+    def batchRequest(self, calls):
+
+        self.calls.append(calls)
+        results = []
+
+        for call in calls:
+
+            if call[0] == 'getrawtransaction':
+
+                if call[1] in self.blockHashes:
+                    results.append({'blockhash': self.blockHashes[call[1]]})
+                else:
+                    results.append(RPCError("No information available about transaction", -5))
+
+            else:
+                results.append({'height': int(call[1], 16)})
+
+        return results
+
+    def resolve(self, now):
+
+        with mock.patch('src.smartnodes.time.time', return_value=now):
+            return self.resolver.resolve(self.collaterals)
+
+    def testBatchesAndCaches(self):
+
+        for collateral in self.collaterals:
+            self.blockHashes[collateral.hash] = '3e8'
+
+        self.assertEqual(self.resolve(1000), 3)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual([x[0] for x in self.calls[0]], ['getrawtransaction'] * 3)
+
+        # The collaterals share a block, it gets requested once
+        self.assertEqual(len(self.calls[1]), 1)
+
+        for collateral in self.collaterals:
+            self.assertEqual(self.resolver.height(collateral), 1000)
+
+        self.assertEqual(self.resolve(1001), 0)
+        self.assertEqual(len(self.calls), 2)
+
+    def testBackoff(self):
+
+        missing = self.collaterals[0]
+
+        for collateral in self.collaterals[1:]:
+            self.blockHashes[collateral.hash] = 'abc'
+
+        self.assertEqual(self.resolve(1000), 2)
+        self.assertEqual(self.resolver.height(missing), -1)
+
+        # Not due before the retry delay passed
+        for now, delay in ((1000, 30), (1030, 60), (1090, 100), (1190, 100)):
+
+            self.assertFalse(self.resolver.due(missing, now + delay - 1))
+            self.assertTrue(self.resolver.due(missing, now + delay))
+
+            calls = len(self.calls)
+
+            self.assertEqual(self.resolve(now + delay - 1), 0)
+            self.assertEqual(len(self.calls), calls)
+
+            self.assertEqual(self.resolve(now + delay), 0)
+            self.assertEqual(self.calls[-1], [('getrawtransaction', missing.hash, 1)])
+
+        # Resolved at the next attempt, no retries anymore
+        self.blockHashes[missing.hash] = 'def'
+
+        self.assertEqual(self.resolve(1390), 1)
+        self.assertEqual(self.resolver.height(missing), 0xdef)
+        self.assertNotIn(missing, self.resolver.retries)
+        self.assertFalse(self.resolver.due(missing, 1390))
+
+    def testFailedBatch(self):
+
+        def failing(calls):
+            raise RPCError("Connection refused", transport = True)
+
+        self.resolver.batchRequest = failing
+
+        self.assertEqual(self.resolve(1000), 0)
+
+        for collateral in self.collaterals:
+            self.assertFalse(self.resolver.due(collateral, 1029))
+            self.assertTrue(self.resolver.due(collateral, 1030))
+
+if __name__ == '__main__':
+    unittest.main()
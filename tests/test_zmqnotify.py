@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from src import database
+from src.rpc import SmartCashRPC
+from src.smartnodes import SmartNodeList
+from src.zmqnotify import BlockNotifier, zmq
+from tests.daemon import FakeDaemon, FakeNetwork
+
+######
+# Poll :condition until it is true or :timeout passed.
+######
+def waitFor(condition, timeout = 5):
+
+    deadline = time.monotonic() + timeout
+
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    return condition()
+
+@unittest.skipIf(zmq == None, "pyzmq is not installed")
+class BlockNotifierTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.context = zmq.Context.instance()
+        # XPUB to see when the subscription arrived
+        self.publisher = self.context.socket(zmq.XPUB)
+        port = self.publisher.bind_to_random_port('tcp://127.0.0.1')
+        self.address = 'tcp://127.0.0.1:{}'.format(port)
+        self.sequence = 0
+        self.notifier = None
+
+    def tearDown(self):
+
+        if self.notifier:
+            self.notifier.stop()
+
+        self.publisher.close()
+
+    def subscribe(self, callback):
+
+        self.notifier = BlockNotifier(self.address, callback)
+        self.notifier.start()
+
+        self.assertTrue(self.publisher.poll(5000))
+        self.assertEqual(self.publisher.recv(), b'\x01hashblock')
+
+    def publish(self, blockHash):
+
+        self.publisher.send_multipart([b'hashblock', blockHash, self.sequence.to_bytes(4, 'little')])
+        self.sequence += 1
+
+    def testCallback(self):
+
+        hashes = []
+
+        self.subscribe(hashes.append)
+
+        self.publish(bytes.fromhex('00' * 31 + 'ab'))
+        self.publish(bytes.fromhex('00' * 31 + 'cd'))
+
+        self.assertTrue(waitFor(lambda: len(hashes) == 2))
+        self.assertEqual(hashes, ['00' * 31 + 'ab', '00' * 31 + 'cd'])
+
+    def testHashblockTriggersOneRefresh(self):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+
+        network = FakeNetwork(200)
+        daemon = FakeDaemon(network.handlers())
+        self.addCleanup(daemon.stop)
+
+        rpc = SmartCashRPC('127.0.0.1', daemon.port, 'user', 'password', timeout = 5)
+        self.addCleanup(rpc.close)
+
+        nodeList = SmartNodeList(database.NodeDatabase(os.path.join(directory, 'nodes.db')), rpc)
+
+        cycles = {'refresh': 0, 'probe': 0}
+        refreshList = nodeList.refreshList
+        probeList = nodeList.probeList
+
+        def refresh():
+            cycles['refresh'] += 1
+            return refreshList()
+
+        def probe():
+            cycles['probe'] += 1
+            return probeList()
+
+        nodeList.refreshList = refresh
+        nodeList.probeList = probe
+
+        # Initial refresh, then no scheduled cycle during the test
+        self.assertTrue(nodeList.updateList())
+        self.assertEqual(cycles['refresh'], 1)
+
+        nodeList.start(delay = 600)
+        self.addCleanup(nodeList.stop)
+
+        self.subscribe(nodeList.trigger)
+
+        network.blocks += 1
+        self.publish(bytes.fromhex('11' * 32))
+
+        self.assertTrue(waitFor(lambda: cycles['refresh'] == 2))
+        self.assertTrue(waitFor(lambda: nodeList.lastBlock == network.blocks))
+
+        # Nothing else follows the notification
+        time.sleep(0.5)
+
+        self.assertEqual(cycles, {'refresh': 2, 'probe': 0})
+        self.assertEqual(daemon.count('smartnodelist'), 2)
+
+if __name__ == '__main__':
+    unittest.main()